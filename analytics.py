@@ -0,0 +1,346 @@
+"""
+Streaming analytics over game event logs.
+
+Games write one JSON line per action to an event log: the session, the
+turn, the room it was taken in, the action and the engine's events.
+
+    python main.py --events events.ndjson
+    python server.py --events events.ndjson
+
+    {"time":1760659200.123,"session":"9f1c...","turn":7,"room":"kitchen",
+     "action":"move","arg":"north","events":[["door_locked","pantry","silver_key"]],
+     "marks":[["blocked","pantry"]]}
+
+"marks" flag what happened to that player for the first time: a room
+visited, being turned back by a locked door and then, for that door,
+holding its key, unlocking it and walking through, and a full bag. The
+game already knows the player's history, so it marks these when they
+happen. Counting sessions then needs no state that spans lines, and any
+part of a log can be counted on its own. Lines are queued during the turn
+and written in batches by the EventLog's background thread (see
+eventbus.py).
+
+The aggregator reads logs as a stream of lines with a generator, so its
+memory does not grow with the size of the logs. Plain files are split
+into byte ranges that worker processes count in parallel, and the
+partial counts are merged as shards finish. A partial can also be saved
+as JSON and merged later, e.g. one per machine:
+
+    python analytics.py events.ndjson --workers 8
+    python analytics.py day1/*.ndjson --save-partial day1.json
+    python analytics.py --merge day1.json day2.json
+
+The report has a heatmap of room visits, a funnel per locked door, and
+how often players tried to pick something up with a full bag.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from eventbus import NdjsonFileSink
+
+
+FUNNEL = ("blocked", "key", "unlocked", "through")
+FUNNEL_LABELS = {
+    "blocked": "turned back by the locked door",
+    "key": "then held its key",
+    "unlocked": "then unlocked it",
+    "through": "then walked through",
+}
+SHARD_SIZE = 64 * 1024 * 1024
+READ_BUFFER = 1024 * 1024
+
+# Decodes one JSON value at an offset, without the encoding detection and whitespace checks of json.loads,
+# which cost as much again per line. It raises StopIteration for a line that is not JSON.
+_scan_json = json.JSONDecoder().scan_once
+
+
+class EventLog(NdjsonFileSink):
+    """An append-only NDJSON file that game sessions queue their actions for."""
+
+    def session(self, world):
+        """Return the writer for a new session in a world."""
+        return SessionEvents(self, world, uuid.uuid4().hex)
+
+
+class SessionEvents:
+    """Writes one session's actions to an EventLog, marking what happens for the first time."""
+
+    __slots__ = ("log", "world", "session", "turn", "visited", "stages", "bag_full")
+
+    def __init__(self, log, world, session):
+        self.log = log
+        self.world = world
+        self.session = session
+        self.turn = 0
+        self.visited = set()
+        self.stages = {}  # Door -> funnel stages reached, after the first
+        self.bag_full = False
+
+    def as_dict(self):
+        """Return what the session has counted and marked so far, as JSON-ready data."""
+        return {"session": self.session, "turn": self.turn, "visited": sorted(self.visited),
+                "stages": {door: sorted(reached) for door, reached in self.stages.items()},
+                "bag_full": self.bag_full}
+
+    @classmethod
+    def from_dict(cls, log, world, data):
+        """Pick a session up again from as_dict() output, so nothing is marked twice."""
+        events = cls(log, world, data["session"])
+        events.turn = data["turn"]
+        events.visited = set(data["visited"])
+        events.stages = {door: set(reached) for door, reached in data["stages"].items()}
+        events.bag_full = data["bag_full"]
+        return events
+
+    def emit(self, previous, action, state, events):
+        """Write one action: the state it was taken in, the state it led to and its events."""
+        self.turn += 1
+        marks = []
+        visited = self.visited
+        for room_id in (previous.room, state.room):
+            if room_id not in visited:
+                visited.add(room_id)
+                marks.append(("visited", room_id))
+        stages = self.stages
+        for event in events:
+            if event.kind == "door_locked" and event.subject not in stages:
+                stages[event.subject] = set()
+                marks.append(("blocked", event.subject))
+            elif event.kind == "bag_full" and not self.bag_full:
+                self.bag_full = True
+                marks.append(("bag_full", None))
+        for door, reached in stages.items():
+            if len(reached) < len(FUNNEL) - 1:
+                self._advance(door, reached, state, marks)
+        record = {
+            "time": round(time.time(), 3),
+            "session": self.session,
+            "turn": self.turn,
+            "room": previous.room,
+            "action": action.kind,
+            "arg": action.arg,
+            "events": events,
+        }
+        if marks:
+            record["marks"] = marks
+        self.log.put(record)
+
+    def _advance(self, door, reached, state, marks):
+        # Each later stage is marked the first time it holds after the player was turned back
+        for stage, holds in (("key", self.world.doors[door] in state.bag),
+                             ("unlocked", door in state.doors),
+                             ("through", state.room == door)):
+            if holds and stage not in reached:
+                reached.add(stage)
+                marks.append((stage, door))
+
+
+class Aggregate:
+    """Counts over any number of event lines; partial counts merge with merge()."""
+
+    def __init__(self):
+        self.lines = 0
+        self.malformed = 0
+        self.sessions = 0
+        self.escapes = 0
+        self.actions = Counter()
+        self.room_entries = Counter()  # Room -> times it was walked into
+        self.room_visitors = Counter()  # Room -> sessions that were ever in it
+        self.door_attempts = Counter()  # Door -> times a locked door turned someone back
+        self.funnels = {}  # Door -> Counter of sessions per funnel stage
+        self.bag_full = 0
+        self.bag_full_sessions = 0
+        self.bag_full_items = Counter()  # Item -> pick-ups refused because the bag was full
+
+    def add(self, record):
+        """Count one decoded event line."""
+        action, turn, events = record["action"], record["turn"], record["events"]
+        self.lines += 1
+        self.actions[action] += 1
+        if turn == 1:
+            self.sessions += 1
+        for kind, subject, detail in events:
+            if kind == "moved":
+                self.room_entries[detail] += 1
+            elif kind == "door_locked":
+                self.door_attempts[subject] += 1
+            elif kind == "bag_full":
+                self.bag_full += 1
+                self.bag_full_items[subject] += 1
+            elif kind == "escaped":
+                self.escapes += 1
+        for mark, subject in record.get("marks", ()):
+            if mark == "visited":
+                self.room_visitors[subject] += 1
+            elif mark == "bag_full":
+                self.bag_full_sessions += 1
+            else:
+                funnel = self.funnels.get(subject)
+                if funnel is None:
+                    funnel = self.funnels[subject] = Counter()
+                funnel[mark] += 1
+
+    def add_lines(self, lines):
+        """Count every line from an iterable of raw lines; lines that do not parse are counted as malformed."""
+        add = self.add
+        scan = _scan_json
+        for line in lines:
+            try:
+                add(scan(line.decode(), 0)[0])
+            except (StopIteration, ValueError, KeyError, TypeError):
+                self.malformed += 1
+        return self
+
+    def merge(self, other):
+        """Fold another Aggregate into this one."""
+        for attr in ("lines", "malformed", "sessions", "escapes", "bag_full", "bag_full_sessions"):
+            setattr(self, attr, getattr(self, attr) + getattr(other, attr))
+        for attr in ("actions", "room_entries", "room_visitors", "door_attempts", "bag_full_items"):
+            getattr(self, attr).update(getattr(other, attr))
+        for door, funnel in other.funnels.items():
+            self.funnels.setdefault(door, Counter()).update(funnel)
+        return self
+
+    def as_dict(self):
+        """Return the counts as a JSON-serializable dict."""
+        data = dict(vars(self))
+        data["funnels"] = {door: dict(funnel) for door, funnel in self.funnels.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild an Aggregate saved with as_dict()."""
+        aggregate = cls()
+        for attr, value in data.items():
+            if attr == "funnels":
+                value = {door: Counter(funnel) for door, funnel in value.items()}
+            elif isinstance(value, dict):
+                value = Counter(value)
+            setattr(aggregate, attr, value)
+        return aggregate
+
+    def report(self, top=15):
+        """Return the heatmap, door funnels and bag-full counts as text."""
+        lines = [f"{self.lines:,} actions in {self.sessions:,} sessions, {self.escapes:,} escapes"
+                 + (f", {self.malformed:,} malformed lines skipped" if self.malformed else "")]
+        lines.append("\nRoom visits (sessions that entered / times entered)")
+        most = max(self.room_visitors.values(), default=0)
+        for room_id, visitors in self.room_visitors.most_common(top):
+            bar = "#" * round(30 * visitors / most) if most else ""
+            lines.append(f"  {room_id:<20} {visitors:>10,} {self.room_entries[room_id]:>12,}  {bar}")
+        if len(self.room_visitors) > top:
+            lines.append(f"  ... and {len(self.room_visitors) - top:,} more rooms")
+        for door in sorted(set(self.funnels) | set(self.door_attempts)):
+            funnel = self.funnels.get(door, Counter())
+            blocked = funnel["blocked"]
+            lines.append(f"\nLocked door: {door} ({self.door_attempts[door]:,} attempts)")
+            for stage in FUNNEL:
+                share = f"{funnel[stage] / blocked:>7.1%}" if blocked else ""
+                lines.append(f"  {FUNNEL_LABELS[stage]:<32} {funnel[stage]:>10,} {share}")
+            lines.append(f"  {'stuck, never got through':<32} {blocked - funnel['through']:>10,}")
+        lines.append(f"\nBag full: {self.bag_full:,} refused pick-ups in {self.bag_full_sessions:,} sessions")
+        for item_id, count in self.bag_full_items.most_common(5):
+            lines.append(f"  {item_id:<20} {count:>10,}")
+        return "\n".join(lines)
+
+
+def read_lines(path, start=0, end=None):
+    """Yield the raw lines of a log that start within [start, end) bytes, reading one buffer at a time."""
+    log = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb", buffering=READ_BUFFER)
+    with log:
+        position = start
+        if start:
+            # A line that began before the shard belongs to the shard before it
+            log.seek(start - 1)
+            position += len(log.readline()) - 1
+        for line in log:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def shards(paths, shard_size=SHARD_SIZE):
+    """Split logs into (path, start, end) byte ranges; compressed logs are one shard each."""
+    for path in paths:
+        if path.endswith(".gz"):
+            yield path, 0, None
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), shard_size):
+            yield path, start, min(start + shard_size, size)
+
+
+def aggregate_shard(path, start=0, end=None):
+    """Count one byte range of a log and return its Aggregate."""
+    return Aggregate().add_lines(read_lines(path, start, end))
+
+
+def aggregate_iter(paths, workers=None, shard_size=SHARD_SIZE):
+    """Count logs across a process pool, yielding (running totals, bytes done) as each shard finishes."""
+    totals = Aggregate()
+    done = 0
+    pieces = list(shards(paths, shard_size))
+    if workers == 1:
+        for path, start, end in pieces:
+            totals.merge(aggregate_shard(path, start, end))
+            done += (os.path.getsize(path) if end is None else end) - start
+            yield totals, done
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(aggregate_shard, path, start, end): (path, start, end) for path, start, end in pieces}
+        for future in as_completed(futures):
+            path, start, end = futures[future]
+            totals.merge(future.result())
+            done += (os.path.getsize(path) if end is None else end) - start
+            yield totals, done
+
+
+def aggregate(paths, workers=None, shard_size=SHARD_SIZE):
+    """Count logs across a process pool and return the merged Aggregate."""
+    totals = Aggregate()
+    for totals, _ in aggregate_iter(paths, workers, shard_size):
+        pass
+    return totals
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Report room heatmaps, door funnels and bag-full counts from event logs.")
+    parser.add_argument("logs", nargs="*", help="event logs (.ndjson, or .gz)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-mb", type=int, default=SHARD_SIZE // (1024 * 1024), help="size of the byte ranges logs are split into")
+    parser.add_argument("--merge", nargs="+", default=[], metavar="FILE", help="partial aggregates saved with --save-partial to add in")
+    parser.add_argument("--save-partial", metavar="FILE", help="save the counts as JSON for a later --merge")
+    parser.add_argument("--top", type=int, default=15, help="rooms to show in the heatmap")
+    args = parser.parse_args()
+    if not args.logs and not args.merge:
+        parser.error("give event logs to count or partial aggregates to --merge")
+
+    start = time.perf_counter()
+    totals = Aggregate()
+    total_bytes = sum(os.path.getsize(path) for path in args.logs)
+    for totals, done in aggregate_iter(args.logs, args.workers, args.shard_mb * 1024 * 1024):
+        print(f"\r{done / 1e6:,.0f}/{total_bytes / 1e6:,.0f} MB, {totals.lines:,} actions", end="", flush=True)
+    if args.logs:
+        elapsed = time.perf_counter() - start
+        print(f"\rCounted {total_bytes / 1e6:,.0f} MB, {totals.lines:,} actions in {elapsed:.1f} s "
+              f"({total_bytes / 1e6 / elapsed:,.0f} MB/s)")
+    for path in args.merge:
+        with open(path, encoding="utf-8") as partial:
+            totals.merge(Aggregate.from_dict(json.load(partial)))
+    if args.save_partial:
+        with open(args.save_partial, "w", encoding="utf-8") as partial:
+            json.dump(totals.as_dict(), partial)
+    print(totals.report(args.top))
+
+
+if __name__ == "__main__":
+    main()
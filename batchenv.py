@@ -0,0 +1,214 @@
+"""
+Vectorized batch environment for stepping many mansions in lockstep.
+
+All per-game state lives in NumPy arrays (current room, door bits, item
+locations, Odette and escape flags), and one call to step() applies a
+whole vector of actions at once. The room graph from setup_game() is
+compiled into an adjacency array and the item rules (see rules.py) into
+door-toggle bitmasks and a mask of uses that use the item up, so no
+per-game Python objects are touched while stepping. Worlds whose rules
+have conditions that could decide what a use does are rejected.
+
+Requires NumPy.
+"""
+
+import numpy as np
+
+from engine import Action, MOVE, PICKUP, USE, DROP
+
+
+IN_BAG = -1
+
+
+class BatchEnv:
+    """Steps num_envs copies of one world with a vector of integer actions.
+
+    Action ids are laid out as: one per direction (move), then one per
+    item for pickup, use and drop in that order. Actions that are not
+    possible in a game's current state leave that game unchanged.
+    """
+
+    def __init__(self, world, num_envs):
+        if len(world.doors) > 63:
+            raise ValueError("BatchEnv supports at most 63 lockable doors")
+        self.world = world
+        self.num_envs = num_envs
+
+        self.room_ids = world.room_ids
+        self.item_ids = tuple(world.items)
+        self.directions = tuple(dict.fromkeys(
+            direction for room_id in world.room_ids for direction in world.rooms[room_id].connections
+        ))
+        room_index = world.room_index
+        item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        door_index = {door: i for i, door in enumerate(world.doors)}
+        direction_index = {direction: i for i, direction in enumerate(self.directions)}
+
+        rooms, items, directions = len(self.room_ids), len(self.item_ids), len(self.directions)
+
+        # next_room[room, direction] -> destination room index or -1
+        self.next_room = np.full((rooms, directions), -1, dtype=np.int32)
+        for room_id, room in world.rooms.items():
+            for direction, to_room in room.connections.items():
+                self.next_room[room_index[room_id], direction_index[direction]] = room_index[to_room]
+
+        # door_bit[room] -> bit that must be set to enter the room, 0 if always open
+        self.door_bit = np.zeros(rooms, dtype=np.int64)
+        for door, i in door_index.items():
+            self.door_bit[room_index[door]] = 1 << i
+
+        # toggle_mask[room, item] -> door bits flipped by using the item in the room,
+        # consume_mask[room, item] -> whether that use uses the item up
+        self.toggle_mask = np.zeros((rooms, items), dtype=np.int64)
+        self.consume_mask = np.zeros((rooms, items), dtype=bool)
+        rule_rooms = {}  # Item id -> rooms it has rules for, None meaning anywhere
+        for rule in world.rules.rules:
+            rule_rooms.setdefault(rule.item, set()).add(rule.room)
+        for item_id, named in rule_rooms.items():
+            item = item_index[item_id]
+            # Rules for anywhere apply in every room, unless the room has rules of its own, which come first
+            door, consume = self._effect(world.rules.candidates(item_id, None))
+            self.toggle_mask[:, item] = 0 if door is None else 1 << door_index[door]
+            self.consume_mask[:, item] = consume
+            for room_id in named - {None}:
+                door, consume = self._effect(world.rules.candidates(item_id, room_id))
+                self.toggle_mask[room_index[room_id], item] = 0 if door is None else 1 << door_index[door]
+                self.consume_mask[room_index[room_id], item] = consume
+
+        self.initial_item_location = np.full(items, rooms, dtype=np.int32)  # rooms == nowhere
+        for room_id, room_items in zip(world.room_ids, world.initial_room_items):
+            for item_id in room_items:
+                self.initial_item_location[item_index[item_id]] = room_index[room_id]
+        self.initial_doors = sum(1 << door_index[door] for door in world.unlocked_doors)
+
+        self.start_room = room_index[world.start_room]
+        self.odette_room = room_index[world.odette_room]
+        self.exit_room = room_index[world.exit_room]
+        self.exit_bit = int(self.door_bit[self.exit_room])
+        self.bag_capacity = world.bag_capacity
+
+        self.pickup_base = directions
+        self.use_base = directions + items
+        self.drop_base = directions + 2 * items
+        self.num_actions = directions + 3 * items
+
+        self.room = np.empty(num_envs, dtype=np.int32)
+        self.doors = np.empty(num_envs, dtype=np.int64)
+        self.item_location = np.empty((num_envs, items), dtype=np.int32)
+        self.spoken_to_odette = np.empty(num_envs, dtype=bool)
+        self.escaped = np.empty(num_envs, dtype=bool)
+        self.turns = np.empty(num_envs, dtype=np.int32)
+        self.reset()
+
+    @staticmethod
+    def _effect(rules):
+        """Return (door toggled, item used up) for a use whose rules, in order of precedence, are given.
+
+        Raises ValueError when the rules' conditions could change either.
+        """
+        effects = set()
+        for rule in rules:
+            effects.add((rule.toggle_door, rule.consume))
+            if not rule.when:
+                break
+        else:
+            effects.add((None, False))  # No rule may fire
+        if len(effects) > 1:
+            raise ValueError(f"BatchEnv cannot step the rules for using {rules[0].item!r}, "
+                             "since their conditions decide which door it toggles or whether it is used up")
+        return effects.pop()
+
+    def reset(self, mask=None):
+        """Reset every game, or only the games selected by a boolean mask."""
+        selected = slice(None) if mask is None else np.array(mask, dtype=bool)  # A copy, as the mask may be self.escaped
+        self.room[selected] = self.start_room
+        self.doors[selected] = self.initial_doors
+        self.item_location[selected] = self.initial_item_location
+        self.spoken_to_odette[selected] = self.start_room == self.odette_room
+        self.escaped[selected] = False
+        self.turns[selected] = 0
+
+    def action_id(self, action):
+        """Translate an engine Action into this environment's integer action id."""
+        if action.kind == MOVE:
+            return self.directions.index(action.arg)
+        base = {PICKUP: self.pickup_base, USE: self.use_base, DROP: self.drop_base}[action.kind]
+        return base + self.item_ids.index(action.arg)
+
+    def action(self, action_id):
+        """Translate an integer action id back into an engine Action."""
+        items = len(self.item_ids)
+        if action_id < self.pickup_base:
+            return Action(MOVE, self.directions[action_id])
+        kind, offset = [(PICKUP, self.pickup_base), (USE, self.use_base), (DROP, self.drop_base)][
+            (action_id - self.pickup_base) // items]
+        return Action(kind, self.item_ids[action_id - offset])
+
+    def bag_counts(self):
+        """Return the number of items in each game's bag."""
+        return (self.item_location == IN_BAG).sum(axis=1)
+
+    def legal_mask(self):
+        """Return a (num_envs, num_actions) bool array of actions that change something."""
+        mask = np.zeros((self.num_envs, self.num_actions), dtype=bool)
+        destinations = self.next_room[self.room]
+        bits = self.door_bit[np.maximum(destinations, 0)]
+        mask[:, :self.pickup_base] = (destinations >= 0) & ((bits == 0) | (self.doors[:, None] & bits != 0))
+
+        in_bag = self.item_location == IN_BAG
+        here = self.item_location == self.room[:, None]
+        has_room = self.bag_counts() < self.bag_capacity
+        mask[:, self.pickup_base:self.use_base] = here & has_room[:, None]
+        mask[:, self.use_base:self.drop_base] = in_bag & ((self.toggle_mask[self.room] != 0) |
+                                                           self.consume_mask[self.room])
+        mask[:, self.drop_base:] = in_bag
+        mask[self.escaped] = False
+        return mask
+
+    def step(self, actions):
+        """Apply one action per game; return (rewards, escaped_this_step, bag_full)."""
+        actions = np.asarray(actions)
+        active = ~self.escaped
+        self.turns[active] += 1
+        escaped_before = self.escaped.copy()
+        bag_full = np.zeros(self.num_envs, dtype=bool)
+
+        games = np.flatnonzero(active & (actions < self.pickup_base))
+        if games.size:
+            destinations = self.next_room[self.room[games], actions[games]]
+            bits = self.door_bit[np.maximum(destinations, 0)]
+            ok = (destinations >= 0) & ((bits == 0) | (self.doors[games] & bits != 0))
+            games, destinations = games[ok], destinations[ok]
+            self.room[games] = destinations
+            self.spoken_to_odette[games] |= destinations == self.odette_room
+            self.escaped[games] = ((destinations == self.exit_room) &
+                                   (self.doors[games] & self.exit_bit != 0) &
+                                   self.spoken_to_odette[games])
+
+        games = np.flatnonzero(active & (actions >= self.pickup_base) & (actions < self.use_base))
+        if games.size:
+            items = actions[games] - self.pickup_base
+            here = self.item_location[games, items] == self.room[games]
+            has_room = self.bag_counts()[games] < self.bag_capacity
+            bag_full[games[here & ~has_room]] = True
+            ok = here & has_room
+            self.item_location[games[ok], items[ok]] = IN_BAG
+
+        games = np.flatnonzero(active & (actions >= self.use_base) & (actions < self.drop_base))
+        if games.size:
+            items = actions[games] - self.use_base
+            ok = self.item_location[games, items] == IN_BAG
+            games, items = games[ok], items[ok]
+            self.doors[games] ^= self.toggle_mask[self.room[games], items]
+            consumed = self.consume_mask[self.room[games], items]
+            self.item_location[games[consumed], items[consumed]] = len(self.room_ids)  # Nowhere
+
+        games = np.flatnonzero(active & (actions >= self.drop_base))
+        if games.size:
+            items = actions[games] - self.drop_base
+            ok = self.item_location[games, items] == IN_BAG
+            games, items = games[ok], items[ok]
+            self.item_location[games, items] = self.room[games]
+
+        escaped_now = self.escaped & ~escaped_before
+        return escaped_now.astype(np.float32), escaped_now, bag_full
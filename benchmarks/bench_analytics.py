@@ -0,0 +1,124 @@
+"""
+Throughput benchmark for the event log aggregator.
+
+Writes an event log of the requested size by playing random games on
+the engine through SessionEvents, counting along the way what the
+aggregator should find. The log is then counted with analytics.py for
+each worker count, each time in a fresh process so its peak memory can
+be reported, and the counts are checked against the expected ones. Small
+shards are used so that many shard boundaries fall inside lines.
+
+Run from the repository root:
+    python -m benchmarks.bench_analytics
+    python -m benchmarks.bench_analytics --megabytes 2000 --workers 1 4 8
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from analytics import Aggregate, EventLog, aggregate
+from engine import stock_engine
+
+
+def write_log(path, megabytes, seed=0, max_turns=200):
+    """Play random games into an event log until it reaches a size; return the expected Aggregate."""
+    engine = stock_engine()
+    rng = random.Random(seed)
+    log = EventLog(path)
+    expected = Aggregate()
+    target = megabytes * 1_000_000
+    try:
+        while log.file.tell() < target:
+            session = log.session(engine.world)
+            state = engine.initial_state()
+            expected.sessions += 1
+            for _ in range(max_turns):
+                action = rng.choice(engine.legal_actions(state))
+                previous = state
+                state, events = engine.step(previous, action)
+                session.emit(previous, action, state, events)
+                expected.lines += 1
+                for event in events:
+                    if event.kind == "door_locked":
+                        expected.door_attempts[event.subject] += 1
+                    elif event.kind == "bag_full":
+                        expected.bag_full += 1
+                expected.escapes += state.escaped
+                if state.escaped:
+                    break
+            log.flush()
+    finally:
+        log.close()
+    return expected
+
+
+def count(path, workers, shard_size):
+    """Count a log in this process and print the figures as JSON."""
+    start = time.perf_counter()
+    totals = aggregate([path], workers, shard_size)
+    elapsed = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({"seconds": elapsed, "peak_kb": peak, "totals": totals.as_dict()}))
+
+
+def mismatches(expected, totals):
+    """List the counts that differ from what was written."""
+    problems = []
+    for attr in ("lines", "sessions", "escapes", "bag_full", "door_attempts"):
+        if getattr(expected, attr) != getattr(totals, attr):
+            problems.append(f"{attr}: expected {getattr(expected, attr)}, counted {getattr(totals, attr)}")
+    if totals.malformed:
+        problems.append(f"{totals.malformed} lines did not parse")
+    return problems
+
+
+def main():
+    """Write a log, count it with each worker count and print the results."""
+    parser = argparse.ArgumentParser(description="Time the event log aggregator.")
+    parser.add_argument("--megabytes", type=int, default=200, help="size of the generated log")
+    parser.add_argument("--workers", type=int, nargs="+", default=(1, 2, 4))
+    parser.add_argument("--shard-mb", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", metavar="LOG", help=argparse.SUPPRESS)  # Used for the child processes
+    args = parser.parse_args()
+
+    shard_size = args.shard_mb * 1024 * 1024
+    if args.count:
+        count(args.count, args.workers[0], shard_size)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.ndjson")
+        start = time.perf_counter()
+        expected = write_log(path, args.megabytes, args.seed)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path) / 1e6
+        print(f"Wrote {size:,.0f} MB, {expected.lines:,} actions in {expected.sessions:,} sessions "
+              f"in {elapsed:.1f} s ({expected.lines / elapsed:,.0f} actions/s)")
+        failed = False
+        for workers in args.workers:
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_analytics", "--count", path,
+                                     "--workers", str(workers), "--shard-mb", str(args.shard_mb)],
+                                    check=True, capture_output=True, text=True).stdout
+            figures = json.loads(output)
+            problems = mismatches(expected, Aggregate.from_dict(figures["totals"]))
+            seconds = figures["seconds"]
+            print(f"{workers:>3} workers  {size / seconds:>8,.0f} MB/s  {expected.lines / seconds:>12,.0f} lines/s  "
+                  f"peak {figures['peak_kb'] / 1024:>6,.0f} MB per process  "
+                  f"{'counts match' if not problems else 'COUNTS DIFFER'}")
+            for problem in problems:
+                print(f"      {problem}")
+            failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Overhead benchmark for the event bus and its sinks.
+
+Plays the escape route through the game's menus, as the suite's
+playthrough.game does, with the game's events going nowhere, to a bus
+nobody listens to, to a bus with subscribers for other kinds, to a
+batched file sink, and to a callback that writes and flushes each event
+as it happens. Reports microseconds per playthrough and the overhead
+over no bus at all.
+
+"queueing only" is a batched sink whose flush waits until timing is
+over, which is what a turn itself pays. The flush thread's encoding and
+writing come on top of that when they share the turn's CPU.
+
+Run from the repository root:
+    python -m benchmarks.bench_bus
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import timeit
+
+from benchmarks.suite import BenchIO, escape_inputs
+from engine import stock_engine
+from eventbus import GAME_EVENTS, EventBus, NdjsonFileSink
+from main import HauntedMansionGame
+from menus import MenuCache
+from replay import run_to_completion
+
+
+def playthrough(engine, menus, inputs, bus):
+    """Return a function that plays the escape route once with a bus."""
+    def play():
+        game = HauntedMansionGame(io=BenchIO(inputs), engine=engine, menus=menus, bus=bus)
+        run_to_completion(game.start_game())
+    return play
+
+
+def main():
+    """Time each setup and print the results."""
+    parser = argparse.ArgumentParser(description="Time the event bus and its sinks.")
+    parser.add_argument("--games", type=int, default=2000, help="playthroughs per timed run")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    engine = stock_engine()
+    menus = MenuCache(engine.world)
+    inputs = escape_inputs(engine.world)
+
+    with tempfile.TemporaryDirectory() as directory:
+        batched = NdjsonFileSink(os.path.join(directory, "batched.ndjson")).start()
+        queued = NdjsonFileSink(os.path.join(directory, "queued.ndjson"))  # Only written once timing is over
+        unbatched = open(os.path.join(directory, "unbatched.ndjson"), "a", encoding="utf-8")
+
+        def write_now(game, event):
+            unbatched.write(batched.encode((time.time(), game.player.name, event)) + "\n")
+            unbatched.flush()
+
+        idle = EventBus()
+        elsewhere = EventBus()
+        elsewhere.subscribe(("no_exit", "bag_full", "missing_item"), lambda game, event: None)
+        to_batched = EventBus()
+        to_batched.subscribe(GAME_EVENTS, batched)
+        to_queue = EventBus()
+        to_queue.subscribe(GAME_EVENTS, queued)
+        to_file = EventBus()
+        to_file.subscribe(GAME_EVENTS, write_now)
+        setups = [
+            ("no bus", None),
+            ("bus, no subscribers", idle),
+            ("bus, other kinds subscribed", elsewhere),
+            ("batched sink, queueing only", to_queue),
+            ("batched file sink", to_batched),
+            ("write and flush per event", to_file),
+        ]
+        timers = [timeit.Timer(playthrough(engine, menus, inputs, bus)) for _, bus in setups]
+        best = [float("inf")] * len(setups)
+        try:
+            # Setups take turns within each repeat, so drift in the machine's speed hits them all alike
+            for _ in range(args.repeat):
+                for number, timer in enumerate(timers):
+                    best[number] = min(best[number], timer.timeit(args.games) / args.games)
+            for (name, _), seconds in zip(setups, best):
+                print(f"{name:<30} {seconds * 1e6:>8.1f} us per playthrough  {seconds / best[0] - 1:>+7.1%}")
+        finally:
+            batched.close()
+            queued.close()
+            unbatched.close()
+        print(f"{batched.written:,} events written by the batched sink")
+
+
+if __name__ == "__main__":
+    main()
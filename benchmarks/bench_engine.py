@@ -0,0 +1,71 @@
+"""
+Throughput benchmark for the headless engine.
+
+Plays the stock mansion without a terminal and reports how many turns per
+second a single process sustains, both for the scripted escape route and
+for a random agent.
+
+Run from the repository root:
+    python -m benchmarks.bench_engine
+"""
+
+import random
+import time
+
+from engine import Action, MOVE, PICKUP, USE, stock_engine
+
+
+# Shortest escape from the entrance hall
+ESCAPE_ROUTE = [
+    Action(MOVE, "north"),
+    Action(PICKUP, "silver_key"),
+    Action(MOVE, "north"),
+    Action(MOVE, "up"),
+    Action(MOVE, "down"),
+    Action(MOVE, "south"),
+    Action(MOVE, "east"),
+    Action(USE, "silver_key"),
+    Action(MOVE, "north"),
+    Action(PICKUP, "golden_key"),
+    Action(MOVE, "south"),
+    Action(MOVE, "west"),
+    Action(MOVE, "south"),
+    Action(USE, "golden_key"),
+    Action(MOVE, "south"),
+]
+
+
+def bench_escape_route(engine, games):
+    """Replay the escape route and return turns per second."""
+    start = time.perf_counter()
+    for _ in range(games):
+        state = engine.initial_state()
+        for action in ESCAPE_ROUTE:
+            state, events = engine.step(state, action)
+        assert state.escaped
+    elapsed = time.perf_counter() - start
+    return games * len(ESCAPE_ROUTE) / elapsed
+
+
+def bench_random_agent(engine, turns, seed=0):
+    """Play random legal actions and return turns per second."""
+    rng = random.Random(seed)
+    state = engine.initial_state()
+    start = time.perf_counter()
+    for _ in range(turns):
+        state, events = engine.step(state, rng.choice(engine.legal_actions(state)))
+        if state.escaped:
+            state = engine.initial_state()
+    elapsed = time.perf_counter() - start
+    return turns / elapsed
+
+
+def main():
+    """Run the engine benchmarks and print the results."""
+    engine = stock_engine()
+    print(f"escape route: {bench_escape_route(engine, 20000):>12,.0f} turns/s")
+    print(f"random agent: {bench_random_agent(engine, 300000):>12,.0f} turns/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Stress benchmarks on generated mansions.
+
+For each size, generates a seeded mansion (see mansiongen.py), writes it
+as a world index, opens it, and then times the game's hot handlers on it:
+moving along random exits, looking around, using the candle from the
+start room, and dropping and picking it up again with every state kept
+for undo. Routes are timed twice: cold, between random visited rooms
+with nothing cached, and cached, the way bots shuttle between a few
+rooms while doors are toggled now and then. Only the rooms
+a session visits are ever decoded, so the per-call figures should stay
+flat as the mansion grows; the generate, write and open times show what
+growth does cost.
+
+Run from the repository root:
+    python -m benchmarks.bench_generated
+    python -m benchmarks.bench_generated --sizes 10000 100000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.suite import BenchIO
+from main import HauntedMansionGame, Player
+from mansiongen import generate
+from replay import run_to_completion
+
+
+SIZES = (10000, 100000, 1000000)
+
+
+def timed(function, *args):
+    """Call function and return (result, seconds taken)."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_moves(game, moves, seed=0):
+    """Walk random exits and return moves per second."""
+    rng = random.Random(seed)
+    connections = game.world_index.connections
+    start = time.perf_counter()
+    for _ in range(moves):
+        run_to_completion(game.move_player(rng.choice(list(connections(game.player.current_room)))))
+    return moves / (time.perf_counter() - start)
+
+
+def bench_look(game, looks):
+    """Look around the current room and return looks per second."""
+    start = time.perf_counter()
+    for _ in range(looks):
+        game.look_around()
+    return looks / (time.perf_counter() - start)
+
+
+def bench_use(game, uses):
+    """Use the candle and return uses per second."""
+    start = time.perf_counter()
+    for _ in range(uses):
+        run_to_completion(game.use_item("Candle"))
+    return uses / (time.perf_counter() - start)
+
+
+def bench_pick_drop(game, pairs):
+    """Drop and pick up the candle, keeping every state for undo; return actions per second."""
+    start = time.perf_counter()
+    for _ in range(pairs):
+        run_to_completion(game.remove_item_from_bag("Candle"))
+        game.pick_up_item("Candle")
+    return 2 * pairs / (time.perf_counter() - start)
+
+
+def bench_cold_routes(game, lookups, seed=0):
+    """Look up routes between random visited rooms with an empty cache; return seconds per lookup."""
+    rng = random.Random(seed)
+    rooms = sorted(game.state.visited)
+    routes = game.routes
+    state = game.state
+    start = time.perf_counter()
+    for _ in range(lookups):
+        routes.clear()
+        routes.route(state._replace(room=rng.choice(rooms)), rng.choice(rooms))
+    return (time.perf_counter() - start) / lookups
+
+
+def bench_routes(game, lookups, seed=0, hubs=8, toggle_every=1000):
+    """Look up routes between a few visited rooms, toggling a door now and then; return lookups per second."""
+    rng = random.Random(seed)
+    rooms = rng.sample(sorted(game.state.visited), hubs)
+    doors = list(game.world.doors)
+    routes = game.routes
+    state = game.state
+    start = time.perf_counter()
+    for number in range(lookups):
+        if number % toggle_every == toggle_every - 1:
+            state = game.engine.toggle_door(state, rng.choice(doors))
+        routes.route(state._replace(room=rng.choice(rooms)), rng.choice(rooms))
+    return lookups / (time.perf_counter() - start)
+
+
+def bench_size(rooms, seed, directory, operations):
+    """Generate, write and open one mansion, then time play on it."""
+    mansion, generated = timed(generate, rooms, seed)
+    path = os.path.join(directory, f"mansion_{rooms}.hmw")
+    size, written = timed(mansion.write, path)
+    del mansion
+    game, opened = timed(lambda: HauntedMansionGame(io=BenchIO(), world_file=path))
+    world = game.world
+    game.player = Player("Bench", world.bag_capacity, world.start_room)
+    game.pick_up_item("Candle")
+    use_rate = bench_use(game, operations)
+    pick_rate = bench_pick_drop(game, operations // 2)
+    move_rate = bench_moves(game, operations, seed)
+    look_rate = bench_look(game, operations)
+    cold_route = bench_cold_routes(game, 100, seed)
+    route_rate = bench_routes(game, operations, seed)
+    print(f"{rooms:>9,} rooms  {size / 1e6:>7.1f} MB  generate {generated:6.2f} s  write {written:5.2f} s  "
+          f"open {opened:5.2f} s")
+    print(f"{'':>16}move {move_rate:>10,.0f}/s  look {look_rate:>10,.0f}/s  use {use_rate:>10,.0f}/s  "
+          f"route {route_rate:>10,.0f}/s  cold route {cold_route * 1000:.1f} ms")
+    print(f"{'':>16}pick up/drop {pick_rate:>10,.0f}/s  undo steps kept {operations:,}")
+    print(f"{'':>16}rooms decoded {len(game.template.rooms.loaded):,}")
+
+
+def main():
+    """Run the generated-mansion benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description="Time play on generated mansions of growing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="room counts to test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--operations", type=int, default=20000, help="calls per timed handler")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rooms in args.sizes:
+            bench_size(rooms, args.seed, directory, args.operations)
+
+
+if __name__ == "__main__":
+    main()
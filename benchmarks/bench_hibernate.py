@@ -0,0 +1,210 @@
+"""
+Memory and throughput benchmark for idle session hibernation.
+
+Logs in the requested number of players, each on a stand-in connection
+that drops output and types the escape route's commands, and plays every
+one of them some way along the route, up to a choice. Most then sit idle
+while a small active set keeps playing: each command comes from the
+active set, except for one in ten, which wakes an idle player who then
+takes the place of an active one. Players who escape log in again.
+
+Every setup runs in a fresh process. Reported are the memory the
+logged-in players hold, per player, as traced by tracemalloc, the growth
+of the process's resident memory, the commands played per second and,
+when hibernating, the hit rate and the bytes stored per hibernated game.
+"plain" is the server without hibernation, where every connection keeps
+its own game. The stand-in connections and their tasks are counted too,
+as a real server has them as well.
+
+Before any setup runs, a game that dropped two items out of world order
+is hibernated and woken, and must wake with the menu it showed, so that
+a number typed after the wake picks the choice listed under it.
+
+Run from the repository root:
+    python -m benchmarks.bench_hibernate
+    python -m benchmarks.bench_hibernate --sessions 2000 20000 --capacity 100 1000
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.suite import BenchIO, escape_inputs, new_game
+from engine import DROP, MOVE, PICKUP, Action, stock_engine
+from hibernate import SessionManager, resident_bytes
+from main import HauntedMansionGame
+from menus import MenuCache
+
+
+class PlayerIO:
+    """Stands in for a player's connection: output is dropped and the benchmark types the lines."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.position = 0
+        self.prompt = None
+        self.waiting = None  # Future the game awaits for the next line, while it waits for one
+
+    def write(self, text=""):
+        pass
+
+    def flush(self, prompt=""):
+        pass
+
+    async def read(self, prompt):
+        self.prompt = prompt
+        self.waiting = asyncio.get_running_loop().create_future()
+        return await self.waiting
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        await self.read(prompt)
+
+    async def delay(self, seconds):
+        pass
+
+    def clear(self):
+        pass
+
+    def answer(self):
+        """Type the player's next line at the prompt they are waiting at."""
+        waiting, self.waiting = self.waiting, None
+        if "Press Enter" in self.prompt:
+            waiting.set_result("")
+        else:
+            waiting.set_result(self.lines[self.position])
+            self.position += 1
+
+
+class Player:
+    """One logged-in player, playing the escape route over and over."""
+
+    def __init__(self, lines, play):
+        self.lines = lines
+        self.play = play  # Coroutine function that plays one game on an IO
+        self.login()
+
+    def login(self):
+        self.io = PlayerIO(self.lines)
+        self.task = asyncio.ensure_future(self.play(self.io))
+
+    async def command(self):
+        """Answer one prompt, or log in again after escaping, and wait until the game asks again or ends."""
+        if self.task.done():
+            self.login()
+        elif self.io.waiting is not None:
+            self.io.answer()
+        while self.io.waiting is None and not self.task.done():
+            await asyncio.sleep(0)
+
+
+def check_woken_menu(engine, menus):
+    """Check that a hibernated game wakes with the numbered menu it last showed."""
+    game = new_game(engine, menus)
+    for action in (Action(PICKUP, "candle"), Action(MOVE, "north"), Action(PICKUP, "silver_key"),
+                   Action(MOVE, "south"), Action(DROP, "candle"), Action(DROP, "silver_key")):
+        game.apply_action(action)
+    game.show_choices()
+    manager = SessionManager(engine, 0, menus=menus)
+    try:
+        woken = manager.thaw(manager.freeze(game), BenchIO())
+    finally:
+        manager.close()
+    if woken.command_list != game.command_list:
+        raise RuntimeError(f"A woken game numbers its choices {woken.command_list}, not {game.command_list}")
+
+
+async def run(sessions, capacity, active, commands, seed):
+    """Log in players, play the workload and return the figures."""
+    engine = stock_engine()
+    menus = MenuCache(engine.world)
+    lines = escape_inputs(engine.world)
+    manager = None
+    if capacity is None:
+        async def play(io):
+            await HauntedMansionGame(io=io, engine=engine, menus=menus).start_game()
+    else:
+        manager = SessionManager(engine, capacity, menus=menus)
+        play = manager.play
+    rng = random.Random(seed)
+
+    gc.collect()
+    before = resident_bytes()
+    tracemalloc.start()
+    players = [Player(lines, play) for _ in range(sessions)]
+    for player in players:
+        for _ in range(rng.randrange(1, 30)):
+            await player.command()
+        while player.io.waiting is None or "choice" not in player.io.prompt:
+            await player.command()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    grown = resident_bytes() - before
+
+    working = rng.sample(range(sessions), active)
+    if manager is not None:
+        manager.hits = manager.misses = 0
+    start = time.perf_counter()
+    for _ in range(commands):
+        if rng.random() < 0.1:
+            number = rng.randrange(sessions)
+            working[rng.randrange(active)] = number
+        else:
+            number = rng.choice(working)
+        await players[number].command()
+    elapsed = time.perf_counter() - start
+
+    figures = {"held_per_session": held / sessions, "resident_growth": grown, "commands_per_second": commands / elapsed}
+    if manager is not None:
+        stats = manager.stats()
+        figures.update(hit_rate=stats["hit_rate"], hot=stats["hot"], cold=stats["cold"],
+                       stored_per_cold=stats["stored_bytes_per_cold_session"])
+    for player in players:
+        player.task.cancel()
+    await asyncio.gather(*(player.task for player in players), return_exceptions=True)
+    if manager is not None:
+        manager.close()
+    return figures
+
+
+def main():
+    """Run every setup in its own process and print the results."""
+    parser = argparse.ArgumentParser(description="Time and size idle session hibernation.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=(2000, 10000), help="players logged in")
+    parser.add_argument("--capacity", type=int, nargs="+", default=(100, 1000), help="games kept in memory")
+    parser.add_argument("--active", type=int, default=200, help="players playing at any one time")
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--setup", nargs=2, metavar=("SESSIONS", "CAPACITY"), help=argparse.SUPPRESS)  # Child runs
+    args = parser.parse_args()
+
+    if args.setup:
+        sessions, capacity = int(args.setup[0]), None if args.setup[1] == "plain" else int(args.setup[1])
+        print(json.dumps(asyncio.run(run(sessions, capacity, min(args.active, sessions), args.commands, args.seed))))
+        return
+
+    engine = stock_engine()
+    check_woken_menu(engine, MenuCache(engine.world))
+    for sessions in args.sessions:
+        for capacity in ("plain", *map(str, args.capacity)):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_hibernate", "--setup", str(sessions),
+                                     capacity, "--active", str(args.active), "--commands", str(args.commands),
+                                     "--seed", str(args.seed)], check=True, capture_output=True, text=True).stdout
+            figures = json.loads(output)
+            line = (f"{sessions:>7,} players  {capacity:>5}  {figures['held_per_session'] / 1024:>5.1f} KB held per player  "
+                    f"resident +{figures['resident_growth'] / 2 ** 20:>5.1f} MB  "
+                    f"{figures['commands_per_second']:>7,.0f} commands/s")
+            if capacity != "plain":
+                line += (f"  {figures['hit_rate']:>6.1%} hits  "
+                         f"{figures['stored_per_cold']:>4.0f} bytes per hibernated game")
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Throughput benchmark for the stateless HTTP/JSON mode.
+
+Starts httpapi.py locally, then runs many concurrent clients. Each one
+plays the escape route over and over: POST /new, then one POST /turn per
+command, always sending back the token from the previous response. Every
+client spreads its requests over two keep-alive connections. With more
+than one server process, consecutive turns of one game therefore land
+on different processes, which only works because no process keeps
+anything between requests.
+
+Before the load starts, a game is played in process that drops two
+items in the hall out of world order; picking one of them up by its menu
+number must pick up that item, since the numbers come back in the next
+request's token rather than from the server.
+
+Reports turns per second, p50/p99 latency and how many games escaped,
+for each server process count:
+    python -m benchmarks.bench_http
+    python -m benchmarks.bench_http --processes 1 2 4 --clients 200 --seconds 5
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.loadgen import percentile, raise_file_limit
+from benchmarks.suite import escape_inputs
+from engine import stock_engine
+from httpapi import StatelessGame
+
+
+SECRET = "bench-secret"
+
+
+class Connection:
+    """One keep-alive HTTP connection speaking JSON."""
+
+    def __init__(self, reader, writer, host):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    async def post(self, path, payload):
+        """Send a JSON POST and return the decoded JSON response."""
+        body = json.dumps(payload).encode()
+        self.writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        response = json.loads(await self.reader.readexactly(length))
+        if status != 200:
+            raise RuntimeError(f"{path} answered {status}: {response.get('error')}")
+        return response
+
+    def close(self):
+        self.writer.close()
+
+
+async def run_client(host, port, script, deadline, latencies, escapes):
+    """Play the escape route repeatedly until the deadline, alternating connections."""
+    connections = [Connection(*await asyncio.open_connection(host, port), host) for _ in range(2)]
+    try:
+        turn = 0
+        while time.perf_counter() < deadline:
+            sent = time.perf_counter()
+            response = await connections[turn % 2].post("/new", {"name": "Bench"})
+            latencies.append(time.perf_counter() - sent)
+            for line in script:
+                turn += 1
+                sent = time.perf_counter()
+                response = await connections[turn % 2].post("/turn", {"token": response["token"], "input": [line]})
+                latencies.append(time.perf_counter() - sent)
+            if response["done"]:
+                escapes.append(1)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def run_load(host, port, clients, seconds, script):
+    """Run the clients for a while and return (sorted latencies, wall time, escapes)."""
+    latencies = []
+    escapes = []
+    began = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, script, began + seconds, latencies, escapes)
+                           for _ in range(clients)))
+    return sorted(latencies), time.perf_counter() - began, len(escapes)
+
+
+def check_numbered_choices(engine):
+    """Check that a menu number picks up the item the previous response listed under it."""
+    game = StatelessGame(engine, SECRET)
+    response = game.new_game("Bench")
+    for line in ["take candle", "go north", "take silver key", "go south", "drop candle", "drop silver key"]:
+        response = game.turn(response["token"], [line])
+    for line in response["text"].splitlines():
+        number, _, choice = line.strip().partition(". Pick up ")
+        if choice:
+            picked = game.turn(response["token"], [number])["text"]
+            if f"You picked up the {choice}." not in picked:
+                raise RuntimeError(f"Choice {number} was listed as picking up the {choice} but played:\n{picked}")
+
+
+async def wait_for_server(host, port, timeout=10.0):
+    """Wait until the server accepts connections."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+        else:
+            writer.close()
+            return
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Measure turns per second through the stateless HTTP API.")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2], help="server process counts to test")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8180)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    check_numbered_choices(stock_engine())
+    script = escape_inputs(stock_engine().world)[1:]  # Without the name, which /new takes
+    for processes in args.processes:
+        server = subprocess.Popen([sys.executable, "httpapi.py", "--host", args.host, "--port", str(args.port),
+                                   "--processes", str(processes), "--secret", SECRET],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_for_server(args.host, args.port))
+            latencies, elapsed, escapes = asyncio.run(run_load(args.host, args.port, args.clients, args.seconds,
+                                                               script))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{processes:>2} process(es), {args.clients} clients: {len(latencies) / elapsed:>8,.0f} turns/s, "
+              f"{escapes} escapes, p50 {percentile(latencies, 0.50) * 1000:.2f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Contention benchmark for the shared mansion.
+
+Hundreds of players start in the same hall of one SharedWorld and play
+random legal moves, so they keep taking the same items from each other
+and toggling the same doors. Each round submits one action per player to
+the Dispatcher and waits for them all, and the rounds are repeated for
+several thread pool sizes.
+
+After each run the mansion is audited for lost updates. Every item must
+be in exactly one place, in a room or in one player's bag. Every door
+must be locked or unlocked according to how many times it was toggled.
+
+Run from the repository root:
+    python -m benchmarks.bench_shared
+    python -m benchmarks.bench_shared --players 800 --workers 1 4 16
+
+On a standard CPython build the GIL lets only one thread run Python code
+at a time, so extra workers add little throughput. On a free-threaded
+build (3.13t and later) actions in different rooms run in parallel.
+"""
+
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+
+from engine import stock_engine
+from main import HauntedMansionGame
+from sharedworld import Dispatcher, SharedWorld
+
+
+def play(engine, players, rounds, workers, seed=0):
+    """Play random rounds on a fresh shared mansion; return (actions per second, audit problems)."""
+    shared = SharedWorld(engine)
+    rng = random.Random(seed)
+    toggles = Counter()
+    actions = 0
+    with Dispatcher(shared, workers) as dispatcher:
+        seats = [dispatcher.join() for _ in range(players)]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            futures = []
+            for seat in seats:
+                choices = engine.legal_actions(seat.state)
+                if choices and not seat.state.escaped:
+                    futures.append(dispatcher.submit(seat, rng.choice(choices)))
+            for future in futures:
+                for event in future.result():
+                    if event.kind == "door_toggled":
+                        toggles[event.subject] += 1
+            actions += len(futures)
+        elapsed = time.perf_counter() - start
+    return actions / elapsed, audit(engine.world, shared, seats, toggles)
+
+
+def audit(world, shared, seats, toggles):
+    """List every item that is not in exactly one place and every door in the wrong state."""
+    places = Counter()
+    for items in shared.room_items:
+        places.update(items)
+    for seat in seats:
+        places.update(seat.state.bag)
+    placed = {item_id for items in world.initial_room_items for item_id in items}
+    problems = [f"{item_id} is in {places[item_id]} places" for item_id in placed if places[item_id] != 1]
+    for door in world.doors:
+        expected = (door in world.unlocked_doors) != (toggles[door] % 2 == 1)
+        if (door in shared.doors) != expected:
+            problems.append(f"{door} was toggled {toggles[door]} times but is "
+                            f"{'unlocked' if door in shared.doors else 'locked'}")
+    return problems
+
+
+def main():
+    """Run the contention benchmark for each pool size and print the results."""
+    parser = argparse.ArgumentParser(description="Time many players sharing one mansion.")
+    parser.add_argument("--players", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=(1, 2, 4, 8), help="thread pool sizes to test")
+    parser.add_argument("--world", metavar="FILE", help="play in the world described in FILE instead of the stock mansion")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = HauntedMansionGame(world_file=args.world).engine if args.world else stock_engine()
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"{args.players} players, {args.rounds} rounds, GIL {'enabled' if gil else 'disabled'}")
+    failed = False
+    for workers in args.workers:
+        rate, problems = play(engine, args.players, args.rounds, workers, args.seed)
+        print(f"{workers:>3} workers  {rate:>10,.0f} actions/s  lost updates {len(problems)}")
+        for problem in problems:
+            print(f"      {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
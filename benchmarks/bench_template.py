@@ -0,0 +1,96 @@
+"""
+Creation and memory benchmark for game sessions.
+
+Times creating games: over a shared engine and menus, as the servers do;
+with no engine, as a single player's game or a worker given a world file
+does; and rebuilt around a state from halfway along the escape route, as
+the HTTP API does for every request. Then holds thousands of games in
+memory, fresh, halfway along the escape route and escaped, and reports
+the bytes each one holds, as traced by tracemalloc. The games share one
+io object, so only what the game itself keeps is counted; the template
+every game shares is built before measuring starts.
+
+Run from the repository root:
+    python -m benchmarks.bench_template
+    python -m benchmarks.bench_template --games 20000
+"""
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+from benchmarks.bench_engine import ESCAPE_ROUTE
+from benchmarks.suite import BenchIO
+from engine import stock_engine
+from main import HauntedMansionGame, Player
+from menus import MenuCache
+
+
+def new_game(engine, menus, io):
+    """Create a game over a shared engine with its player already named."""
+    game = HauntedMansionGame(io=io, engine=engine, menus=menus)
+    game.player = Player("Bench")
+    return game
+
+
+def played(engine, menus, io, actions):
+    """Return a game that has played the given actions."""
+    game = new_game(engine, menus, io)
+    for action in actions:
+        game.apply_action(action)
+    return game
+
+
+def held_per_game(make, games):
+    """Return the bytes each of a number of games made by make holds."""
+    gc.collect()
+    tracemalloc.start()
+    kept = [make() for _ in range(games)]
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return held / games
+
+
+def main():
+    """Time and size game sessions and print the results."""
+    parser = argparse.ArgumentParser(description="Time creating games and size what each one holds.")
+    parser.add_argument("--games", type=int, default=5000, help="games held when measuring memory")
+    parser.add_argument("--number", type=int, default=20000, help="games created per timed run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = stock_engine()
+    menus = MenuCache(engine.world)
+    io = BenchIO()
+    halfway = ESCAPE_ROUTE[:len(ESCAPE_ROUTE) // 2]
+    middle = played(engine, menus, io, halfway).state
+    HauntedMansionGame(io=io)  # Opens the world file once, as a long-running process would have
+
+    def rebuilt():
+        game = new_game(engine, menus, io)
+        game.state = middle
+        game.mirror_state()
+
+    creations = [
+        ("shared engine", lambda: HauntedMansionGame(io=io, engine=engine, menus=menus)),
+        ("no engine", lambda: HauntedMansionGame(io=io)),
+        ("rebuilt from a state", rebuilt),
+    ]
+    for name, create in creations:
+        seconds = min(timeit.repeat(create, number=args.number, repeat=args.repeat)) / args.number
+        print(f"create, {name:<21} {1 / seconds:>10,.0f} sessions/s  {seconds * 1e6:>6.1f} us each")
+
+    stages = [
+        ("fresh", lambda: new_game(engine, menus, io)),
+        ("halfway", lambda: played(engine, menus, io, halfway)),
+        ("escaped", lambda: played(engine, menus, io, ESCAPE_ROUTE)),
+    ]
+    for name, make in stages:
+        print(f"held, {name:<22} {held_per_game(make, args.games):>10,.0f} bytes/session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Load generator for the TCP game server.
+
+Opens many concurrent sessions, waits until every one of them is
+connected, then has each session play the escape route. Every command a
+client sends is timed until the server's next prompt arrives, and the
+p50/p99 latencies of those turns are reported.
+
+By default a local server is started with in-game delays disabled:
+    python -m benchmarks.loadgen --sessions 1000 10000
+"""
+
+import argparse
+import asyncio
+import re
+import resource
+import subprocess
+import sys
+import time
+
+
+ESCAPE_SCRIPT = [
+    "Go north to Living Room",
+    "Pick up Silver Key",
+    "Go north to Grand Staircase",
+    "Go up to Odette's Bedroom",
+    "Go down to Grand Staircase",
+    "Go south to Living Room",
+    "Go east to Kitchen",
+    "Use item", "Silver Key",
+    "Go north to Pantry",
+    "Pick up Golden Key",
+    "Go south to Kitchen",
+    "Go west to Living Room",
+    "Go south to Entrance Hall",
+    "Use item", "Golden Key",
+    "Go south to Garden",
+]
+
+PAUSE_PROMPTS = (b"Press Enter to continue...", b"Press Enter to exit...")
+PROMPTS = PAUSE_PROMPTS + (b"name: ", b"choice: ", b"cancel): ")
+MENU_LINE = re.compile(r"^\s+(\d+)\. (.+?)\r?$", re.MULTILINE)
+
+
+async def read_prompt(reader):
+    """Read server output up to and including the next prompt."""
+    data = b""
+    while not data.endswith(PROMPTS):
+        chunk = await reader.read(65536)
+        if not chunk:
+            raise EOFError("Server closed the connection")
+        data += chunk
+    return data
+
+
+def menu_number(screen, label):
+    """Find the number the server assigned to a menu option."""
+    for number, text in MENU_LINE.findall(screen.decode()):
+        if text == label:
+            return number
+    raise ValueError(f"Option {label!r} not offered")
+
+
+async def play_session(host, port, index, connect_limit, ready, start, latencies):
+    """Connect, wait for every session to be connected, then play the escape route."""
+    try:
+        async with connect_limit:
+            reader, writer = await asyncio.open_connection(host, port)
+            await read_prompt(reader)
+    finally:
+        ready()
+    await start.wait()
+
+    try:
+        script = iter(ESCAPE_SCRIPT)
+        reply = f"player{index}"
+        while True:
+            sent = time.perf_counter()
+            writer.write(reply.encode() + b"\n")
+            screen = await read_prompt(reader)
+            latencies.append(time.perf_counter() - sent)
+            if screen.endswith(b"Press Enter to exit..."):
+                writer.write(b"\n")
+                return True
+            if screen.endswith(PAUSE_PROMPTS):
+                reply = ""
+            else:
+                reply = menu_number(screen, next(script))
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction of a sorted list."""
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_load(host, port, sessions):
+    """Run one load level and return (sorted latencies, wall time, escapes)."""
+    latencies = []
+    start = asyncio.Event()
+    connected = 0
+
+    def ready():
+        nonlocal connected
+        connected += 1  # Counts failed connections too, so the start is never held up
+        if connected == sessions:
+            start.set()
+
+    connect_limit = asyncio.Semaphore(500)
+    began = time.perf_counter()
+    results = await asyncio.gather(
+        *(play_session(host, port, i, connect_limit, ready, start, latencies) for i in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - began
+    escapes = sum(1 for result in results if result is True)
+    return sorted(latencies), elapsed, escapes
+
+
+def raise_file_limit():
+    """Allow as many open sockets as the system permits."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Measure server turn latency under concurrent sessions.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4100)
+    parser.add_argument("--no-spawn", action="store_true", help="use an already running server")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    server = None
+    if not args.no_spawn:
+        server = subprocess.Popen([sys.executable, "server.py", "--host", args.host,
+                                   "--port", str(args.port), "--delay-scale", "0"],
+                                  stdout=subprocess.DEVNULL)
+        time.sleep(1)
+    try:
+        for sessions in args.sessions:
+            latencies, elapsed, escapes = asyncio.run(run_load(args.host, args.port, sessions))
+            print(f"{sessions:>6} sessions: {escapes} escaped, {len(latencies)} turns in {elapsed:.2f}s, "
+                  f"p50 {percentile(latencies, 0.50) * 1000:.2f} ms, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms, "
+                  f"max {latencies[-1] * 1000:.2f} ms")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Micro and end-to-end benchmarks for the game, checked against a baseline.
+
+Every benchmark runs without a terminal: output goes to an io object that
+drops it, and pauses and delays return at once. Each one is timed with
+timeit, and the best of several repeats is kept as nanoseconds per call.
+
+Results are written as JSON and compared with benchmarks/baseline.json.
+A benchmark more than --tolerance slower than its baseline counts as a
+regression and makes the run exit with status 1. A benchmark that looks
+slower is measured again before it is reported. A baseline is recorded
+from the median of several whole runs, so that one lucky run does not set
+a bar that ordinary runs miss. Baselines depend on the machine, so
+record a new one when moving to different hardware, and after any change
+meant to make the game slower or faster.
+
+Run from the repository root:
+    python -m benchmarks.suite                      # compare with the baseline
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --update-baseline    # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import timeit
+
+from benchmarks.bench_engine import ESCAPE_ROUTE
+from engine import Engine, World, MOVE, PICKUP, USE, stock_engine
+from main import HauntedMansionGame, Item, Player
+from menus import MenuCache
+from replay import run_to_completion
+from routes import RouteCache
+from rules import RuleTable
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+REPEAT = 5
+RETRIES = 2  # Extra measurements of a benchmark that looks slower, to rule out noise
+
+
+class BenchIO:
+    """Discards output and answers prompts from a list of lines."""
+
+    def __init__(self, inputs=()):
+        self.inputs = iter(inputs)
+
+    def write(self, text=""):
+        pass
+
+    def flush(self):
+        pass
+
+    async def read(self, prompt):
+        return next(self.inputs)
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        pass
+
+    async def delay(self, seconds):
+        pass
+
+    def clear(self):
+        pass
+
+
+def escape_inputs(world):
+    """Typed commands that play the escape route through the game's menus."""
+    lines = ["Bench"]
+    for action in ESCAPE_ROUTE:
+        if action.kind == MOVE:
+            lines.append(f"go {action.arg}")
+        elif action.kind == PICKUP:
+            lines.append(f"take {world.items[action.arg].name}")
+        elif action.kind == USE:
+            lines.append(f"use {world.items[action.arg].name}")
+    return lines
+
+
+def new_game(engine, menus, inputs=()):
+    """Create a game over a shared engine with its player already named."""
+    game = HauntedMansionGame(io=BenchIO(inputs), engine=engine, menus=menus)
+    game.player = Player("Bench")
+    return game
+
+
+def benchmarks():
+    """Return (name, callable, calls per run) for every benchmark."""
+    engine = stock_engine()
+    menus = MenuCache(engine.world)
+    world = engine.world
+
+    player = Player("Bench")
+    for name in ("Candle", "Holy Water", "Old Diary"):
+        player.add_item(Item(name, ""))
+    key = Item("Silver Key", "")
+
+    def bag_add_remove():
+        player.add_item(key)
+        player.remove_item("Silver Key")
+
+    def bag_has_item():
+        player.has_item("Old Diary")
+
+    choices_game = new_game(engine, menus)
+
+    def show_choices():
+        choices_game.show_choices()
+
+    move_game = new_game(engine, menus)
+
+    def move_there_and_back():
+        run_to_completion(move_game.move_player("north"))
+        run_to_completion(move_game.move_player("south"))
+
+    use_game = new_game(engine, menus)
+    use_game.pick_up_item("Candle")
+
+    def use_candle():
+        run_to_completion(use_game.use_item("Candle"))
+
+    routes = RouteCache(world)
+    route_state = engine.initial_state()
+
+    def route_lookup():
+        routes.route(route_state, "bedroom")
+
+    # The stock rules plus a thousand more, to show a use costs the same however many rules there are
+    rules = RuleTable(world.index.rules, world.key_doors, world.index.effects)
+    for number in range(1000):
+        rules.add("portrait", f"room_{number}", text=["..."])
+        rules.add(f"item_{number}", "bedroom", {"spoken_to_odette": True}, ["..."])
+    rules_state = engine.initial_state()._replace(room="bedroom", spoken_to_odette=True)
+
+    def rules_match():
+        rules.match(rules_state, "portrait")
+
+    inputs = escape_inputs(world)
+
+    def escape_playthrough():
+        game = HauntedMansionGame(io=BenchIO(inputs), engine=engine, menus=menus)
+        run_to_completion(game.start_game())
+        assert game.state.escaped
+
+    def engine_playthrough():
+        state = engine.initial_state()
+        for action in ESCAPE_ROUTE:
+            state, events = engine.step(state, action)
+        assert state.escaped
+
+    setup_game = HauntedMansionGame(io=BenchIO(), engine=engine, menus=menus)
+
+    return [
+        ("player.add_item+remove_item", bag_add_remove, 1),
+        ("player.has_item", bag_has_item, 1),
+        ("game.show_choices", show_choices, 1),
+        ("game.move_player", move_there_and_back, 2),
+        ("game.use_item", use_candle, 1),
+        ("routes.route", route_lookup, 1),
+        ("rules.match", rules_match, 1),
+        ("playthrough.game", escape_playthrough, 1),
+        ("playthrough.engine", engine_playthrough, 1),
+        ("construct.setup_game", setup_game.setup_game, 1),
+        ("construct.game_shared_engine", lambda: HauntedMansionGame(io=BenchIO(), engine=engine, menus=menus), 1),
+        ("construct.game", lambda: HauntedMansionGame(io=BenchIO()), 1),
+        ("construct.engine", lambda: Engine(World.from_game(setup_game)), 1),
+    ]
+
+
+def measure(function, calls, repeat=REPEAT):
+    """Return the best nanoseconds per call over several timed runs."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / (number * calls) * 1e9
+
+
+def run(names=None, baseline=None, tolerance=None):
+    """Run the selected benchmarks and return their results.
+
+    With a baseline, a benchmark that comes out slower than the tolerance
+    allows is measured again and its best time kept.
+    """
+    results = {}
+    for name, function, calls in benchmarks():
+        if names and not any(part in name for part in names):
+            continue
+        best = measure(function, calls)
+        previous = baseline["benchmarks"].get(name) if baseline else None
+        for _ in range(RETRIES if previous else 0):
+            if best <= previous["ns_per_call"] * (1 + tolerance):
+                break
+            best = min(best, measure(function, calls))
+        results[name] = {"ns_per_call": round(best, 1)}
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+
+
+def median_of(runs):
+    """Return results holding each benchmark's median time over several runs."""
+    results = dict(runs[0])
+    results["benchmarks"] = {
+        name: {"ns_per_call": round(statistics.median(run["benchmarks"][name]["ns_per_call"] for run in runs), 1)}
+        for name in runs[0]["benchmarks"]
+    }
+    return results
+
+
+def compare(results, baseline):
+    """Return (name, baseline ns, current ns, ratio) for every shared benchmark."""
+    rows = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            rows.append((name, None, current["ns_per_call"], None))
+        else:
+            rows.append((name, previous["ns_per_call"], current["ns_per_call"],
+                         current["ns_per_call"] / previous["ns_per_call"]))
+    return rows
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run the game benchmarks and check them against a baseline.")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--output", metavar="FILE", help="also write the results to FILE as JSON")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before a benchmark fails, as a fraction (default 0.5)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="whole runs a new baseline takes the median of (default 5)")
+    args = parser.parse_args()
+
+    baseline = {"benchmarks": {}}
+    if not args.update_baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    if args.update_baseline:
+        results = median_of([run(args.names) for _ in range(max(1, args.runs))])
+    else:
+        results = run(args.names, baseline, args.tolerance)
+    text = json.dumps(results, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = 0
+    for name, previous, current, ratio in compare(results, baseline):
+        if ratio is None:
+            status = "new"
+        elif ratio > 1 + args.tolerance:
+            status = "REGRESSION"
+            regressions += 1
+        else:
+            status = "ok"
+        previous_text = f"{previous:>12,.1f}" if previous is not None else f"{'-':>12}"
+        change = f"{ratio - 1:+7.1%}" if ratio is not None else f"{'':>7}"
+        print(f"{name:<32}{previous_text} ns {current:>12,.1f} ns {change}  {status}")
+    print(f"{len(results['benchmarks'])} benchmarks, {regressions} regressions")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Headless engine for the Haunted Mansion Escape Game.
+
+The engine holds the rules of the mansion without ever touching the
+terminal. ``Engine.step(state, action)`` takes an immutable ``GameState``
+and an ``Action`` and returns the new state together with a list of
+``Event`` records describing what happened. Front ends (the console game
+in main.py, benchmarks, bots) decide how to present those events.
+"""
+
+from collections import namedtuple
+
+from rules import RuleTable
+from sharedstate import PSet, PVector
+
+
+# Action kinds
+MOVE = "move"
+PICKUP = "pickup"
+DROP = "drop"
+USE = "use"
+LOOK = "look"
+BAG = "bag"
+QUIT = "quit"
+
+# Items whose use has a special effect anywhere in the mansion
+ALWAYS_EFFECTIVE_ITEMS = ("holy_water", "candle")
+
+
+class Action(namedtuple("Action", ["kind", "arg"])):
+    """A single player action, e.g. Action("move", "north")."""
+
+    __slots__ = ()
+
+    def __new__(cls, kind, arg=None):
+        return super().__new__(cls, kind, arg)
+
+
+class Event(namedtuple("Event", ["kind", "subject", "detail"])):
+    """Something that happened during a step, e.g. Event("picked_up", "candle")."""
+
+    __slots__ = ()
+
+    def __new__(cls, kind, subject=None, detail=None):
+        return super().__new__(cls, kind, subject, detail)
+
+
+GameState = namedtuple("GameState", [
+    "room",              # Id of the room the player is standing in
+    "bag",               # Tuple of item ids in the order they were picked up
+    "room_items",        # PVector of item-id tuples, one per room in World.room_ids
+    "visited",           # PSet of visited room ids
+    "doors",             # PSet of unlocked door ids
+    "spoken_to_odette",
+    "escaped",
+    "quit",
+])
+
+
+class World:
+    """Static description of a mansion: rooms, items, connections and doors."""
+
+    def __init__(self, rooms, items, doors, unlocked_doors=(), start_room="entrance_hall",
+                 odette_room="bedroom", exit_room="garden", bag_capacity=4,
+                 effect_items=ALWAYS_EFFECTIVE_ITEMS, index=None, rules=None):
+        self.rooms = rooms  # Room id -> Room
+        self.items = items  # Item id -> Item
+        self.doors = dict(doors)  # Door (room id behind it) -> key item id
+        self.unlocked_doors = frozenset(unlocked_doors)
+        self.start_room = start_room
+        self.odette_room = odette_room
+        self.exit_room = exit_room
+        self.bag_capacity = bag_capacity
+        self.effect_items = frozenset(effect_items)  # Items with an effect wherever they are used
+        self.index = index  # Compiled WorldIndex the world came from, if any
+
+        if index is not None:
+            # Everything that would mean walking every room is precompiled in the index
+            self.room_ids = index.room_ids
+            self.room_index = index.room_index
+            self.initial_room_items = index.initial_room_items
+            self.key_doors = dict(index.key_doors)
+            self.directions = index.directions
+        else:
+            self.room_ids = tuple(rooms)
+            self.room_index = {room_id: i for i, room_id in enumerate(self.room_ids)}
+
+            item_ids = {id(item): item_id for item_id, item in items.items()}
+            self.initial_room_items = tuple(
+                tuple(item_ids[id(item)] for item in rooms[room_id].items)
+                for room_id in self.room_ids
+            )
+
+            # (room id, key id) -> door that key toggles when used in that room
+            self.key_doors = {}
+            for room_id, room in rooms.items():
+                for destination in room.connections.values():
+                    if destination in self.doors:
+                        self.key_doors[(room_id, self.doors[destination])] = destination
+            self.directions = tuple(sorted({
+                direction for room in rooms.values() for direction in room.connections
+            }))
+
+        # Persistent forms shared by every new game, so states only ever copy what they change
+        self.initial_room_vector = PVector(self.initial_room_items)
+        self.initial_doors = PSet(self.unlocked_doors)
+        self.initial_visited = PSet([start_room])
+
+        self.item_ids_by_name = {item.name.lower(): item_id for item_id, item in items.items()}
+        self.key_for_doors = {}
+        for door, key in self.doors.items():
+            self.key_for_doors.setdefault(key, door)
+
+        # Declared rules first, then the ones keys and item effects imply
+        if rules is None:
+            effects = index.effects if index is not None else dict.fromkeys(self.effect_items, ())
+            rules = RuleTable(index.rules if index is not None else (), self.key_doors, effects)
+        self.rules = rules
+
+    @classmethod
+    def from_game(cls, game):
+        """Build a world from a game whose setup_game() has already run."""
+        doors = {door: game.get_door_key(door) for door in game.door_states}
+        unlocked = [door for door, is_open in game.door_states.items() if is_open]
+        index = getattr(game, "world_index", None)
+        if index is None:
+            return cls(game.rooms, game.game_items, doors, unlocked,
+                       bag_capacity=getattr(game, "bag_capacity", 4))
+        return cls(game.rooms, game.game_items, doors, unlocked, start_room=index.start_room,
+                   odette_room=index.odette_room, exit_room=index.exit_room,
+                   bag_capacity=game.bag_capacity, effect_items=index.effect_items, index=index)
+
+    def item_id(self, item_name):
+        """Return the id of the item with the given display name, or None."""
+        return self.item_ids_by_name.get(item_name.lower())
+
+
+class Engine:
+    """Pure rules of the game: state in, state and events out."""
+
+    def __init__(self, world):
+        self.world = world
+        self.template = None  # main.WorldTemplate shared by the games played on this engine, once one is made
+
+    def initial_state(self):
+        """Return the state of a fresh game."""
+        world = self.world
+        return GameState(
+            room=world.start_room,
+            bag=(),
+            room_items=world.initial_room_vector,
+            visited=world.initial_visited,
+            doors=world.initial_doors,
+            spoken_to_odette=False,
+            escaped=False,
+            quit=False,
+        )
+
+    def items_in_room(self, state, room_id):
+        """Return the item ids lying in a room."""
+        return state.room_items[self.world.room_index[room_id]]
+
+    def is_door_accessible(self, state, to_room):
+        """Check whether the player may walk into to_room."""
+        return to_room not in self.world.doors or to_room in state.doors
+
+    def is_won(self, state):
+        """Check the escape condition: in the garden, gate open, Odette met."""
+        world = self.world
+        return (state.room == world.exit_room and
+                world.exit_room in state.doors and
+                state.spoken_to_odette)
+
+    def toggle_door(self, state, door):
+        """Return a state with the given door's lock flipped."""
+        return state._replace(doors=state.doors.toggle(door))
+
+    def legal_actions(self, state):
+        """List the actions that are worth offering from a state."""
+        room = self.world.rooms[state.room]
+        actions = [Action(MOVE, direction) for direction in room.connections]
+        actions.extend(Action(PICKUP, item_id) for item_id in self.items_in_room(state, state.room))
+        actions.extend(Action(USE, item_id) for item_id in state.bag)
+        actions.extend(Action(DROP, item_id) for item_id in state.bag)
+        return actions
+
+    def step(self, state, action):
+        """Apply an action and return (new_state, events)."""
+        if state.escaped or state.quit:
+            return state, []
+        handler = self._handlers.get(action.kind)
+        if handler is None:
+            raise ValueError(f"Unknown action: {action.kind!r}")
+        return handler(self, state, action.arg)
+
+    def _move(self, state, direction):
+        world = self.world
+        to_room = world.rooms[state.room].connections.get(direction)
+        if to_room is None:
+            return state, [Event("no_exit", direction)]
+        if not self.is_door_accessible(state, to_room):
+            return state, [Event("door_locked", to_room, world.doors[to_room])]
+
+        events = [Event("moved", direction, to_room)]
+        state = state._replace(room=to_room, visited=state.visited.add(to_room))
+        if to_room == world.odette_room and not state.spoken_to_odette:
+            state = state._replace(spoken_to_odette=True)
+            events.append(Event("odette_met", to_room))
+        if self.is_won(state):
+            state = state._replace(escaped=True)
+            events.append(Event("escaped", to_room))
+        return state, events
+
+    def _pick_up(self, state, item_id):
+        index = self.world.room_index[state.room]
+        here = state.room_items[index]
+        if item_id not in here:
+            return state, [Event("no_such_item", item_id)]
+        if len(state.bag) >= self.world.bag_capacity:
+            return state, [Event("bag_full", item_id, self.world.bag_capacity)]
+
+        position = here.index(item_id)
+        remaining = here[:position] + here[position + 1:]
+        state = state._replace(bag=state.bag + (item_id,), room_items=state.room_items.set(index, remaining))
+        return state, [Event("picked_up", item_id, state.room)]
+
+    def _drop(self, state, item_id):
+        if item_id not in state.bag:
+            return state, [Event("missing_item", item_id)]
+        index = self.world.room_index[state.room]
+        room_items = state.room_items.set(index, state.room_items[index] + (item_id,))
+        position = state.bag.index(item_id)
+        bag = state.bag[:position] + state.bag[position + 1:]
+        state = state._replace(bag=bag, room_items=room_items)
+        return state, [Event("dropped", item_id, state.room)]
+
+    def _use(self, state, item_id):
+        if item_id not in state.bag:
+            return state, [Event("missing_item", item_id)]
+
+        events = [Event("used", item_id, state.room)]
+        rule = self.world.rules.match(state, item_id)
+        if rule is None:
+            # A key used away from its door gets a hint
+            events.append(Event("no_effect", item_id, self.world.key_for_doors.get(item_id)))
+            return state, events
+        door = rule.toggle_door
+        if door is not None:
+            state = self.toggle_door(state, door)
+            events.append(Event("door_toggled", door, door in state.doors))
+        if rule.text or door is None:
+            events.append(Event("item_effect", item_id, rule.number))
+        if rule.consume:
+            position = state.bag.index(item_id)
+            state = state._replace(bag=state.bag[:position] + state.bag[position + 1:])
+            events.append(Event("consumed", item_id, state.room))
+        return state, events
+
+    def _look(self, state, arg):
+        return state, [Event("looked", state.room)]
+
+    def _show_bag(self, state, arg):
+        return state, [Event("bag_shown", state.room)]
+
+    def _quit(self, state, arg):
+        return state._replace(quit=True), [Event("quit")]
+
+    _handlers = {
+        MOVE: _move,
+        PICKUP: _pick_up,
+        DROP: _drop,
+        USE: _use,
+        LOOK: _look,
+        BAG: _show_bag,
+        QUIT: _quit,
+    }
+
+
+_stock_engine = None
+
+
+def stock_engine():
+    """Return a shared engine for the mansion built by HauntedMansionGame.setup_game()."""
+    global _stock_engine
+    if _stock_engine is None:
+        from main import HauntedMansionGame
+        _stock_engine = HauntedMansionGame().engine
+    return _stock_engine
+
+
+def step(state, action):
+    """Apply an action to a state of the stock mansion."""
+    return stock_engine().step(state, action)
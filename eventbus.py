@@ -0,0 +1,243 @@
+"""
+Event hooks for the Haunted Mansion Escape Game, with batched sinks.
+
+An EventBus hands the engine's events to the callbacks subscribed to
+their kind. The ones most worth hooking are
+
+    room entered    "moved"
+    item picked up  "picked_up"
+    item dropped    "dropped"
+    door toggled    "door_toggled"
+    Odette met      "odette_met"
+    escaped         "escaped"
+
+but any engine event kind works. Callbacks are called with the game and
+the event, right after the game has mirrored the action:
+
+    bus = EventBus()
+    bus.subscribe("escaped", lambda game, event: print(f"{game.player.name} got out"))
+    game = HauntedMansionGame(bus=bus)
+
+The bus keeps a tuple of callbacks per kind and rebuilds it whenever a
+subscription changes. Publishing costs one dict lookup per event, and
+nothing more for kinds nobody subscribed to.
+
+Sinks keep slow writes out of the turn. A sink is a callback too, but it
+only appends the event to a queue. A background thread (start()) or an
+asyncio task (run()) later takes whatever has built up and writes it in
+one go. Records are turned into JSON there, not during the turn. Writes
+take a lock, so a final flush never interleaves with a background one,
+and a background write that fails is reported on stderr and its records
+counted in dropped, instead of stopping the flushing:
+
+    sink = NdjsonFileSink("telemetry.ndjson").start()
+    bus.subscribe(GAME_EVENTS, sink)
+    ...
+    sink.close()  # writes what is left
+"""
+
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+GAME_EVENTS = ("moved", "picked_up", "dropped", "door_toggled", "odette_met", "escaped")
+
+_encode = json.JSONEncoder(separators=(",", ":")).encode  # One encoder for every record, not one per dumps() call
+
+
+class EventBus:
+    """Delivers engine events to the callbacks subscribed to their kind."""
+
+    def __init__(self):
+        self._subscribers = {}  # Kind -> callbacks in the order they subscribed
+        self._dispatch = {}  # Kind -> tuple of callbacks, replaced whole on every change
+
+    def subscribe(self, kinds, callback):
+        """Call callback(game, event) for every event of a kind or tuple of kinds."""
+        for kind in (kinds,) if isinstance(kinds, str) else kinds:
+            self._subscribers.setdefault(kind, []).append(callback)
+        self._rebuild()
+
+    def unsubscribe(self, kinds, callback):
+        """Stop calling a callback for a kind or tuple of kinds."""
+        for kind in (kinds,) if isinstance(kinds, str) else kinds:
+            callbacks = self._subscribers.get(kind, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+        self._rebuild()
+
+    def _rebuild(self):
+        # Publishing reads _dispatch without a lock, so it is swapped rather than changed in place
+        self._dispatch = {kind: tuple(callbacks) for kind, callbacks in self._subscribers.items() if callbacks}
+
+    def publish(self, game, events):
+        """Hand each event to the callbacks for its kind."""
+        dispatch = self._dispatch
+        if not dispatch:
+            return
+        for event in events:
+            callbacks = dispatch.get(event.kind)
+            if callbacks is not None:
+                for callback in callbacks:
+                    callback(game, event)
+
+
+class BatchSink(ABC):
+    """Queues records and writes them in batches, away from the code that produced them."""
+
+    def __init__(self, interval=0.5, max_batch=4096):
+        self.interval = interval  # Seconds between flushes
+        self.max_batch = max_batch  # Queued records that wake the flush thread early
+        self.written = 0  # Records that reached their destination
+        self.dropped = 0  # Records lost because writing them failed
+        self._writing = threading.Lock()  # Held for every write, so batches never interleave
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def __call__(self, game, event):
+        # Only a tuple is built during the turn; encode() makes it a JSON object later
+        self.put((time.time(), game.player.name if game.player is not None else None, event))
+
+    def encode(self, record):
+        """Return a record as one line of JSON; records queued from the bus are (time, player, event)."""
+        if type(record) is tuple:
+            at, player, event = record
+            record = {"time": round(at, 3), "player": player, "kind": event.kind, "subject": event.subject,
+                      "detail": event.detail}
+        return _encode(record)
+
+    def put(self, record):
+        """Queue a record. Never waits on I/O."""
+        pending = self._pending
+        pending.append(record)
+        if len(pending) >= self.max_batch and self._thread is not None:
+            self._wake.set()
+
+    def take(self):
+        """Remove and return every record queued so far."""
+        pending = self._pending
+        return [pending.popleft() for _ in range(len(pending))]
+
+    @abstractmethod
+    def write(self, batch):
+        """Write a batch of records; subclasses say where."""
+
+    def flush(self):
+        """Write everything queued so far, from the calling thread."""
+        batch = self.take()
+        if batch:
+            with self._writing:
+                self.write(batch)
+
+    def _background_flush(self):
+        # Nobody waits on a background flush, so a failed write is reported rather than raised
+        batch = self.take()
+        if batch:
+            try:
+                with self._writing:
+                    self.write(batch)
+            except Exception as error:
+                self.dropped += len(batch)
+                print(f"{type(self).__name__}: dropped {len(batch)} records: {error}", file=sys.stderr, flush=True)
+
+    def start(self):
+        """Flush from a background thread every interval, or sooner when a batch fills; returns self."""
+        self._thread = threading.Thread(target=self._flush_loop, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._background_flush()
+
+    async def run(self):
+        """Flush from an asyncio task every interval until cancelled; writes go to the loop's executor.
+
+        A write under way when the task is cancelled is finished before
+        the cancellation goes through, so close() can follow straight away.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._pending:
+                flushing = loop.run_in_executor(None, self._background_flush)
+                try:
+                    await asyncio.shield(flushing)
+                except asyncio.CancelledError:
+                    await flushing
+                    raise
+
+    def close(self):
+        """Stop the background thread, if any, and write what is left."""
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+class NdjsonFileSink(BatchSink):
+    """Appends records to a file, one JSON object per line."""
+
+    def __init__(self, path, interval=0.5, max_batch=4096):
+        super().__init__(interval, max_batch)
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, batch):
+        self.file.write("\n".join(map(self.encode, batch)) + "\n")
+        self.file.flush()
+        self.written += len(batch)
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class SocketSink(BatchSink):
+    """Streams records as JSON lines to a TCP collector, reconnecting after errors."""
+
+    def __init__(self, host, port, interval=0.5, max_batch=4096, timeout=5.0):
+        super().__init__(interval, max_batch)
+        self.address = (host, port)
+        self.timeout = timeout
+        self._socket = None
+
+    def write(self, batch):
+        data = ("\n".join(map(self.encode, batch)) + "\n").encode()
+        try:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, self.timeout)
+            self._socket.sendall(data)
+            self.written += len(batch)
+        except OSError:
+            self.dropped += len(batch)
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def close(self):
+        super().close()
+        self._disconnect()
+
+
+def open_sink(target, interval=0.5):
+    """Return a sink for "host:port" or a file path."""
+    host, _, port = target.rpartition(":")
+    if host and port.isdigit():
+        return SocketSink(host, int(port), interval)
+    return NdjsonFileSink(target, interval)
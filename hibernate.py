@@ -0,0 +1,421 @@
+"""
+Idle session hibernation for the multi-session server.
+
+Players spend nearly all their time at a prompt. A server that keeps a
+coroutine suspended inside every game keeps every game in memory for as
+long as its player stays connected, so memory grows with the number of
+players logged in, not with the number actually playing.
+
+With hibernation the server drives each game one step at a time, from
+one prompt to the next. Between steps a connection holds only which step
+comes next. The games themselves belong to a SessionManager, which keeps
+the most recently used ones in an LRU of fixed size. When the LRU
+overflows, the least recently used game is packed into a record and
+written to a SessionStore, a file on local disk. The next line its
+player types reads the record back and rebuilds the game. Resident
+memory is then bounded by the LRU size however many players are logged
+in, and an idle player costs a slot in the file and an entry in its
+index.
+
+    python server.py --hibernate 1000 --hibernate-file /var/tmp/mansion.sessions
+
+A step ends at a "Press Enter" pause, and the game keeps what the step
+did, since pauses only ever come last. A step that asks a follow-up
+question, such as which item to use, has not changed the game yet. It is
+played again from its start once the answer arrives, without sending the
+lines the player has already seen.
+
+A record holds the player's name and every state the game remembers:
+the current one, the undo and redo stacks and the checkpoints, each as
+StateCodec bytes. The names and the event log's marks follow as a little
+JSON. States that are read back share structure with each other as they
+did before (see sharedstate.py), so a long undo history does not
+multiply a game's memory when it wakes. As with a resumed save, a woken
+game lists each room's items in world order from its next screen on.
+The record also keeps the items of the player's room in the order the
+last menu listed them, so a menu number typed after a wake still picks
+the choice the player saw under it.
+
+stats() counts hits (the game was still in memory) and misses (it had to
+be read back), with the resident memory per live session and the bytes
+stored per hibernated one. The server prints them every so often.
+"""
+
+import itertools
+import json
+import os
+import struct
+import sys
+import tempfile
+from collections import OrderedDict
+
+from analytics import SessionEvents
+from history import History
+from main import HauntedMansionGame, Player
+from menus import MenuCache
+from statecodec import StateCodec
+
+
+RECORD_HEADER = struct.Struct("<BIIIII")  # flags, undo states, redo states, checkpoints, distinct states, JSON size
+HAS_PLAYER = 1
+ODETTE_PENDING = 2
+GAME_COMPLETE = 4
+MIN_SLOT = 64  # Smallest slot in the store, in bytes
+
+
+class Prompt(Exception):
+    """Raised by StepIO when a step has to wait for the player."""
+
+    def __init__(self, prompt, pause):
+        super().__init__(prompt)
+        self.prompt = prompt
+        self.pause = pause  # Pauses end a step; other questions play it again with the answer
+
+
+class StepIO:
+    """Plays one step of a game on a connection's IO, ending it at the first unanswered prompt."""
+
+    __slots__ = ("io", "inputs", "skip", "written")
+
+    def __init__(self, io, inputs=(), skip=0):
+        self.io = io
+        self.inputs = iter(inputs)
+        self.skip = skip  # Lines earlier tries of this step already sent
+        self.written = 0
+
+    def write(self, text=""):
+        self.written += 1
+        if self.written > self.skip:
+            self.io.write(text)
+
+    def flush(self, prompt=""):
+        self.io.flush(prompt)
+
+    async def read(self, prompt):
+        line = next(self.inputs, None)
+        if line is None:
+            raise Prompt(prompt, False)
+        return line
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        raise Prompt(prompt, True)
+
+    async def delay(self, seconds):
+        await self.io.delay(seconds)
+
+    def clear(self):
+        self.written += 1
+        if self.written > self.skip:
+            self.io.clear()
+
+
+# Each step returns the one that follows straight away, or None when the game is over
+async def _start(game):
+    game.show_title()
+    await game.begin()
+
+
+async def _screen(game):
+    if not game.game_running or game.player.game_complete:
+        return await _over(game)
+    return "turn" if await game.show_screen() else "over"
+
+
+async def _contents(game):
+    game.show_room_contents()
+    return "turn" if await game.offer_choices() else "over"
+
+
+async def _turn(game):
+    await game.handle_player_input()
+    return "screen"
+
+
+async def _over(game):
+    game.finish()
+    return None
+
+
+STEPS = {"start": _start, "screen": _screen, "contents": _contents, "turn": _turn, "over": _over}
+
+
+def _after_pause(step, game):
+    """Return the step that follows the player pressing Enter at the end of a step."""
+    if step in ("screen", "contents"):
+        # The room screen pauses for Odette, and the victory for the last time
+        return "over" if game.player.game_complete else "contents"
+    return "screen"
+
+
+def resident_bytes():
+    """Return the process's resident memory, or its peak where the current figure is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class SessionStore:
+    """Hibernated sessions in one file, each in a slot that is reused once the session wakes."""
+
+    def __init__(self, path=None):
+        # A file per session would cost a create and a delete per eviction, which is slow on many filesystems
+        self.file = open(path, "w+b", buffering=0) if path else tempfile.TemporaryFile(buffering=0)
+        self.path = path
+        self.size = 0  # Length of the file; it grows to the most ever hibernated at once and is then reused
+        self.bytes = 0  # Bytes of the records stored now
+        self._slots = {}  # Session number -> (offset, record size)
+        self._free = {}  # Slot size -> offsets of free slots
+
+    @property
+    def sessions(self):
+        return len(self._slots)
+
+    @staticmethod
+    def slot_size(length):
+        return max(MIN_SLOT, 1 << (length - 1).bit_length())
+
+    def put(self, number, record):
+        """Store a session's record."""
+        slot = self.slot_size(len(record))
+        free = self._free.get(slot)
+        if free:
+            offset = free.pop()
+        else:
+            offset = self.size
+            self.size += slot
+        self.file.seek(offset)
+        self.file.write(record)
+        self._slots[number] = (offset, len(record))
+        self.bytes += len(record)
+
+    def take(self, number):
+        """Return a session's record and free its slot."""
+        offset, length = self._release(number)
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def discard(self, number):
+        """Free a session's slot, if it has one."""
+        if number in self._slots:
+            self._release(number)
+
+    def _release(self, number):
+        offset, length = self._slots.pop(number)
+        self._free.setdefault(self.slot_size(length), []).append(offset)
+        self.bytes -= length
+        return offset, length
+
+    def close(self):
+        """Close the file, removing it if it was named."""
+        self.file.close()
+        if self.path:
+            os.remove(self.path)
+
+
+class SessionManager:
+    """Keeps the most recently used games in memory and hibernates the rest to a SessionStore."""
+
+    def __init__(self, engine, capacity=1000, path=None, menus=None, event_log=None, bus=None, metrics=None):
+        self.engine = engine
+        self.world = engine.world
+        self.menus = menus or MenuCache(self.world)
+        self.codec = StateCodec(self.world)
+        self.capacity = capacity  # Games kept in memory between steps
+        self.store = SessionStore(path)
+        self.event_log = event_log
+        self.bus = bus
+        self.metrics = metrics
+        self.live = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hot = OrderedDict()  # Session number -> game, least recently used first
+        self._packed = {}  # Session number -> {id(state): (state, bytes)} for woken games, so they pack faster
+        self._numbers = itertools.count(1)
+        self._baseline = resident_bytes()
+
+    def new_game(self, io):
+        """Return a game for a new session."""
+        game = HauntedMansionGame(io=io, engine=self.engine, menus=self.menus, event_log=self.event_log,
+                                  bus=self.bus)
+        if self.metrics is not None:
+            self.metrics.instrument(game)
+        return game
+
+    async def play(self, io):
+        """Play a game on a connection, holding the game only while one of its steps runs."""
+        number = next(self._numbers)
+        self.live += 1
+        step, inputs, skip = "start", [], 0
+        game = self.new_game(io)
+        try:
+            while step is not None:
+                step_io = StepIO(io, inputs, skip)
+                if game is None:
+                    game = self.checkout(number, step_io)
+                game.io = step_io
+                try:
+                    following = await STEPS[step](game)
+                except Prompt as waiting:
+                    # Waited on outside this block, whose exception would keep the step's frames and game alive
+                    prompt, pause = waiting.prompt, waiting.pause
+                else:
+                    step, inputs, skip = following, [], 0
+                    continue
+                if pause:
+                    step, inputs, skip = _after_pause(step, game), [], 0
+                else:
+                    skip = step_io.written
+                self.checkin(number, game)
+                game = None
+                line = await io.read(prompt)
+                if not pause:
+                    inputs.append(line)
+        finally:
+            self.live -= 1
+            self.discard(number, game)
+
+    def checkout(self, number, io):
+        """Take a session's game out of the LRU, reading it back from the store if it was hibernated."""
+        game = self._hot.pop(number, None)
+        if game is not None:
+            self.hits += 1
+            return game
+        self.misses += 1
+        packed = self._packed[number] = {}
+        return self.thaw(self.store.take(number), io, packed)
+
+    def checkin(self, number, game):
+        """Put a game back as the most recently used, hibernating the least recently used past capacity."""
+        game.io = None  # The game must not keep its connection's output alive while it waits
+        hot = self._hot
+        hot[number] = game
+        while len(hot) > self.capacity:
+            oldest, idle = hot.popitem(last=False)
+            self.store.put(oldest, self.freeze(idle, self._packed.pop(oldest, None)))
+            self.evictions += 1
+
+    def discard(self, number, game=None):
+        """Forget a finished session, wherever its game is."""
+        game = self._hot.pop(number, game)
+        self._packed.pop(number, None)
+        if game is not None:
+            game.close()
+        else:
+            self.store.discard(number)
+
+    def freeze(self, game, packed=None):
+        """Pack a game into a record, reusing the bytes of states thaw() put in packed."""
+        history = game.history
+        undo, redo = history.stacks()
+        flags = ((HAS_PLAYER if game.player is not None else 0) |
+                 (ODETTE_PENDING if game.odette_pending else 0) |
+                 (GAME_COMPLETE if game.player is not None and game.player.game_complete else 0))
+        names = {"player": game.player.name if game.player is not None else None,
+                 "checkpoints": list(history.checkpoints)}
+        if game.player is not None:
+            # The codec puts room items back in world order, but the player has the menu in the order they were shown
+            names["menu_items"] = list(self.engine.items_in_room(game.state, game.state.room))
+        if game.events is not None:
+            names["events"] = game.events.as_dict()
+        tail = json.dumps(names).encode()
+
+        # History only records a state that is not the current object, so which states are one object must survive
+        distinct = {}
+        for state in (game.state, history.state, *undo, *redo, *history.checkpoints.values()):
+            distinct.setdefault(id(state), (len(distinct), state))
+        references = [distinct[id(state)][0] for state in
+                      (game.state, history.state, *undo, *redo, *history.checkpoints.values())]
+        chunks = []
+        for _, state in distinct.values():
+            # The pair holds on to its state, so a matching id cannot belong to a newer object
+            entry = packed.get(id(state)) if packed else None
+            chunks.append(entry[1] if entry is not None and entry[0] is state else self.codec.to_bytes(state))
+        return (RECORD_HEADER.pack(flags, len(undo), len(redo), len(history.checkpoints), len(distinct), len(tail)) +
+                b"".join(chunks) +
+                struct.pack(f"<{len(references)}I", *references) + tail)
+
+    def thaw(self, record, io, packed=None):
+        """Rebuild a game from a record made by freeze(), noting each state's bytes in packed if given."""
+        flags, undo_count, redo_count, checkpoint_count, distinct_count, tail_size = \
+            RECORD_HEADER.unpack_from(record)
+        size = self.codec.byte_length
+        offset = RECORD_HEADER.size
+        distinct = []
+        previous = None
+        for start in range(offset, offset + distinct_count * size, size):
+            chunk = record[start:start + size]
+            code = int.from_bytes(chunk, "little")
+            # Each state is decoded on top of the one before, sharing structure as it did in memory
+            if previous is None:
+                distinct.append(self.codec.unpack(code))
+            else:
+                distinct.append(self.codec.unpack_onto(code, distinct[-1], previous))
+            previous = code
+            if packed is not None:
+                packed[id(distinct[-1])] = (distinct[-1], chunk)
+        offset += distinct_count * size
+        count = 2 + undo_count + redo_count + checkpoint_count
+        states = [distinct[index] for index in struct.unpack_from(f"<{count}I", record, offset)]
+        names = json.loads(record[offset + 4 * count:])
+        state, current = states[0], states[1]
+        undo = states[2:2 + undo_count]
+        redo = states[2 + undo_count:2 + undo_count + redo_count]
+        checkpoints = dict(zip(names["checkpoints"], states[2 + undo_count + redo_count:]))
+
+        game = HauntedMansionGame(io=io, engine=self.engine, menus=self.menus, bus=self.bus)
+        if self.event_log is not None:
+            game.events = SessionEvents.from_dict(self.event_log, self.world, names["events"])
+        if self.metrics is not None:
+            self.metrics.instrument(game)
+        game.state = state
+        game.history = History.from_stacks(current, undo, redo, checkpoints, game.undo_depth)
+        game.odette_pending = bool(flags & ODETTE_PENDING)
+        if flags & HAS_PLAYER:
+            game.player = Player(names["player"], self.world.bag_capacity, state.room)
+            game.mirror_state()
+            game.player.game_complete = bool(flags & GAME_COMPLETE)
+            game.game_running = not (game.player.game_complete or state.quit)
+            # A game waiting for its player's choice needs the menu it showed them, numbered as it was shown
+            game.menu = self.menus.menu_for(state.room, tuple(names["menu_items"]))
+            game.command_list = game.menu.commands
+        return game
+
+    def stats(self):
+        """Return session counts, hit rates and memory figures as a JSON-ready dict."""
+        resident = resident_bytes()
+        lookups = self.hits + self.misses
+        cold = self.store.sessions
+        return {
+            "live": self.live,
+            "hot": len(self._hot),
+            "cold": cold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "resident_bytes": resident,
+            "resident_bytes_per_live_session": (resident - self._baseline) / self.live if self.live else 0.0,
+            "stored_bytes": self.store.bytes,
+            "stored_bytes_per_cold_session": self.store.bytes / cold if cold else 0.0,
+        }
+
+    def report(self):
+        """Return the figures from stats() as one line of text."""
+        stats = self.stats()
+        return (f"{stats['live']:,} live sessions ({stats['hot']:,} in memory, {stats['cold']:,} hibernated), "
+                f"hits {stats['hits']:,}, misses {stats['misses']:,} ({stats['hit_rate']:.1%} hit rate), "
+                f"{stats['resident_bytes_per_live_session'] / 1024:,.1f} KB resident per live session, "
+                f"{stats['stored_bytes_per_cold_session']:,.0f} bytes stored per hibernated one")
+
+    def close(self):
+        """Close and remove the store."""
+        self.store.close()
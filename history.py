@@ -0,0 +1,111 @@
+"""
+Undo, redo and named checkpoints over game states.
+
+Engine states are immutable and share structure with the states they
+came from (see sharedstate.py), so a snapshot is just a reference: taking
+one per turn costs constant time, and the memory it keeps is only what
+that turn changed. History keeps those references in deques, and the
+undo stack only goes back depth turns (UNDO_DEPTH unless given), so a
+long session does not keep its whole timeline. fork() copies the
+references, never the states, so solvers, hint systems and players can
+branch from any point without copying a game.
+
+    history = History(engine.initial_state())
+    history.record(state)        # after every turn
+    state = history.undo()       # None when there is nothing to undo
+    history.checkpoint("hall")
+    state = history.restore("hall")
+"""
+
+from collections import deque
+
+
+UNDO_DEPTH = 1000  # Turns a history can undo unless told otherwise
+
+
+class History:
+    """The current state with its undo and redo stacks and named checkpoints."""
+
+    def __init__(self, state, depth=UNDO_DEPTH):
+        self.state = state
+        self.depth = depth  # Most turns undo() can step back; None keeps every one
+        # Deques, newest last, made on the first push so a new game does not pay for them
+        self._undo = ()  # Past depth the oldest state is forgotten
+        self._redo = ()
+        self.checkpoints = {}  # Name -> state
+
+    def record(self, state):
+        """Make state the current one; what was current can be undone back to."""
+        if state is self.state:
+            return
+        undo = self._undo
+        if not undo:
+            undo = self._undo = deque(maxlen=self.depth)
+        undo.append(self.state)
+        if self._redo:
+            self._redo = ()
+        self.state = state
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        """Step back one state and return it, or None if there is none."""
+        if not self._undo:
+            return None
+        previous = self._undo.pop()
+        redo = self._redo
+        if not redo:
+            redo = self._redo = deque()
+        redo.append(self.state)
+        self.state = previous
+        return previous
+
+    def redo(self):
+        """Step forward again after undo() and return the state, or None."""
+        if not self._redo:
+            return None
+        following = self._redo.pop()
+        undo = self._undo
+        if not undo:
+            undo = self._undo = deque(maxlen=self.depth)
+        undo.append(self.state)
+        self.state = following
+        return following
+
+    def checkpoint(self, name):
+        """Remember the current state under a name."""
+        self.checkpoints[name] = self.state
+
+    def restore(self, name):
+        """Return to a named checkpoint, which can itself be undone; None if there is no such name."""
+        state = self.checkpoints.get(name)
+        if state is not None:
+            self.record(state)
+        return state
+
+    def fork(self):
+        """Return an independent history that starts out identical to this one."""
+        branch = History(self.state, self.depth)
+        branch._undo = deque(self._undo, maxlen=self.depth)
+        branch._redo = deque(self._redo)
+        branch.checkpoints = dict(self.checkpoints)
+        return branch
+
+    def stacks(self):
+        """Return the undo and redo stacks as lists, newest first."""
+        return list(reversed(self._undo)), list(reversed(self._redo))
+
+    @classmethod
+    def from_stacks(cls, state, undo=(), redo=(), checkpoints=None, depth=UNDO_DEPTH):
+        """Rebuild a history from its current state and stacks as stacks() returns them."""
+        history = cls(state, depth)
+        history._undo = deque(reversed(undo), maxlen=depth)
+        history._redo = deque(reversed(redo))
+        history.checkpoints = dict(checkpoints or {})
+        return history
@@ -0,0 +1,370 @@
+"""
+Stateless HTTP/JSON mode for the Haunted Mansion Escape Game.
+
+The server keeps nothing between requests. Every response carries the
+whole game as a compact signed token, and the next request sends that
+token back together with the player's input. Any process on any node
+that knows the secret can play any turn, so nodes can sit behind a plain
+load balancer with no sticky sessions and no shared store.
+
+    python httpapi.py --port 8080 --processes 4 --secret s3cret
+
+    POST /new   {"name": "Bob"}
+    POST /turn  {"token": "...", "input": ["go north"]}
+    GET  /health
+
+Both POSTs answer with
+
+    {"token": "...", "text": "...", "prompt": "...", "done": false}
+
+where text is everything the turn printed, including the next screen,
+and prompt is what the player is being asked. Input lines are what a
+player would type at the console: a menu number or a typed command such
+as "take silver key". A command that asks a follow-up question, such as
+"Use item" from the menu, returns that question as the prompt with the
+token unchanged; send the same input again with the answer appended.
+
+A token is the player's name and the StateCodec bytes of their state,
+behind a version byte and the world fingerprint, followed by a
+truncated HMAC-SHA256, all base64url encoded. On the stock mansion a
+token is about 40 characters. Tokens grow with the mansion, since every
+room has a visited bit, so this mode suits small and medium worlds.
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import gc
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+import struct
+import sys
+
+from engine import stock_engine
+from main import HauntedMansionGame, Player, WorldTemplate
+from replay import run_to_completion
+from statecodec import StateCodec, world_fingerprint
+
+
+TOKEN_VERSION = 1
+TOKEN_HEADER = struct.Struct("<BIB")  # version, world fingerprint, name size
+MAC_SIZE = 16
+MAX_NAME = 40
+MAX_INPUT_LINES = 8
+MAX_BODY = 16384
+CHOICE_PROMPT = "\nEnter the number of your choice: "
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large"}
+
+
+class TokenError(Exception):
+    """Raised for a token that is malformed, forged or from another world."""
+
+
+class RequestError(Exception):
+    """Raised for a request the API cannot serve; carries the HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StateTokens:
+    """Signs a player's name and game state into a token, and checks tokens sent back."""
+
+    def __init__(self, engine, secret):
+        self.codec = StateCodec(engine.world)
+        self.key = secret.encode() if isinstance(secret, str) else secret
+        self.fingerprint = world_fingerprint(engine.world)
+
+    def _mac(self, payload):
+        return hmac.new(self.key, payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+    def encode(self, name, state):
+        """Return the token for a player's name and state."""
+        name = name.encode()[:MAX_NAME]
+        payload = TOKEN_HEADER.pack(TOKEN_VERSION, self.fingerprint, len(name)) + name + self.codec.to_bytes(state)
+        return base64.urlsafe_b64encode(payload + self._mac(payload)).rstrip(b"=").decode()
+
+    def canonical(self, state):
+        """Return a state as decoding its token gives it back, with room items in world order."""
+        return self.codec.from_bytes(self.codec.to_bytes(state))
+
+    def decode(self, token):
+        """Return (name, state) from a token, or raise TokenError."""
+        try:
+            data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (binascii.Error, ValueError):
+            raise TokenError("Token is not valid base64") from None
+        payload, mac = data[:-MAC_SIZE], data[-MAC_SIZE:]
+        if len(payload) < TOKEN_HEADER.size or not hmac.compare_digest(mac, self._mac(payload)):
+            raise TokenError("Token signature does not match")
+        version, fingerprint, name_size = TOKEN_HEADER.unpack_from(payload)
+        if version != TOKEN_VERSION or fingerprint != self.fingerprint:
+            raise TokenError("Token belongs to another version or world")
+        state_bytes = payload[TOKEN_HEADER.size + name_size:]
+        if len(state_bytes) != self.codec.byte_length:
+            raise TokenError("Token state has the wrong size")
+        name = payload[TOKEN_HEADER.size:TOKEN_HEADER.size + name_size].decode(errors="replace")
+        return name, self.codec.from_bytes(state_bytes)
+
+
+class NeedInput(Exception):
+    """Raised when a turn asks for more input than the request brought."""
+
+    def __init__(self, prompt):
+        super().__init__(prompt)
+        self.prompt = prompt
+
+
+class TurnIO:
+    """Collects one turn's output and answers its prompts from the request's input lines."""
+
+    def __init__(self, inputs=()):
+        self.lines = []
+        self.inputs = iter(inputs)
+
+    def write(self, text=""):
+        self.lines.append(text)
+
+    def flush(self, prompt=""):
+        pass
+
+    async def read(self, prompt):
+        line = next(self.inputs, None)
+        if line is None:
+            raise NeedInput(prompt)
+        self.lines.append(prompt + line)
+        return line
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        pass
+
+    async def delay(self, seconds):
+        pass
+
+    def clear(self):
+        pass
+
+    def text(self):
+        return "\n".join(self.lines)
+
+
+class StatelessGame:
+    """Plays single turns from signed tokens without keeping anything between them."""
+
+    def __init__(self, engine, secret):
+        self.engine = engine
+        self.menus = WorldTemplate.of(engine).menus
+        self.tokens = StateTokens(engine, secret)
+
+    def _game(self, io, name, state):
+        game = HauntedMansionGame(io=io, engine=self.engine, menus=self.menus)
+        game.player = Player(name, self.engine.world.bag_capacity, state.room)
+        game.state = state
+        game.mirror_state()
+        return game
+
+    def new_game(self, name):
+        """Start a game for a player and return the first response."""
+        name = name.strip()[:MAX_NAME] or "Adventurer"
+        io = TurnIO()
+        game = self._game(io, name, self.engine.initial_state())
+        io.write(f"Welcome, {game.player.name}! Your adventure begins now...")
+        return self._screen(game, io)
+
+    def turn(self, token, inputs):
+        """Play one turn from a token and the player's input lines."""
+        name, state = self.tokens.decode(token)
+        io = TurnIO(inputs)
+        game = self._game(io, name, state)
+        if state.escaped or state.quit:
+            return {"token": token, "text": "The game is over.", "prompt": None, "done": True}
+        game.menu = self.menus.menu_for(state.room, self.engine.items_in_room(state, state.room))
+        game.command_list = game.menu.commands
+        try:
+            run_to_completion(game.handle_player_input())
+        except NeedInput as question:
+            # Nothing the turn did before asking counts; the same token is played again with the answer
+            return {"token": token, "text": io.text(), "prompt": question.prompt, "done": False}
+        return self._screen(game, io)
+
+    def _screen(self, game, io):
+        done = not game.game_running
+        if done:
+            io.write("\nThank you for playing the Haunted Mansion Escape Game!")
+        else:
+            # Show the screen from the state the token gives back, so the numbered choices match the next turn's
+            previous = game.state
+            game.state = self.tokens.canonical(previous)
+            game.mirror_state(previous)
+            run_to_completion(game.display_room_info())
+            if game.check_win_condition():
+                run_to_completion(game.end_game_victory())
+                done = True
+            else:
+                game.show_choices()
+        return {"token": self.tokens.encode(game.player.name, game.state), "text": io.text(),
+                "prompt": None if done else CHOICE_PROMPT, "done": done}
+
+    def handle(self, method, path, body):
+        """Serve one request and return (status, JSON-ready payload)."""
+        try:
+            if path == "/health":
+                if method != "GET":
+                    raise RequestError(405, "Use GET")
+                return 200, {"status": "ok"}
+            if path not in ("/new", "/turn"):
+                raise RequestError(404, "No such endpoint")
+            if method != "POST":
+                raise RequestError(405, "Use POST")
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError:
+                raise RequestError(400, "Body is not JSON") from None
+            if not isinstance(request, dict):
+                raise RequestError(400, "Body must be a JSON object")
+            if path == "/new":
+                name = request.get("name", "")
+                if not isinstance(name, str):
+                    raise RequestError(400, "name must be a string")
+                return 200, self.new_game(name)
+            token = request.get("token")
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            if not isinstance(token, str) or not isinstance(inputs, list) or \
+                    not all(isinstance(line, str) for line in inputs) or len(inputs) > MAX_INPUT_LINES:
+                raise RequestError(400, f"Send a token and up to {MAX_INPUT_LINES} input lines")
+            return 200, self.turn(token, inputs)
+        except TokenError as error:
+            return 403, {"error": str(error)}
+        except RequestError as error:
+            return error.status, {"error": str(error)}
+
+
+def parse_head(head):
+    """Return (method, path, version, headers, body length) from a request head, or raise RequestError."""
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    parts = request_line.split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise RequestError(400, "Malformed request line")
+    method, path, version = parts
+    headers = {}
+    for line in header_lines:
+        if not line:
+            continue
+        name, colon, value = line.partition(":")
+        if not colon or not name.strip():
+            raise RequestError(400, "Malformed header")
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get("content-length", "0")
+    if not (length.isascii() and length.isdigit()):
+        raise RequestError(400, "Content-Length must be a whole number of bytes")
+    if int(length) > MAX_BODY:
+        raise RequestError(413, "Request body too large")
+    return method, path, version, headers, int(length)
+
+
+class HttpServer:
+    """A minimal HTTP/1.1 server with keep-alive in front of a StatelessGame."""
+
+    def __init__(self, game):
+        self.game = game
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until the client is done with it."""
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                try:
+                    method, path, version, headers, length = parse_head(head)
+                except RequestError as error:
+                    # The body is left unread, so the connection cannot carry another request
+                    status, payload = error.status, {"error": str(error)}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = self.game.handle(method, path.split("?", 1)[0], body)
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode()
+                connection = "" if keep_alive else "Connection: close\r\n"
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n{connection}\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=8080, reuse_port=False, backlog=4096):
+        """Listen for requests until cancelled."""
+        server = await asyncio.start_server(self.handle_connection, host, port, reuse_port=reuse_port,
+                                            backlog=backlog)
+        async with server:
+            await server.serve_forever()
+
+
+def node_engine(world_file=None):
+    """Return the engine for the world a node serves."""
+    return HauntedMansionGame(world_file=world_file).engine if world_file else stock_engine()
+
+
+def run_node(host, port, secret, world_file=None, reuse_port=False):
+    """Serve the API from this process."""
+    try:
+        asyncio.run(HttpServer(StatelessGame(node_engine(world_file), secret)).serve(host, port, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve the game as a stateless HTTP/JSON API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="server processes sharing the port (needs SO_REUSEPORT when above 1)")
+    parser.add_argument("--secret", default=os.environ.get("MANSION_SECRET"),
+                        help="key that signs tokens; every node must share it (default: $MANSION_SECRET)")
+    parser.add_argument("--world", metavar="FILE", help="host the world described in FILE (.json, .toml or compiled .hmw)")
+    args = parser.parse_args()
+
+    secret = args.secret
+    if not secret:
+        secret = secrets.token_hex(16)
+        print("No --secret given; tokens will only be accepted by this server until it restarts")
+    print(f"Haunted mansion HTTP API listening on {args.host}:{args.port} with {args.processes} process(es)")
+    if args.processes == 1:
+        run_node(args.host, args.port, secret, args.world)
+        return
+    # Built before the workers fork, so they share one copy of the world's rooms, items and menus
+    WorldTemplate.of(node_engine(args.world)).warm()
+    gc.freeze()  # Keeps the collector from touching, and so copying, those pages in every worker
+    nodes = [multiprocessing.Process(target=run_node, args=(args.host, args.port, secret, args.world, True))
+             for _ in range(args.processes)]
+    for node in nodes:
+        node.start()
+    # Being terminated takes the worker processes down too, so none is left holding the port
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for node in nodes:
+            node.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for node in nodes:
+            node.terminate()
+
+
+if __name__ == "__main__":
+    main()
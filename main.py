@@ -8,13 +8,27 @@ Date: 7/3/2025
 Version: 1.4 - Fixed garden escape win condition
 """
 
+import argparse
+import asyncio
+import itertools
 import time
 import os
+import sys
+
+from engine import Engine, World, Action, MOVE, PICKUP, DROP, USE, LOOK, BAG, QUIT
+from history import UNDO_DEPTH, History
+from menus import MenuCache
+from routes import RouteCache
+from persistence import SaveStore, SaveError
+from renderer import FrameRenderer
+from worlddata import LazyRooms, SessionRooms, open_world
 
 
 class Item:
     """Class to represent items that can be collected in the game."""
     
+    __slots__ = ("name", "description", "use_description")
+    
     def __init__(self, name, description, use_description=""):
         self.name = name
         self.description = description
@@ -24,204 +38,434 @@ class Item:
         return f"{self.name}: {self.description}"
 
 
+class ItemCollection:
+    """Items kept in the order they were added, looked up by name without a scan."""
+    
+    __slots__ = ("_items",)
+    
+    def __init__(self, items=()):
+        self._items = {}  # Lower-cased name -> Item, in insertion order
+        for item in items:
+            self.add(item)
+    
+    def add(self, item):
+        """Add an item at the end."""
+        self._items[item.name.lower()] = item
+    
+    def remove(self, item_name):
+        """Remove and return the item with this name, or None if it isn't here."""
+        return self._items.pop(item_name.lower(), None)
+    
+    def get(self, item_name):
+        """Return the item with this name, or None."""
+        return self._items.get(item_name.lower())
+    
+    def clear(self):
+        """Remove every item."""
+        self._items.clear()
+    
+    def __contains__(self, item_name):
+        return item_name.lower() in self._items
+    
+    def __iter__(self):
+        return iter(self._items.values())
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __getitem__(self, index):
+        """Return the item at a position in display order."""
+        if index < 0:
+            index += len(self._items)
+        if not 0 <= index < len(self._items):
+            raise IndexError("item index out of range")
+        return next(itertools.islice(self._items.values(), index, None))
+
+
 class Player:
     """Class to represent the player character."""
     
-    def __init__(self, name):
+    __slots__ = ("name", "current_room", "bag", "bag_capacity", "has_spoken_to_odette",
+                 "game_complete")
+    
+    def __init__(self, name, bag_capacity=4, current_room="entrance_hall"):
         self.name = name
-        self.current_room = "entrance_hall"
-        self.bag = []  # List to store collected items (max 4)
-        self.bag_capacity = 4
+        self.current_room = current_room
+        self.bag = ItemCollection()  # Collected items, at most bag_capacity of them
+        self.bag_capacity = bag_capacity
         self.has_spoken_to_odette = False
         self.game_complete = False
     
     def add_item(self, item):
         """Add an item to the player's bag if there's space."""
         if len(self.bag) < self.bag_capacity:
-            self.bag.append(item)
+            self.bag.add(item)
             return True
         return False
     
     def remove_item(self, item_name):
         """Remove an item from the player's bag."""
-        for item in self.bag:
-            if item.name.lower() == item_name.lower():
-                self.bag.remove(item)
-                return item
-        return None
+        return self.bag.remove(item_name)
     
     def has_item(self, item_name):
         """Check if player has a specific item."""
-        return any(item.name.lower() == item_name.lower() for item in self.bag)
+        return item_name in self.bag
     
-    def show_bag(self):
+    def show_bag(self, write=print):
         """Display the contents of the player's bag."""
         if not self.bag:
-            print("Your bag is empty.")
+            write("Your bag is empty.")
         else:
-            print(f"Your bag contains ({len(self.bag)}/{self.bag_capacity}):")
+            write(f"Your bag contains ({len(self.bag)}/{self.bag_capacity}):")
             for i, item in enumerate(self.bag, 1):
-                print(f"  {i}. {item}")
+                write(f"  {i}. {item}")
 
 
 class Room:
     """Class to represent rooms in the mansion."""
     
+    __slots__ = ("name", "description", "items", "connections", "visited")
+    
     def __init__(self, name, description, items=None, connections=None):
         self.name = name
         self.description = description
-        self.items = items or []
+        self.items = ItemCollection(items or ())
         self.connections = connections or {}
         self.visited = False
     
     def get_available_directions(self):
         """Get list of available directions from this room."""
         return list(self.connections.keys())
+    
+    def copy(self):
+        """Return a copy of this room that shares its items with it until they are replaced."""
+        room = Room.__new__(Room)
+        room.name = self.name
+        room.description = self.description
+        room.items = self.items
+        room.connections = self.connections
+        room.visited = self.visited
+        return room
+
+
+class ConsoleIO:
+    """Terminal input and output for a single local player."""
+    
+    def __init__(self, renderer=None):
+        # Output is buffered per screen and sent in one write when the game waits for the player
+        self.renderer = renderer or FrameRenderer(diff=sys.stdout.isatty())
+        if os.name == 'nt':
+            os.system('')  # Turns on ANSI escape sequences in the Windows console
+    
+    def write(self, text=""):
+        """Show a line of text."""
+        self.renderer.write(text)
+    
+    def flush(self):
+        """Send buffered output to the terminal."""
+        output = self.renderer.render()
+        if output:
+            sys.stdout.write(output)
+            sys.stdout.flush()
+    
+    async def read(self, prompt):
+        """Ask the player for a line of input."""
+        self.flush()
+        line = input(prompt)
+        self.renderer.record_input(prompt, line)
+        return line
+    
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        """Wait for the player to press Enter."""
+        await self.read(prompt)
+    
+    async def delay(self, seconds):
+        """Pause for dramatic effect."""
+        self.flush()
+        time.sleep(seconds)
+    
+    def clear(self):
+        """Clear the screen for a cleaner interface."""
+        self.renderer.clear()
+
+
+class WorldTemplate:
+    """The parts of a world no game changes, built once and shared by every game played on it.
+    
+    Items, rooms as they start out, the starting door states, the engine
+    and menus all live here, so a new game only allocates what it goes on
+    to change: its own copy of a room it alters (see SessionRooms) and of
+    the door states once a door flips. A server that builds the template
+    and calls warm() before forking its workers has them share its pages.
+    """
+    
+    def __init__(self, index, bag_capacity=None, engine=None):
+        self.index = index
+        self.items = {
+            item_id: Item(item["name"], item["description"], item.get("use_description", ""))
+            for item_id, item in index.items.items()
+        }
+        # Rooms are built the first time they are needed, so large worlds start instantly
+        self.rooms = LazyRooms(index, self.build_room)
+        # Door states every game starts with - True means unlocked, False means locked
+        self.door_states = {door: not spec.get("locked", True) for door, spec in index.doors.items()}
+        if engine is None:
+            engine = Engine(World(self.rooms, self.items, {door: spec["key"] for door, spec in index.doors.items()},
+                                  [door for door, is_open in self.door_states.items() if is_open],
+                                  start_room=index.start_room, odette_room=index.odette_room,
+                                  exit_room=index.exit_room, bag_capacity=bag_capacity or index.bag_capacity,
+                                  effect_items=index.effect_items, index=index))
+        self.engine = engine
+        self.menus = MenuCache(engine.world)
+        self.initial_state = engine.initial_state()  # States never change, so every game can start from this one
+        engine.template = self
+    
+    @classmethod
+    def of(cls, engine):
+        """Return the template of the games played on an engine, building it the first time."""
+        if engine.template is None:
+            cls(engine.world.index, engine.world.bag_capacity, engine)
+        return engine.template
+    
+    @classmethod
+    def opened(cls, world_file=None, bag_capacity=None):
+        """Return the template for games of a world file made without an engine, building it the first time."""
+        index = open_world(world_file)
+        key = (index, bag_capacity or index.bag_capacity)
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = cls(index, bag_capacity)
+        return template
+    
+    def build_room(self, room_id):
+        """Create a room from the world index, holding the items it starts with."""
+        index = self.index
+        record = index.room_record(room_id)
+        items = [self.items[item_id] for item_id in index.initial_room_items[index.room_index[room_id]]]
+        return Room(record["name"], record["description"], items, index.connections(room_id))
+    
+    def warm(self):
+        """Build every room and the menus of rooms as they start out now, rather than in each game that needs them."""
+        index = self.index
+        for room_id in index.room_ids:
+            self.rooms[room_id]
+        # The menu cache only keeps so many, so a large world has just its first rooms' menus built
+        for room_id, item_ids in itertools.islice(zip(index.room_ids, index.initial_room_items), self.menus.maxsize):
+            self.menus.menu_for(room_id, item_ids)
+        return self
+
+
+_templates = {}  # (WorldIndex, bag capacity) -> WorldTemplate of games made without an engine
 
 
 class HauntedMansionGame:
     """Main game class that handles the game logic and flow."""
     
-    def __init__(self):
+    def __init__(self, io=None, engine=None, menus=None, saves=None, bag_capacity=None, world_file=None,
+                 shared=None, event_log=None, bus=None, undo_depth=UNDO_DEPTH):
+        self.io = io or ConsoleIO()
+        # In a shared mansion (see sharedworld.py) the room items and doors belong to every player
+        self.shared = shared
+        if shared is not None:
+            engine = shared.engine
         self.player = None
         self.rooms = {}
         self.game_items = {}
         self.game_running = True
-        self.command_list = []
-        # Track door states - True means unlocked, False means locked
-        self.door_states = {
-            "pantry": False,  # Pantry door starts locked
-            "garden": False   # Garden gate starts locked
-        }
+        self.command_list = ()
+        self.menu = None
+        self.door_states = {}
+        # A shared engine brings its world; world_file and bag_capacity only apply without one
+        if engine is not None:
+            self.template = WorldTemplate.of(engine)
+        else:
+            self.template = WorldTemplate.opened(world_file, bag_capacity)
+        self.world_index = self.template.index
+        self.bag_capacity = bag_capacity or self.world_index.bag_capacity
         self.setup_game()
+        # Sessions share the template's engine; it only reads the static parts of the world
+        self.engine = self.template.engine
+        self.world = self.engine.world
+        self.menus = menus or self.template.menus
+        self._routes = None  # RouteCache, built the first time the player travels
+        self.saves = saves
+        self.save_slot = None
+        self.state = self.template.initial_state if shared is None else shared.join()
+        self.undo_depth = undo_depth  # Turns undo can step back; None for every turn
+        self.history = History(self.state, undo_depth)
+        self.odette_pending = False
+        # Every action is written to the event log, if any, for analytics.py
+        self.events = event_log.session(self.world) if event_log is not None else None
+        self.bus = bus  # EventBus that hears about every action's events, if any
     
     def clear_screen(self):
         """Clear the screen for a cleaner interface."""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        self.io.clear()
     
     def setup_game(self):
         """Initialize the game world, rooms, and items."""
-        # Create game items
-        self.game_items = {
-            "silver_key": Item("Silver Key", "An ornate silver key with intricate engravings", 
-                             "Opens locked doors in the mansion"),
-            "golden_key": Item("Golden Key", "A heavy golden key that gleams in the light",
-                             "Opens the main door to escape"),
-            "candle": Item("Candle", "A flickering candle that provides light",
-                          "Illuminates dark areas"),
-            "holy_water": Item("Holy Water", "A small vial of blessed water",
-                              "Protects against evil spirits"),
-            "portrait": Item("Portrait", "A painting of a young French woman",
-                           "Odette's portrait from when she was alive"),
-            "music_box": Item("Music Box", "An antique music box with a dancing figure",
-                            "Plays a haunting melody"),
-            "old_diary": Item("Old Diary", "Odette's personal diary from long ago",
-                            "Contains Odette's memories and secrets")
-        }
+        template = self.template
+        # Items never change, and rooms are the template's until this game changes one
+        self.game_items = template.items
+        self.rooms = SessionRooms(template.rooms)
         
-        # Create rooms
-        self.rooms = {
-            "entrance_hall": Room(
-                "Entrance Hall",
-                "A grand entrance hall with a dusty chandelier hanging overhead. "
-                "The air is thick with the scent of old roses and decay. "
-                "Moonlight filters through stained glass windows.",
-                items=[self.game_items["candle"]],
-                connections={"north": "living_room", "east": "dining_room", "west": "library", "south": "garden"}
-            ),
-            "living_room": Room(
-                "Living Room",
-                "A once-elegant living room with covered furniture and cobwebs. "
-                "A cold fireplace dominates one wall. The atmosphere feels heavy.",
-                items=[self.game_items["silver_key"]],
-                connections={"south": "entrance_hall", "east": "kitchen", "north": "staircase"}
-            ),
-            "dining_room": Room(
-                "Dining Room",
-                "A formal dining room with a long table set for dinner, "
-                "though the food has long since turned to dust. "
-                "Portraits line the walls, their eyes seeming to follow you.",
-                items=[self.game_items["holy_water"]],
-                connections={"west": "entrance_hall", "north": "kitchen"}
-            ),
-            "kitchen": Room(
-                "Kitchen",
-                "An old-fashioned kitchen with copper pots and pans hanging from hooks. "
-                "The hearth is cold and dark. Something moves in the shadows.",
-                items=[self.game_items["music_box"]],
-                connections={"west": "living_room", "south": "dining_room", "north": "pantry"}
-            ),
-            "library": Room(
-                "Library",
-                "A vast library with towering bookshelves reaching to the ceiling. "
-                "Books are scattered on the floor, and the air smells of old paper. "
-                "A reading chair sits by the window.",
-                items=[self.game_items["old_diary"]],
-                connections={"east": "entrance_hall", "north": "study"}
-            ),
-            "study": Room(
-                "Study",
-                "A private study with a large desk covered in papers. "
-                "Candlesticks and ink bottles are scattered about. "
-                "This feels like a place where important decisions were made.",
-                items=[],
-                connections={"south": "library", "east": "staircase"}
-            ),
-            "staircase": Room(
-                "Grand Staircase",
-                "A magnificent staircase curves upward to the second floor. "
-                "The banister is carved with intricate details. "
-                "You can hear faint whispers echoing from above.",
-                items=[],
-                connections={"south": "living_room", "west": "study", "up": "bedroom"}
-            ),
-            "pantry": Room(
-                "Pantry",
-                "A small pantry with empty shelves and broken jars. "
-                "The air is stale and musty. Something glitters on the floor.",
-                items=[self.game_items["golden_key"]],
-                connections={"south": "kitchen"}
-            ),
-            "bedroom": Room(
-                "Odette's Bedroom",
-                "A beautifully preserved bedroom with French furniture. "
-                "The room feels different from the rest of the mansion - warmer, lived-in. "
-                "A spectral figure sits by the window, humming softly.",
-                items=[self.game_items["portrait"]],
-                connections={"down": "staircase"}
-            ),
-            "garden": Room(
-                "Garden",
-                "A moonlit garden behind the mansion. The exit gate stands before you, "
-                "but it's locked with a heavy chain. Freedom is so close...",
-                items=[],
-                connections={"north": "entrance_hall"}
-            )
-        }
+        # Track door states - True means unlocked, False means locked; shared until a door flips
+        self.door_states = template.door_states
+    
+    @property
+    def routes(self):
+        """Shortest routes for this player, cached from the first time they travel."""
+        if self._routes is None:
+            self._routes = RouteCache(self.world)
+        return self._routes
+    
+    def set_door_state(self, door_name, is_open):
+        """Record whether a door is unlocked, copying the shared door states the first time one flips."""
+        if self.door_states[door_name] != is_open:
+            if self.door_states is self.template.door_states:
+                self.door_states = dict(self.door_states)
+            self.door_states[door_name] = is_open
+    
+    def items_to_change(self, room_id):
+        """Return the items of this game's own copy of a room, ready to change."""
+        room = self.rooms.own(room_id)
+        if room.items is self.template.rooms[room_id].items:
+            room.items = ItemCollection(room.items)
+        return room.items
     
     def is_door_accessible(self, from_room, to_room):
         """Check if a door between rooms is accessible."""
-        if to_room == "pantry":
-            return self.door_states["pantry"]
-        elif to_room == "garden":
-            return self.door_states["garden"]
-        return True  # All other doors are always accessible
+        return self.engine.is_door_accessible(self.state, to_room)
     
     def get_door_key(self, door_name):
         """Get the key needed for a specific door."""
-        if door_name == "pantry":
-            return "silver_key"
-        elif door_name == "garden":
-            return "golden_key"
-        return None
+        door = self.world_index.doors.get(door_name)
+        return door["key"] if door else None
     
     def toggle_door(self, door_name):
         """Toggle the state of a door (lock/unlock)."""
         if door_name in self.door_states:
-            self.door_states[door_name] = not self.door_states[door_name]
+            self.state = self.engine.toggle_door(self.state, door_name)
+            self.set_door_state(door_name, door_name in self.state.doors)
             return True
         return False
     
+    def apply_action(self, action):
+        """Run an action through the engine and mirror the result onto the game objects."""
+        previous = self.state
+        self.state, events = (self.engine if self.shared is None else self.shared).step(previous, action)
+        state = self.state
+        if self.events is not None:
+            self.events.emit(previous, action, state, events)
+        # Quitting only ends this session, so it is neither saved nor undoable
+        if state is not previous and action.kind != QUIT:
+            if self.shared is None:  # A shared mansion cannot turn back time, so it keeps no history
+                self.history.record(state)
+            if self.save_slot is not None:
+                self.save_slot.record(action, state)
+        if self.player is not None:
+            self.player.current_room = state.room
+            self.player.has_spoken_to_odette = state.spoken_to_odette
+        
+        for event in events:
+            if event.kind == "picked_up":
+                item = self.game_items[event.subject]
+                self.player.bag.add(item)
+                self.mirror_item_taken(event.detail, item)
+            elif event.kind == "dropped":
+                item = self.game_items[event.subject]
+                self.player.bag.remove(item.name)
+                self.mirror_item_left(event.detail, item)
+            elif event.kind == "consumed":
+                self.player.bag.remove(self.game_items[event.subject].name)
+            elif event.kind == "moved":
+                self.rooms.own(event.detail).visited = True
+            elif event.kind == "door_toggled":
+                self.set_door_state(event.subject, event.detail)
+            elif event.kind == "odette_met":
+                self.odette_pending = True
+            elif event.kind == "quit":
+                self.game_running = False
+        if self.bus is not None:
+            self.bus.publish(self, events)
+        return events
+    
+    def mirror_state(self, previous=None):
+        """Copy the engine state onto the player, rooms and door states.
+        
+        Given the state the game objects currently show, only the rooms
+        that differ from it are touched.
+        """
+        state = self.state
+        self.player.current_room = state.room
+        self.player.bag.clear()
+        for item_id in state.bag:
+            self.player.bag.add(self.game_items[item_id])
+        self.player.has_spoken_to_odette = state.spoken_to_odette
+        if previous is not None:
+            room_ids = self.world.room_ids
+            changed = {room_ids[index] for index in state.room_items.changes(previous.room_items)}
+            changed.update(state.visited.changes(previous.visited))
+            for room_id in changed:
+                self.mirror_room(room_id)
+        else:
+            loaded = self.rooms.loaded
+            for room_id, item_ids, initial in zip(self.world.room_ids, state.room_items,
+                                                  self.world.initial_room_items):
+                # Shared rooms show their starting items, so only changed ones need copying
+                if room_id not in loaded and item_ids == initial and room_id not in state.visited:
+                    continue
+                self.mirror_room(room_id)
+        for door in self.world.doors:
+            self.set_door_state(door, door in state.doors)
+    
+    def mirror_room(self, room_id):
+        """Copy one room's items and visited flag from the engine state."""
+        state = self.state
+        item_ids = self.engine.items_in_room(state, room_id)
+        visited = room_id in state.visited
+        initial = item_ids == self.world.initial_room_items[self.world.room_index[room_id]]
+        shared = self.template.rooms[room_id]
+        room = self.rooms[room_id]
+        if room is shared and initial and not visited:
+            return  # The shared room already shows this
+        room = self.rooms.own(room_id)
+        if room.items is not shared.items or not initial:
+            items = self.items_to_change(room_id)
+            items.clear()
+            for item_id in item_ids:
+                items.add(self.game_items[item_id])
+        room.visited = visited
+    
+    def mirror_item_taken(self, room_id, item):
+        """Show an item as gone from a room."""
+        if self.shared is not None:
+            self.mirror_room(room_id)  # Others may have changed the room since this player last looked
+        else:
+            self.items_to_change(room_id).remove(item.name)
+    
+    def mirror_item_left(self, room_id, item):
+        """Show an item as lying in a room."""
+        if self.shared is not None:
+            self.mirror_room(room_id)
+        else:
+            self.items_to_change(room_id).add(item)
+    
+    def mirror_shared(self):
+        """Catch up with what other players did to this room and to the doors."""
+        self.mirror_room(self.state.room)
+        doors = self.state.doors
+        for door in self.world.doors:
+            self.set_door_state(door, door in doors)
+    
+    def set_state(self, state):
+        """Jump to another state, such as an undone turn, and save it."""
+        previous = self.state
+        self.state = state
+        self.mirror_state(previous)
+        if self.save_slot is not None:
+            self.save_slot.checkpoint(state)
+    
     def get_door_status_message(self, door_name):
         """Get a message describing the current door status."""
         if door_name not in self.door_states:
@@ -232,408 +476,520 @@ class HauntedMansionGame:
         else:
             return f"The {door_name} is currently locked."
     
-    def start_game(self):
+    async def start_game(self):
         """Start the game and get player's name."""
+        self.show_title()
+        await self.begin()
+        await self.game_loop()
+    
+    def show_title(self):
+        """Show the title screen."""
         self.clear_screen()
-        print("=" * 60)
-        print("    WELCOME TO THE HAUNTED MANSION ESCAPE GAME")
-        print("=" * 60)
-        print("\nYou find yourself standing before an old, imposing mansion.")
-        print("The wind howls through the trees, and lightning flashes overhead.")
-        print("You must enter and find a way to escape...")
-        print("\nBut beware - you are not alone in this place.")
-        print("Odette, a French spirit, haunts these halls.")
-        print("She may help you... or she may not.")
-        print("\n" + "=" * 60)
-        
-        player_name = input("\nEnter your character's name: ").strip()
+        self.io.write("=" * 60)
+        self.io.write("    WELCOME TO THE HAUNTED MANSION ESCAPE GAME")
+        self.io.write("=" * 60)
+        self.io.write("\nYou find yourself standing before an old, imposing mansion.")
+        self.io.write("The wind howls through the trees, and lightning flashes overhead.")
+        self.io.write("You must enter and find a way to escape...")
+        self.io.write("\nBut beware - you are not alone in this place.")
+        self.io.write("Odette, a French spirit, haunts these halls.")
+        self.io.write("She may help you... or she may not.")
+        self.io.write("\n" + "=" * 60)
+    
+    async def begin(self):
+        """Ask the player's name, offer their saved game if there is one, and welcome them."""
+        player_name = (await self.io.read("\nEnter your character's name: ")).strip()
         if not player_name:
             player_name = "Adventurer"
         
-        self.player = Player(player_name)
-        print(f"\nWelcome, {self.player.name}! Your adventure begins now...")
-        input("\nPress Enter to continue...")
-        self.game_loop()
+        self.player = Player(player_name, self.world.bag_capacity, self.world.start_room)
+        if self.saves is not None:
+            await self.open_save()
+        self.io.write(f"\nWelcome, {self.player.name}! Your adventure begins now...")
+        await self.io.pause()
+    
+    async def open_save(self):
+        """Offer to continue the player's saved game, then save every turn from here on."""
+        self.save_slot = self.saves.slot(self.player.name)
+        if self.save_slot.exists():
+            answer = (await self.io.read("\nA saved game was found. Continue where you left off? (y/n): "))
+            if answer.strip().lower().startswith("y"):
+                try:
+                    self.state = self.save_slot.load()
+                except (SaveError, OSError):
+                    self.io.write("The saved game could not be read. Starting a new game.")
+                else:
+                    self.mirror_state()
+                    self.history = History(self.state, self.undo_depth)
+                    return
+        self.save_slot.start(self.state)
     
-    def game_loop(self):
+    def close(self):
+        """Release the save file, if any."""
+        if self.save_slot is not None:
+            self.save_slot.close()
+    
+    async def game_loop(self):
         """Main game loop."""
         while self.game_running and not self.player.game_complete:
-            self.clear_screen()
-            self.display_room_info()
-            
-            # Check if player has won after room display
-            if self.check_win_condition():
-                self.end_game_victory()
+            if not await self.show_screen():
                 break
-                
-            self.show_choices()
-            self.handle_player_input()
+            await self.handle_player_input()
         
+        self.finish()
+    
+    async def show_screen(self):
+        """Show the current room and what can be done there; False once the player has won."""
+        self.clear_screen()
+        await self.display_room_info()
+        return await self.offer_choices()
+    
+    async def offer_choices(self):
+        """Show the choices, or the victory if the player has won; False once they have."""
+        # Check if player has won after room display
+        if self.check_win_condition():
+            await self.end_game_victory()
+            return False
+        
+        self.show_choices()
+        return True
+    
+    def finish(self):
+        """Say goodbye, unless the victory already did, and release the game's resources."""
         if not self.player.game_complete:
-            print("\nThank you for playing the Haunted Mansion Escape Game!")
+            self.io.write("\nThank you for playing the Haunted Mansion Escape Game!")
+        self.io.flush()
+        self.close()
     
-    def display_room_info(self):
+    async def display_room_info(self):
         """Display information about the current room."""
+        if self.shared is not None:
+            self.mirror_shared()
         current_room = self.rooms[self.player.current_room]
-        print("\n" + "=" * 50)
-        print(f"LOCATION: {current_room.name.upper()}")
-        print("=" * 50)
-        
-        # Special handling for Garden description
-        if current_room.name == "Garden":
-            if self.door_states["garden"]:
-                print("A moonlit garden behind the mansion. The exit gate stands open before you! Freedom is within reach...")
-            else:
-                print("A moonlit garden behind the mansion. The exit gate stands before you, but it's locked with a heavy chain.")
+        self.io.write("\n" + "=" * 50)
+        self.io.write(f"LOCATION: {current_room.name.upper()}")
+        self.io.write("=" * 50)
+        
+        # A room behind a door, such as the garden, may look different once it is unlocked
+        record = self.world_index.room_record(self.player.current_room)
+        if "unlocked_description" in record and self.door_states.get(self.player.current_room):
+            self.io.write(record["unlocked_description"])
         else:
-            print(current_room.description)
+            self.io.write(current_room.description)
         
         # Check for special room events
-        if current_room.name == "Odette's Bedroom" and not self.player.has_spoken_to_odette:
-            self.encounter_odette()
+        if self.odette_pending:
+            self.odette_pending = False
+            await self.encounter_odette()
         
-        # Show door status for relevant rooms
-        if self.player.current_room == "kitchen":
-            print(f"\n{self.get_door_status_message('pantry')}")
-        elif self.player.current_room == "entrance_hall":
-            print(f"\n{self.get_door_status_message('garden')}")
+        self.show_room_contents()
+    
+    def show_room_contents(self):
+        """Show the door status and items of the current room, and mark it visited."""
+        current_room = self.rooms[self.player.current_room]
+        record = self.world_index.room_record(self.player.current_room)
+        
+        # Show door status for rooms next to a locked door
+        if "door_status" in record:
+            self.io.write(f"\n{self.get_door_status_message(record['door_status'])}")
         
         # Show items in the room
         if current_room.items:
-            print(f"\nYou can see the following items here:")
+            self.io.write("\nYou can see the following items here:")
             for item in current_room.items:
-                print(f"  - {item.name}: {item.description}")
+                self.io.write(f"  - {item.name}: {item.description}")
         
-        current_room.visited = True
+        if not current_room.visited:
+            self.rooms.own(self.player.current_room).visited = True
     
     def show_choices(self):
         """Display available choices to the player with numbers."""
-        current_room = self.rooms[self.player.current_room]
-        print("\n" + "-" * 30)
-        print("WHAT WOULD YOU LIKE TO DO?")
-        print("-" * 30)
-        
-        # Reset command list for each display
-        self.command_list = []
-        
-        # Movement options
-        directions = current_room.get_available_directions()
-        if directions:
-            print("Movement options:")
-            for direction in directions:
-                destination = self.rooms[current_room.connections[direction]]
-                command = f"Go {direction} to {destination.name}"
-                self.command_list.append(("move", direction, command))
-                print(f"  {len(self.command_list)}. {command}")
-        
-        # Item options
-        if current_room.items:
-            print("\nItem options:")
-            for item in current_room.items:
-                command = f"Pick up {item.name}"
-                self.command_list.append(("pickup", item.name, command))
-                print(f"  {len(self.command_list)}. {command}")
-        
-        # General options
-        print("\nGeneral options:")
-        self.command_list.append(("bag", None, "Check bag"))
-        print(f"  {len(self.command_list)}. Check bag")
-        
-        self.command_list.append(("look", None, "Look around"))
-        print(f"  {len(self.command_list)}. Look around")
-        
-        self.command_list.append(("use", None, "Use item"))
-        print(f"  {len(self.command_list)}. Use item")
-        
-        self.command_list.append(("remove", None, "Remove item"))
-        print(f"  {len(self.command_list)}. Remove item")
-        
-        self.command_list.append(("quit", None, "Quit game"))
-        print(f"  {len(self.command_list)}. Quit game")
+        # Menus depend only on the room and its items, so they are built once and cached
+        state = self.state
+        self.menu = self.menus.menu_for(state.room, self.engine.items_in_room(state, state.room))
+        self.command_list = self.menu.commands
+        self.io.write(self.menu.text)
     
-    def handle_player_input(self):
-        """Handle player input using numbered commands."""
+    async def handle_player_input(self):
+        """Handle player input using numbered or typed commands."""
+        choice = (await self.io.read("\nEnter the number of your choice: ")).strip()
         try:
-            choice = input("\nEnter the number of your choice: ").strip()
-            if not choice:
-                print("Please enter a valid number.")
-                input("\nPress Enter to continue...")
-                return
-            
             choice_index = int(choice) - 1
-            
+        except ValueError:
+            command = self.menus.parse(self.menu, choice) if choice and self.menu else None
+            if command is None:
+                self.io.write("Please enter a valid number.")
+                await self.io.pause()
+                return
+        else:
             if choice_index < 0 or choice_index >= len(self.command_list):
-                print("Invalid choice number. Please try again.")
-                input("\nPress Enter to continue...")
+                self.io.write("Invalid choice number. Please try again.")
+                await self.io.pause()
                 return
-            
-            action_type, data, command = self.command_list[choice_index]
-            
-            if action_type == "move":
-                self.move_player(data)
-            elif action_type == "pickup":
-                self.pick_up_item(data)
-                input("\nPress Enter to continue...")
-            elif action_type == "bag":
-                self.player.show_bag()
-                input("\nPress Enter to continue...")
-            elif action_type == "look":
-                self.look_around()
-                input("\nPress Enter to continue...")
-            elif action_type == "use":
-                self.use_item_menu()
-            elif action_type == "remove":
-                self.remove_item_from_bag()
-            elif action_type == "quit":
-                self.game_running = False
-        except ValueError:
-            print("Please enter a valid number.")
-            input("\nPress Enter to continue...")
+            command = self.command_list[choice_index]
+        
+        action_type, data, label = command
+        
+        if action_type == "move":
+            await self.move_player(data)
+        elif action_type == "pickup":
+            self.pick_up_item(data)
+            await self.io.pause()
+        elif action_type == "bag":
+            self.apply_action(Action(BAG))
+            self.player.show_bag(self.io.write)
+            await self.io.pause()
+        elif action_type == "look":
+            self.look_around()
+            await self.io.pause()
+        elif action_type == "use":
+            if data:
+                await self.use_item(data)
+            else:
+                await self.use_item_menu()
+        elif action_type == "remove":
+            await self.remove_item_from_bag(data)
+        elif action_type == "travel":
+            await self.travel_to(data)
+        elif action_type in ("undo", "redo", "checkpoint", "restore") and self.shared is not None:
+            self.io.write("Time cannot be turned back while others share the mansion.")
+            await self.io.pause()
+        elif action_type in ("undo", "redo"):
+            if action_type == "undo":
+                self.undo()
+            else:
+                self.redo()
+            await self.io.pause()
+        elif action_type == "checkpoint":
+            await self.save_checkpoint(data)
+        elif action_type == "restore":
+            await self.restore_checkpoint(data)
+        elif action_type == "quit":
+            self.apply_action(Action(QUIT))
     
-    def use_item_menu(self):
+    async def use_item_menu(self):
         """Display a menu for using items."""
         if not self.player.bag:
-            print("Your bag is empty.")
-            input("\nPress Enter to continue...")
+            self.io.write("Your bag is empty.")
+            await self.io.pause()
             return
         
-        print("\nItems in your bag:")
+        self.io.write("\nItems in your bag:")
         for i, item in enumerate(self.player.bag, 1):
-            print(f"  {i}. {item.name}")
+            self.io.write(f"  {i}. {item.name}")
         
         try:
-            choice = input("\nEnter the number of the item to use (or '0' to cancel): ").strip()
+            choice = (await self.io.read("\nEnter the number of the item to use (or '0' to cancel): ")).strip()
             if choice == "0":
                 return
             
             choice_index = int(choice) - 1
             
             if choice_index < 0 or choice_index >= len(self.player.bag):
-                print("Invalid item number.")
-                input("\nPress Enter to continue...")
+                self.io.write("Invalid item number.")
+                await self.io.pause()
                 return
             
             item = self.player.bag[choice_index]
-            self.use_item(item.name)
+            await self.use_item(item.name)
         except ValueError:
-            print("Please enter a valid number.")
-            input("\nPress Enter to continue...")
+            self.io.write("Please enter a valid number.")
+            await self.io.pause()
     
-    def move_player(self, direction):
+    async def move_player(self, direction):
         """Move the player to a new room."""
-        current_room = self.rooms[self.player.current_room]
+        for event in self.apply_action(Action(MOVE, direction)):
+            if event.kind == "moved":
+                self.io.write(f"\nYou move {direction}...")
+                await self.io.delay(1)
+            elif event.kind == "door_locked":
+                self.io.write(self.world_index.doors[event.subject]["locked_text"])
+                await self.io.pause()
+            elif event.kind == "no_exit":
+                self.io.write("You can't go that way.")
+                await self.io.pause()
+    
+    def find_visited_room(self, text):
+        """Return the id of a visited room with the given name or id, or None."""
+        text = " ".join(text.lower().split())
+        if text.startswith("the "):
+            text = text[4:]
+        for room_id in self.state.visited:
+            if room_id == text or self.rooms[room_id].name.lower() == text:
+                return room_id
+        return None
+    
+    async def travel_to(self, destination=None):
+        """Walk to a room already visited along the shortest open route."""
+        if not destination:
+            destination = (await self.io.read("\nTravel to which room? ")).strip()
+        room_id = self.find_visited_room(destination) if destination else None
+        if room_id is None:
+            self.io.write("You don't know of such a room. You can only travel to rooms you have visited.")
+            await self.io.pause()
+            return
         
-        if direction in current_room.connections:
-            new_room_name = current_room.connections[direction]
-            
-            # Check if the door is accessible
-            if not self.is_door_accessible(self.player.current_room, new_room_name):
-                if new_room_name == "pantry":
-                    print("The pantry door is locked. You need to use the silver key to unlock it.")
-                elif new_room_name == "garden":
-                    print("The garden gate is locked with a heavy chain. You need to use the golden key to unlock it.")
-                input("\nPress Enter to continue...")
-                return
-            
-            self.player.current_room = new_room_name
-            print(f"\nYou move {direction}...")
-            time.sleep(1)
+        name = self.rooms[room_id].name
+        state = self.state
+        if self.shared is not None:
+            state = state._replace(doors=state.doors.snapshot())  # Routes are cached against a fixed set of doors
+        route = self.routes.route(state, room_id)
+        if route is None:
+            self.io.write(f"A locked door bars every way to the {name}.")
+            await self.io.pause()
+            return
+        if not route:
+            self.io.write(f"You are already in the {name}.")
+            await self.io.pause()
+            return
+        
+        # Meeting Odette or escaping ends the journey early, in the room where it happens
+        taken = []
+        for direction in route:
+            events = self.apply_action(Action(MOVE, direction))
+            if events[0].kind != "moved":
+                break  # Another player locked a door on the way
+            taken.append(direction)
+            if any(event.kind in ("odette_met", "escaped") for event in events):
+                break
+        if not taken:
+            self.io.write(f"A locked door bars the way to the {name}.")
+            await self.io.pause()
+            return
+        self.io.write(f"\nYou travel {', '.join(taken)}...")
+        await self.io.delay(1)
+    
+    def undo(self):
+        """Take back the last turn."""
+        state = self.history.undo()
+        if state is None:
+            self.io.write("There is nothing to undo.")
+            return
+        self.set_state(state)
+        self.io.write("The mansion shimmers, and you find yourself a moment earlier.")
+    
+    def redo(self):
+        """Play a taken-back turn again."""
+        state = self.history.redo()
+        if state is None:
+            self.io.write("There is nothing to redo.")
+            return
+        self.set_state(state)
+        self.io.write("The mansion shimmers, and time moves forward again.")
+    
+    async def save_checkpoint(self, name=None):
+        """Remember the current moment under a name."""
+        if not name:
+            name = (await self.io.read("\nName this checkpoint: ")).strip()
+        if name:
+            self.history.checkpoint(name.lower())
+            self.io.write(f"You will remember this moment as '{name.lower()}'.")
+        await self.io.pause()
+    
+    async def restore_checkpoint(self, name=None):
+        """Return to a named checkpoint."""
+        checkpoints = self.history.checkpoints
+        if not checkpoints:
+            self.io.write("You have no checkpoints yet.")
+            await self.io.pause()
+            return
+        if not name:
+            self.io.write("\nCheckpoints: " + ", ".join(checkpoints))
+            name = (await self.io.read("Return to which checkpoint? ")).strip()
+        state = self.history.restore(name.lower())
+        if state is None:
+            self.io.write(f"There is no checkpoint called '{name}'.")
         else:
-            print("You can't go that way.")
-            input("\nPress Enter to continue...")
+            self.set_state(state)
+            self.io.write(f"The mansion shimmers, and you are back at '{name.lower()}'.")
+        await self.io.pause()
     
     def pick_up_item(self, item_name):
         """Pick up an item from the current room."""
-        current_room = self.rooms[self.player.current_room]
+        item_id = self.world.item_id(item_name)
+        events = self.apply_action(Action(PICKUP, item_id)) if item_id else []
         
-        for item in current_room.items:
-            if item.name == item_name:
-                if self.player.add_item(item):
-                    current_room.items.remove(item)
-                    print(f"You picked up the {item.name}.")
-                else:
-                    print(f"Your bag is full! (Maximum {self.player.bag_capacity} items)")
-                    print("You need to remove an item first.")
+        for event in events:
+            if event.kind == "picked_up":
+                self.io.write(f"You picked up the {self.game_items[event.subject].name}.")
+                return
+            if event.kind == "bag_full":
+                self.io.write(f"Your bag is full! (Maximum {event.detail} items)")
+                self.io.write("You need to remove an item first.")
                 return
         
-        print("There's no such item here.")
+        self.io.write("There's no such item here.")
     
-    def use_item(self, item_name):
+    async def use_item(self, item_name):
         """Use an item from the player's bag with specific interactions."""
-        item = None
-        for bag_item in self.player.bag:
-            if bag_item.name.lower() == item_name.lower():
-                item = bag_item
-                break
-        
-        if not item:
-            print("You don't have that item.")
+        if not self.player.has_item(item_name):
+            self.io.write("You don't have that item.")
             return
         
-        current_room = self.rooms[self.player.current_room]
-        print(f"\nYou use the {item.name}...")
-        
-        # Door toggle functionality
-        if item.name.lower() == "silver key":
-            if self.player.current_room == "kitchen":
-                current_state = self.door_states["pantry"]
-                if self.toggle_door("pantry"):
-                    if current_state:  # Was unlocked, now locked
-                        print("The silver key turns in the pantry door lock.")
-                        print("You hear a heavy click as the door locks.")
-                        print("The pantry is now locked!")
-                    else:  # Was locked, now unlocked
-                        print("The silver key fits perfectly in the pantry door lock.")
-                        print("You hear a satisfying click as the lock turns.")
-                        print("The pantry is now unlocked!")
-                else:
-                    print("The key doesn't seem to work on anything here.")
-            else:
-                print("The silver key doesn't seem to do anything useful here.")
-                print("Try using it near the pantry door.")
-        
-        elif item.name.lower() == "golden key":
-            if self.player.current_room == "entrance_hall":
-                current_state = self.door_states["garden"]
-                if self.toggle_door("garden"):
-                    if current_state:  # Was unlocked, now locked
-                        print("The golden key turns in the garden gate lock.")
-                        print("The heavy chain falls back into place with a clang.")
-                        print("The garden gate is now locked!")
-                    else:  # Was locked, now unlocked
-                        print("The golden key fits the heavy chain lock on the garden gate.")
-                        print("With a rusty creak, the chain falls away.")
-                        print("The garden gate is now unlocked!")
-                else:
-                    print("The key doesn't seem to work on anything here.")
-            else:
-                print("The golden key doesn't seem to do anything useful here.")
-                print("Try using it near the garden gate.")
-        
-        # Other item usage logic
-        elif item.name.lower() == "portrait" and self.player.current_room == "Odette's Bedroom":
-            print("You show Odette her portrait from when she was alive.")
-            print("Odette: 'Mon portrait! You found it!'")
-            print("The ghost seems pleased and fades away with a smile.")
-        elif item.name.lower() == "holy water":
-            print("You sprinkle the holy water around you.")
-            print("A faint hissing sound comes from the shadows as they retreat.")
-            print("You feel safer for now.")
-        elif item.name.lower() == "candle":
-            print("The candle's flickering light pushes back the darkness.")
-            print("The shadows seem less threatening now.")
-        else:
-            print(f"The {item.name} doesn't seem to do anything useful here.")
-        
-        input("\nPress Enter to continue...")
+        item_id = self.world.item_id(item_name)
+        item = self.game_items[item_id]
+        for event in self.apply_action(Action(USE, item_id)):
+            if event.kind == "used":
+                self.io.write(f"\nYou use the {item.name}...")
+            elif event.kind == "door_toggled":
+                door = self.world_index.doors[event.subject]
+                for line in door["unlock_text"] if event.detail else door["lock_text"]:
+                    self.io.write(line)
+            elif event.kind == "item_effect":
+                for line in self.world.rules.rules[event.detail].text:
+                    self.io.write(line)
+            elif event.kind == "no_effect":
+                self.io.write(f"The {item.name.lower() if event.detail else item.name} "
+                      f"doesn't seem to do anything useful here.")
+                if event.detail:
+                    self.io.write(self.world_index.doors[event.detail]["hint"])
+        
+        await self.io.pause()
     
-    def remove_item_from_bag(self):
+    async def remove_item_from_bag(self, item_name=None):
         """Allow player to remove an item from their bag."""
+        if item_name is not None:
+            if not self.player.has_item(item_name):
+                self.io.write("You don't have that item.")
+            else:
+                item_id = self.world.item_id(item_name)
+                self.apply_action(Action(DROP, item_id))
+                self.io.write(f"You removed the {self.game_items[item_id].name} from your bag and left it here.")
+            await self.io.pause()
+            return
+        
         if not self.player.bag:
-            print("Your bag is already empty.")
-            input("\nPress Enter to continue...")
+            self.io.write("Your bag is already empty.")
+            await self.io.pause()
             return
         
-        print("\nCurrent bag contents:")
+        self.io.write("\nCurrent bag contents:")
         for i, item in enumerate(self.player.bag, 1):
-            print(f"  {i}. {item.name}")
+            self.io.write(f"  {i}. {item.name}")
         
         try:
-            choice = input("\nEnter the number of the item to remove (or '0' to cancel): ").strip()
+            choice = (await self.io.read("\nEnter the number of the item to remove (or '0' to cancel): ")).strip()
             if choice == "0":
                 return
             
             choice_index = int(choice) - 1
             
             if choice_index < 0 or choice_index >= len(self.player.bag):
-                print("Invalid item number.")
-                input("\nPress Enter to continue...")
+                self.io.write("Invalid item number.")
+                await self.io.pause()
                 return
             
             removed_item = self.player.bag[choice_index]
-            self.player.bag.remove(removed_item)
-            current_room = self.rooms[self.player.current_room]
-            current_room.items.append(removed_item)
-            print(f"You removed the {removed_item.name} from your bag and left it here.")
-            input("\nPress Enter to continue...")
+            self.apply_action(Action(DROP, self.world.item_id(removed_item.name)))
+            self.io.write(f"You removed the {removed_item.name} from your bag and left it here.")
+            await self.io.pause()
         except ValueError:
-            print("Please enter a valid number.")
-            input("\nPress Enter to continue...")
+            self.io.write("Please enter a valid number.")
+            await self.io.pause()
     
     def look_around(self):
         """Provide additional details about the current room."""
+        self.apply_action(Action(LOOK))
         current_room = self.rooms[self.player.current_room]
-        print(f"\nYou take a closer look around the {current_room.name}...")
-        
-        # Room-specific details
-        if current_room.name == "Odette's Bedroom":
-            print("The room is filled with the scent of roses. You sense a presence watching you.")
-        elif current_room.name == "kitchen":
-            print("You hear the sound of pots and pans rattling, though no one is there.")
-            print(f"The pantry door to the north is {('unlocked' if self.door_states['pantry'] else 'locked')}.")
-        elif current_room.name == "entrance_hall":
-            print("The grand entrance feels both welcoming and ominous.")
-            print(f"The garden gate to the south is {('unlocked' if self.door_states['garden'] else 'locked')}.")
-        elif current_room.name == "library":
-            print("The books seem to whisper secrets as you pass by them.")
-        else:
-            print("The shadows seem to move on their own, and you feel a chill in the air.")
+        self.io.write(f"\nYou take a closer look around the {current_room.name}...")
+        
+        # Room-specific details; {door} stands for the state of the door the room shows
+        record = self.world_index.room_record(self.player.current_room)
+        door = record.get("door_status")
+        state = ("unlocked" if self.door_states[door] else "locked") if door else ""
+        for line in record.get("look", self.world_index.default_look):
+            self.io.write(line.replace("{door}", state))
     
-    def encounter_odette(self):
+    async def encounter_odette(self):
         """Special encounter with Odette the French ghost."""
-        print("\n" + "*" * 50)
-        print("SUPERNATURAL ENCOUNTER")
-        print("*" * 50)
-        print("A translucent figure materializes before you...")
-        print("It's a young woman in an elegant 18th-century dress.")
-        print("She speaks with a soft French accent:")
-        print("\nOdette: 'Bonjour, mon ami... You have entered my domain.'")
-        print("Odette: 'I have been waiting so long for someone to find me.'")
-        print("Odette: 'If you wish to escape, you must help me first.'")
-        print("Odette: 'Find my belongings scattered throughout the mansion.'")
-        print("Odette: 'Bring them to me, and I will give you the key to freedom.'")
-        print("\nShe points to a portrait on the dresser.")
-        print("Odette: 'Start with my portrait, but you'll need more than that...'")
-        print("\nThe ghost fades away, leaving you alone with your thoughts.")
-        print("*" * 50)
+        self.io.write("\n" + "*" * 50)
+        self.io.write("SUPERNATURAL ENCOUNTER")
+        self.io.write("*" * 50)
+        self.io.write("A translucent figure materializes before you...")
+        self.io.write("It's a young woman in an elegant 18th-century dress.")
+        self.io.write("She speaks with a soft French accent:")
+        self.io.write("\nOdette: 'Bonjour, mon ami... You have entered my domain.'")
+        self.io.write("Odette: 'I have been waiting so long for someone to find me.'")
+        self.io.write("Odette: 'If you wish to escape, you must help me first.'")
+        self.io.write("Odette: 'Find my belongings scattered throughout the mansion.'")
+        self.io.write("Odette: 'Bring them to me, and I will give you the key to freedom.'")
+        self.io.write("\nShe points to a portrait on the dresser.")
+        self.io.write("Odette: 'Start with my portrait, but you'll need more than that...'")
+        self.io.write("\nThe ghost fades away, leaving you alone with your thoughts.")
+        self.io.write("*" * 50)
         
         self.player.has_spoken_to_odette = True
-        input("\nPress Enter to continue...")
+        await self.io.pause()
     
     def check_win_condition(self):
         """Check if the player has won the game."""
-        if (self.player.current_room == "garden" and 
-            self.door_states["garden"] and  # Garden gate must be unlocked
-            self.player.has_spoken_to_odette):  # Must have spoken to Odette
-            return True
-        return False
+        # In the garden, with the gate unlocked, after speaking to Odette
+        return self.engine.is_won(self.state)
     
-    def end_game_victory(self):
+    async def end_game_victory(self):
         """Handle the victory condition."""
         self.clear_screen()
-        print("\n" + "=" * 60)
-        print("CONGRATULATIONS! YOU HAVE ESCAPED THE HAUNTED MANSION!")
-        print("=" * 60)
-        print("\nWith the garden gate unlocked,")
-        print("you step toward freedom...")
-        print("\nOdette appears one last time...")
-        print("\nOdette: 'Merci beaucoup, mon ami. You have helped me find peace.'")
-        print("Odette: 'You used the keys wisely and proved your worth.'")
-        print("Odette: 'Now go, you have earned your freedom.'")
-        print("\nThe ghost smiles and fades away into the moonlight.")
-        print("You step through the unlocked gate and into the world beyond.")
-        print(f"\nWell done, {self.player.name}! You successfully escaped the haunted mansion!")
-        print("=" * 60)
+        self.io.write("\n" + "=" * 60)
+        self.io.write("CONGRATULATIONS! YOU HAVE ESCAPED THE HAUNTED MANSION!")
+        self.io.write("=" * 60)
+        self.io.write("\nWith the garden gate unlocked,")
+        self.io.write("you step toward freedom...")
+        self.io.write("\nOdette appears one last time...")
+        self.io.write("\nOdette: 'Merci beaucoup, mon ami. You have helped me find peace.'")
+        self.io.write("Odette: 'You used the keys wisely and proved your worth.'")
+        self.io.write("Odette: 'Now go, you have earned your freedom.'")
+        self.io.write("\nThe ghost smiles and fades away into the moonlight.")
+        self.io.write("You step through the unlocked gate and into the world beyond.")
+        self.io.write(f"\nWell done, {self.player.name}! You successfully escaped the haunted mansion!")
+        self.io.write("=" * 60)
         
         self.player.game_complete = True
         self.game_running = False
-        input("\nPress Enter to exit...")
+        if self.save_slot is not None:
+            self.save_slot.delete()  # Nothing left to continue
+        await self.io.pause("\nPress Enter to exit...")
 
 
 def main():
     """Main function to start the game."""
-    game = HauntedMansionGame()
-    game.start_game()
+    parser = argparse.ArgumentParser(description="Haunted Mansion Escape Game")
+    parser.add_argument("--save-dir", help="save progress after every turn in this directory")
+    parser.add_argument("--record", metavar="FILE", help="append a replayable transcript of this session to FILE")
+    parser.add_argument("--events", metavar="FILE", help="append a line to FILE for every action, for analytics.py")
+    parser.add_argument("--bag-capacity", type=int, help="how many items the bag holds (default: set by the world)")
+    parser.add_argument("--world", metavar="FILE", help="play the world described in FILE (.json, .toml or compiled .hmw)")
+    parser.add_argument("--undo-depth", type=int, default=UNDO_DEPTH,
+                        help=f"how many turns undo can step back (default {UNDO_DEPTH})")
+    args = parser.parse_args()
+    if args.save_dir and args.record:
+        parser.error("--record cannot be combined with --save-dir, since a resumed game cannot be replayed")
+    if args.undo_depth < 0:
+        parser.error("--undo-depth needs a number of turns, 0 or more")
+    
+    event_log = None
+    if args.events:
+        from analytics import EventLog
+        event_log = EventLog(args.events).start()
+    game = HauntedMansionGame(bag_capacity=args.bag_capacity, world_file=args.world, event_log=event_log,
+                              undo_depth=args.undo_depth)
+    if args.save_dir:
+        game.saves = SaveStore(args.save_dir, game.engine)
+    try:
+        if not args.record:
+            asyncio.run(game.start_game())
+            return
+        
+        from replay import RecordingIO, append_transcript
+        recorder = game.io = RecordingIO(game.io)
+        try:
+            asyncio.run(game.start_game())
+        except (EOFError, KeyboardInterrupt):
+            pass
+        finally:
+            append_transcript(args.record, recorder.transcript(game))
+    finally:
+        if event_log is not None:
+            event_log.close()
 
 
 if __name__ == "__main__":
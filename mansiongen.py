@@ -0,0 +1,295 @@
+"""
+Seeded procedural mansions for scale testing.
+
+generate() builds a mansion of any size as compact arrays: floors of
+rooms on a grid, joined north/south/east/west by a random maze with a few
+extra loops, and up/down stairs between floors. Exits are kept as
+compressed sparse rows (per-room offsets into flat direction and target
+arrays), never as a dict per room, so a million-room mansion fits in
+tens of megabytes and writes straight to a world index (see worlddata.py).
+
+Some rooms are locked doors, the exit among them. Keys are placed by
+flooding outwards from the start room: whenever the flood reaches a
+locked door, that door's key goes into a room the flood has already
+reached, and the door then opens for the rest of the flood. Every
+generated level can therefore be won. A candle waits in the start room
+and other trinkets are scattered about.
+
+    python mansiongen.py --rooms 100000 --seed 7 -o big.hmw
+    python main.py --world big.hmw
+"""
+
+import argparse
+import math
+import os
+import random
+import time
+from array import array
+
+from worlddata import build_index
+
+
+ROOM_KINDS = (
+    "Parlour", "Gallery", "Bedroom", "Study", "Conservatory", "Library", "Nursery", "Chapel",
+    "Ballroom", "Cellar", "Pantry", "Sitting Room", "Dressing Room", "Music Room", "Trophy Room", "Attic",
+)
+ADJECTIVES = ("dusty", "cold", "silent", "crumbling", "candlelit", "shadowy", "musty", "forgotten")
+TRINKETS = ("Locket", "Music Box", "Hand Mirror", "Pocket Watch", "Letter", "Doll", "Hourglass", "Candle")
+CANDLE_EFFECT = ["The candle's flickering light pushes back the darkness."]
+
+# Sorted, as worlddata numbers directions in sorted order
+DIRECTIONS = ("down", "east", "north", "south", "up", "west")
+DOWN, EAST, NORTH, SOUTH, UP, WEST = range(len(DIRECTIONS))
+
+
+class GeneratedMansion:
+    """A generated mansion held as flat arrays."""
+
+    def __init__(self, room_count, floors, rooms_per_floor, width, seed):
+        self.room_count = room_count
+        self.floors = floors
+        self.rooms_per_floor = rooms_per_floor
+        self.width = width
+        self.seed = seed
+        self.exit_offsets = array("I", [0])  # CSR: exits of room i are [offsets[i], offsets[i + 1])
+        self.exit_directions = array("B")
+        self.exit_targets = array("I")
+        self.kinds = array("B")  # Index into ROOM_KINDS per room
+        self.items = {}  # Item id -> item description
+        self.placed_rooms = array("I")
+        self.placed_items = array("I")
+        self.doors = {}  # Door room number -> key item id
+        self.start_room = 0
+        self.odette_room = 0
+        self.exit_room = room_count - 1
+
+    @staticmethod
+    def room_id(number):
+        return f"r{number}"
+
+    def room_name(self, number):
+        return f"{ROOM_KINDS[self.kinds[number]]} {number}"
+
+    def exits(self, number):
+        """Yield (direction index, target room number) for a room's exits."""
+        for i in range(self.exit_offsets[number], self.exit_offsets[number + 1]):
+            yield self.exit_directions[i], self.exit_targets[i]
+
+    def to_index(self):
+        """Return the mansion as world index bytes."""
+        room_id = self.room_id
+        door_specs = {}
+        key_doors = array("I")
+        item_number = {item_id: i for i, item_id in enumerate(self.items)}
+        for door, key in self.doors.items():
+            name = self.room_name(door)
+            key_name = self.items[key]["name"]
+            door_specs[room_id(door)] = {
+                "key": key,
+                "locked": True,
+                "locked_text": f"The door to the {name} is locked. You need to use the {key_name} to unlock it.",
+                "hint": f"Try using it near the {name}.",
+                "unlock_text": [f"The {key_name} turns in the lock.", f"The {name} is now unlocked!"],
+                "lock_text": [f"The {key_name} turns in the lock.", f"The {name} is now locked!"],
+            }
+            # Exits go both ways, so the rooms leading into a door are the door's own exits
+            for _, neighbour in self.exits(door):
+                key_doors.extend((neighbour, item_number[key], door))
+
+        records = bytearray()
+        record_offsets = array("Q", [0])
+        per_floor = self.rooms_per_floor
+        for number in range(self.room_count):
+            kind = ROOM_KINDS[self.kinds[number]]
+            adjective = ADJECTIVES[number % len(ADJECTIVES)]
+            record = (f'{{"name":"{kind} {number}","description":"A {adjective} {kind.lower()} '
+                      f'on floor {number // per_floor + 1}."')
+            if number == self.exit_room:
+                record += ',"unlocked_description":"The way out stands open before you!"'
+            records += (record + "}").encode()
+            record_offsets.append(len(records))
+
+        meta = {
+            "start_room": room_id(self.start_room),
+            "odette_room": room_id(self.odette_room),
+            "exit_room": room_id(self.exit_room),
+            "bag_capacity": 4,
+            "default_look": ["The shadows seem to move on their own, and you feel a chill in the air."],
+            "items": self.items,
+            "doors": door_specs,
+            "directions": list(DIRECTIONS),
+        }
+        return build_index(meta, [room_id(number) for number in range(self.room_count)],
+                           self.exit_offsets, self.exit_directions, self.exit_targets, record_offsets,
+                           records, self.placed_rooms, self.placed_items, key_doors)
+
+    def write(self, path):
+        """Write the mansion as a world index file."""
+        data = self.to_index()
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        return len(data)
+
+
+def _maze_edges(rooms, floors, per_floor, width, rng, loop_chance):
+    """Return (sources, directions, targets): every exit of a maze of floors joined by stairs."""
+    # Undirected edges as (room, direction, room) in both directions
+    sources = array("I")
+    directions = array("B")
+    targets = array("I")
+
+    def connect(a, direction, b, back):
+        sources.append(a)
+        directions.append(direction)
+        targets.append(b)
+        sources.append(b)
+        directions.append(back)
+        targets.append(a)
+
+    # Each room joins its north or west neighbour: a maze with no cycles, then a few extra loops
+    for number in range(rooms):
+        position = number % per_floor
+        north = position >= width
+        west = position % width > 0
+        if north and west:
+            if rng.random() < 0.5:
+                connect(number, NORTH, number - width, SOUTH)
+                if rng.random() < loop_chance:
+                    connect(number, WEST, number - 1, EAST)
+            else:
+                connect(number, WEST, number - 1, EAST)
+                if rng.random() < loop_chance:
+                    connect(number, NORTH, number - width, SOUTH)
+        elif north:
+            connect(number, NORTH, number - width, SOUTH)
+        elif west:
+            connect(number, WEST, number - 1, EAST)
+
+    # Stairs between floors, at positions present on both
+    for floor in range(floors - 1):
+        upper = min(per_floor, rooms - (floor + 1) * per_floor)
+        for position in rng.sample(range(upper), max(1, upper // 200)):
+            connect(floor * per_floor + position, UP, (floor + 1) * per_floor + position, DOWN)
+    return sources, directions, targets
+
+
+def generate(rooms, seed=0, floors=None, doors=None, trinkets=None, loop_chance=0.1):
+    """Generate a solvable mansion with the given number of rooms."""
+    if rooms < 3:
+        raise ValueError("A mansion needs at least 3 rooms")
+    rng = random.Random(seed)
+    floors = floors or max(1, round(rooms ** 0.25 / 2))
+    per_floor = -(-rooms // floors)
+    floors = -(-rooms // per_floor)
+    width = math.isqrt(per_floor - 1) + 1
+    mansion = GeneratedMansion(rooms, floors, per_floor, width, seed)
+    mansion.kinds = array("B", (rng.randrange(len(ROOM_KINDS)) for _ in range(rooms)))
+    sources, directions, targets = _maze_edges(rooms, floors, per_floor, width, rng, loop_chance)
+
+    # Compress the edge list into sparse rows
+    degree = array("I", bytes(4 * (rooms + 1)))
+    for source in sources:
+        degree[source + 1] += 1
+    offsets = mansion.exit_offsets = array("I", degree)
+    for number in range(rooms):
+        offsets[number + 1] += offsets[number]
+    fill = array("I", offsets)
+    exit_directions = mansion.exit_directions = array("B", bytes(len(sources)))
+    exit_targets = mansion.exit_targets = array("I", bytes(4 * len(sources)))
+    for source, direction, target in zip(sources, directions, targets):
+        slot = fill[source]
+        exit_directions[slot] = direction
+        exit_targets[slot] = target
+        fill[source] = slot + 1
+    del sources, directions, targets, degree, fill
+
+    # Locked doors, always including the exit, and one key per door
+    door_count = doors or max(1, rooms // 1000)
+    locked = set(rng.sample(range(1, rooms - 1), min(door_count - 1, rooms - 3)))
+    locked.add(mansion.exit_room)
+    odette = rng.randrange(1, rooms - 1)
+    while odette in locked:
+        odette = rng.randrange(1, rooms - 1)
+    mansion.odette_room = odette
+
+    items = mansion.items
+    items["candle"] = {"name": "Candle", "description": "A flickering candle that provides light",
+                       "effect": CANDLE_EFFECT}
+    place = [(mansion.start_room, "candle")]
+
+    reached = bytearray(rooms)
+    reached[mansion.start_room] = 1
+    order = [mansion.start_room]
+    frontier = []
+
+    def flood(start):
+        stack = [start]
+        while stack:
+            number = stack.pop()
+            for i in range(offsets[number], offsets[number + 1]):
+                target = exit_targets[i]
+                if reached[target]:
+                    continue
+                reached[target] = 1
+                if target in locked:
+                    frontier.append(target)  # Reached, but only passable once its key is placed
+                else:
+                    order.append(target)
+                    stack.append(target)
+
+    flood(mansion.start_room)
+    key_number = 0
+    while frontier:
+        slot = rng.randrange(len(frontier))
+        frontier[slot], frontier[-1] = frontier[-1], frontier[slot]
+        door = frontier.pop()
+        key_number += 1
+        key = f"key_{key_number}"
+        items[key] = {"name": f"Key {key_number}", "description": f"A tarnished key tagged '{key_number}'"}
+        place.append((order[rng.randrange(len(order))], key))
+        mansion.doors[door] = key
+        order.append(door)
+        flood(door)
+    if len(order) != rooms:
+        raise AssertionError("Generated mansion is not connected")
+
+    for number in range(trinkets if trinkets is not None else rooms // 100):
+        kind = TRINKETS[number % len(TRINKETS)]
+        item_id = f"{kind.lower().replace(' ', '_')}_{number + 1}"
+        items[item_id] = {"name": f"{kind} {number + 1}", "description": f"A {kind.lower()} left behind long ago"}
+        if kind == "Candle":
+            items[item_id]["effect"] = CANDLE_EFFECT
+        place.append((rng.randrange(rooms), item_id))
+
+    item_number = {item_id: i for i, item_id in enumerate(items)}
+    for room, item_id in place:
+        mansion.placed_rooms.append(room)
+        mansion.placed_items.append(item_number[item_id])
+    return mansion
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Generate a solvable mansion as a world index file.")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--floors", type=int, help="number of floors (default grows with the room count)")
+    parser.add_argument("--doors", type=int, help="number of locked doors, including the exit (default rooms / 1000)")
+    parser.add_argument("-o", "--output", default="generated.hmw", help="index file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mansion = generate(args.rooms, args.seed, args.floors, args.doors)
+    generated = time.perf_counter() - start
+    start = time.perf_counter()
+    size = mansion.write(args.output)
+    written = time.perf_counter() - start
+    print(f"{args.output}: {args.rooms:,} rooms on {mansion.floors} floors, {len(mansion.doors):,} locked doors, "
+          f"{len(mansion.items):,} items, {size:,} bytes")
+    print(f"generated in {generated:.2f} s, written in {written:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Cached command menus for the Haunted Mansion Escape Game.
+
+The "What would you like to do?" menu only depends on the room the player
+is in and the items lying there, so each distinct (room, items) pair is
+built and formatted once and then reused by every turn and every session
+sharing the cache. Picking up or dropping an item changes the items in
+the room, which selects a different cache entry.
+
+Each menu also carries a prefix index over text forms of its commands
+("go north", "take candle", "look"), so typed commands are resolved with
+a single dictionary lookup. "travel to <room>", "undo", "redo",
+"checkpoint <name>" and "restore <name>" are recognised in any menu
+and left for the game to resolve.
+"""
+
+from collections import OrderedDict
+
+GENERAL_COMMANDS = (
+    ("bag", None, "Check bag", ("check bag", "bag", "inventory")),
+    ("look", None, "Look around", ("look around", "look")),
+    ("use", None, "Use item", ("use item", "use")),
+    ("remove", None, "Remove item", ("remove item", "remove", "drop")),
+    ("quit", None, "Quit game", ("quit game", "quit", "exit")),
+)
+
+# Verbs that take the name of an item in the bag, e.g. "use holy water"
+ITEM_VERBS = {"use": "use", "drop": "remove", "remove": "remove"}
+
+# Typed-only commands, with an optional argument, e.g. "checkpoint hall"
+HISTORY_VERBS = {
+    "undo": "Undo the last turn",
+    "redo": "Redo an undone turn",
+    "checkpoint": "Save a checkpoint",
+    "restore": "Return to a checkpoint",
+}
+
+
+def normalize(text):
+    """Lower-case a command and collapse its whitespace."""
+    return " ".join(text.lower().split())
+
+
+class Menu:
+    """A numbered list of commands, its rendered text and a text-command index."""
+
+    __slots__ = ("commands", "text", "index")
+
+    def __init__(self, commands, text, index):
+        self.commands = commands  # Tuple of (action_type, data, label)
+        self.text = text
+        self.index = index  # Normalized alias or unambiguous prefix -> command
+
+
+class MenuCache:
+    """Builds menus for a world and keeps the most recently used ones."""
+
+    def __init__(self, world, maxsize=4096):
+        self.world = world
+        self.maxsize = maxsize
+        self._menus = OrderedDict()  # (room id, item ids) -> Menu, least recently used first
+
+    def menu_for(self, room_id, item_ids):
+        """Return the menu for a room holding the given items."""
+        key = (room_id, item_ids)
+        menu = self._menus.get(key)
+        if menu is None:
+            if len(self._menus) >= self.maxsize:
+                self._menus.popitem(last=False)
+            menu = self._menus[key] = self._build(room_id, item_ids)
+        else:
+            self._menus.move_to_end(key)
+        return menu
+
+    def _build(self, room_id, item_ids):
+        world = self.world
+        room = world.rooms[room_id]
+        entries = []  # (action_type, data, label, aliases)
+        for direction, to_room in room.connections.items():
+            label = f"Go {direction} to {world.rooms[to_room].name}"
+            entries.append(("move", direction, label,
+                            (f"go {direction}", direction, f"go to {world.rooms[to_room].name}")))
+        for item_id in item_ids:
+            name = world.items[item_id].name
+            entries.append(("pickup", name, f"Pick up {name}",
+                            (f"pick up {name}", f"take {name}", f"get {name}")))
+        entries.extend(GENERAL_COMMANDS)
+
+        lines = ["\n" + "-" * 30, "WHAT WOULD YOU LIKE TO DO?", "-" * 30]
+        number = 0
+        for kind, heading in (("move", "Movement options:"), ("pickup", "\nItem options:")):
+            section = [entry for entry in entries if entry[0] == kind]
+            if section:
+                lines.append(heading)
+                for entry in section:
+                    number += 1
+                    lines.append(f"  {number}. {entry[2]}")
+        lines.append("\nGeneral options:")
+        for entry in entries[number:]:
+            number += 1
+            lines.append(f"  {number}. {entry[2]}")
+
+        commands = tuple(entry[:3] for entry in entries)
+        return Menu(commands, "\n".join(lines), self._index(commands, entries))
+
+    def _index(self, commands, entries):
+        candidates = {}
+        exact = {}
+        for command, entry in zip(commands, entries):
+            for alias in entry[3]:
+                alias = normalize(alias)
+                exact.setdefault(alias, command)
+                for end in range(1, len(alias)):
+                    candidates.setdefault(alias[:end], set()).add(command)
+        index = {prefix: next(iter(found)) for prefix, found in candidates.items() if len(found) == 1}
+        index.update(exact)
+        return index
+
+    def parse(self, menu, text):
+        """Resolve a typed command against a menu; return (action_type, data, label) or None."""
+        text = normalize(text)
+        command = menu.index.get(text)
+        if command is not None:
+            return command
+        verb, _, rest = text.partition(" ")
+        if verb == "travel":
+            if rest == "to" or rest.startswith("to "):
+                rest = rest[3:]
+            return ("travel", rest or None, "Travel to a room")
+        if verb in HISTORY_VERBS:
+            return (verb, rest or None, HISTORY_VERBS[verb])
+        if verb in ITEM_VERBS and rest:
+            item_id = self.world.item_id(rest)
+            if item_id is not None:
+                name = self.world.items[item_id].name
+                return (ITEM_VERBS[verb], name, f"{verb.capitalize()} {name}")
+        return None
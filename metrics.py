@@ -0,0 +1,212 @@
+"""
+Opt-in timing of the game's hot paths.
+
+Instrumenting a game replaces its turn handler and the handlers it
+dispatches to with timed wrappers on that one instance. Games that are
+not instrumented run the original methods untouched, so leaving metrics
+off costs nothing.
+
+Each handler gets a call count and a latency histogram. Async handlers
+are timed only while they run. Time spent waiting on the player or on
+the movement delay is left out, so the figures show CPU cost per call
+and not how long players take to answer.
+
+Snapshots export as JSON or as Prometheus text, and MetricsDumper writes
+one to a file at a fixed interval:
+
+    python server.py --metrics metrics.prom --metrics-interval 10
+"""
+
+import asyncio
+import inspect
+import json
+import os
+from bisect import bisect_left
+from time import perf_counter
+
+
+HANDLERS = (
+    "handle_player_input",
+    "display_room_info",
+    "show_choices",
+    "move_player",
+    "travel_to",
+    "pick_up_item",
+    "use_item",
+    "remove_item_from_bag",
+    "look_around",
+)
+
+# Upper bounds in seconds, from 1 microsecond to 1 second
+BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+class Histogram:
+    """Call count, total time and bucketed latencies for one handler."""
+
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _TimedCoroutine:
+    """Awaits a coroutine and adds up only the time it spends running."""
+
+    __slots__ = ("coroutine", "histogram")
+
+    def __init__(self, coroutine, histogram):
+        self.coroutine = coroutine
+        self.histogram = histogram
+
+    def __await__(self):
+        coroutine = self.coroutine
+        busy = 0.0
+        value = error = None
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    if error is None:
+                        waiting_on = coroutine.send(value)
+                    else:
+                        waiting_on = coroutine.throw(error)
+                except StopIteration as done:
+                    return done.value
+                finally:
+                    busy += perf_counter() - start
+                try:
+                    value, error = (yield waiting_on), None
+                except BaseException as raised:
+                    value, error = None, raised
+        finally:
+            self.histogram.observe(busy)
+
+
+class Metrics:
+    """Handler histograms shared by every instrumented game."""
+
+    def __init__(self, handlers=HANDLERS):
+        self.handlers = handlers
+        self.histograms = {name: Histogram() for name in handlers}
+
+    def instrument(self, game):
+        """Time the handlers of one game."""
+        for name in self.handlers:
+            method = getattr(game, name)
+            histogram = self.histograms[name]
+            if inspect.iscoroutinefunction(method):
+                wrapper = self._wrap_async(method, histogram)
+            else:
+                wrapper = self._wrap(method, histogram)
+            setattr(game, name, wrapper)
+        return game
+
+    @staticmethod
+    def _wrap(method, histogram):
+        def timed(*args):
+            start = perf_counter()
+            try:
+                return method(*args)
+            finally:
+                histogram.observe(perf_counter() - start)
+        return timed
+
+    @staticmethod
+    def _wrap_async(method, histogram):
+        def timed(*args):
+            return _TimedCoroutine(method(*args), histogram)
+        return timed
+
+    def snapshot(self):
+        """Return the current figures as a JSON-serializable dict."""
+        handlers = {}
+        for name, histogram in self.histograms.items():
+            handlers[name] = {
+                "count": histogram.count,
+                "total_seconds": histogram.total,
+                "p50_seconds": histogram.quantile(0.5),
+                "p99_seconds": histogram.quantile(0.99),
+                "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram.buckets)),
+            }
+        return {"handlers": handlers}
+
+    def to_json(self):
+        """Return a snapshot as JSON text."""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Return a snapshot in the Prometheus text exposition format."""
+        lines = [
+            "# HELP mansion_handler_seconds Time spent running each game handler.",
+            "# TYPE mansion_handler_seconds histogram",
+        ]
+        for name, histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(f'mansion_handler_seconds_bucket{{handler="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'mansion_handler_seconds_bucket{{handler="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'mansion_handler_seconds_sum{{handler="{name}"}} {histogram.total}')
+            lines.append(f'mansion_handler_seconds_count{{handler="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write a snapshot to path, as Prometheus text for .prom files and JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(text)
+        os.replace(temporary, path)
+
+
+class MetricsDumper:
+    """Writes metrics to a file every so many seconds from an asyncio task."""
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        """Start dumping on the running event loop."""
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the task and write one final dump."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.metrics.dump(self.path)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.metrics.dump(self.path)
@@ -0,0 +1,508 @@
+"""
+Exhaustive model checker for the Haunted Mansion Escape Game.
+
+Enumerates every reachable state of a world through the engine's own
+step() and checks four invariants:
+
+    bag_capacity      the bag never holds more than bag_capacity items
+    one_place         every item is in exactly one place, the bag or one
+                      room (an item a rule consumes may be nowhere)
+    escape_reachable  the escape condition can still be reached
+    key_dead_end      no dead end when a key lies behind a locked door,
+                      e.g. the golden key dropped in a locked pantry
+
+Escaping is checked by searching onward from each new state until a
+state known to escape turns up. The other two are checked on every
+transition.
+
+The full state space is far too large to enumerate as it stands, so the
+checker enumerates a reduced one. Each reduction leaves every invariant
+unchanged:
+
+- Visited rooms are left out; no rule or invariant reads them.
+- Only some rooms matter: the start, Odette's room, the exit, the doors
+  and every room a rule names (which includes the rooms next to each
+  door, where its key turns). The other rooms form corridor regions
+  that can be crossed without anything happening, so the player and
+  every item in a region are kept as being in the region. Leaving a
+  region is a real engine move from one of its rooms into a room that
+  matters.
+- The bag is unordered; order only matters to the display.
+- Items no door or condition refers to are interchangeable, and using
+  them changes nothing. Only enough of them to overfill the bag are
+  picked up (capacity + 1 in all, counting the keys). Their places are
+  kept sorted, so states that differ only by which of them lies where
+  are one state. The rest stay where they start and are checked to stay
+  there.
+
+A state is a tuple of small ints: room, flags, door bits and the place
+of each tracked item. States are split between worker processes by
+hash. Each worker owns the part of the visited set that hashes to it,
+expands its share of the frontier and sends every successor to the
+worker that owns it, one breadth-first level at a time.
+
+    python modelcheck.py --workers 4
+    python modelcheck.py --world big.hmw --loose-items 1
+    python modelcheck.py --generate 200 --doors 3 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from array import array
+from collections import deque, namedtuple
+
+from engine import Action, GameState, MOVE, PICKUP, DROP, USE, stock_engine
+from main import HauntedMansionGame
+from routes import connections_of, exit_rows
+from sharedstate import PSet
+from solver import Solver
+
+
+BAG = -1  # Place of an item in the bag
+GONE = -2  # Place of an item a rule has consumed
+SPOKEN_TO_ODETTE = 1
+ESCAPED = 2
+
+INVARIANTS = {
+    "bag_capacity": "bag never over capacity",
+    "one_place": "every item in exactly one place",
+    "escape_reachable": "escape always reachable",
+    "key_dead_end": "no dead end with a key locked away",
+}
+
+# A transition that breaks an invariant is reported as the state it left and the step taken (None for a state)
+Violation = namedtuple("Violation", ["invariant", "key", "step", "message"])
+CheckResult = namedtuple("CheckResult", ["states", "transitions", "locked_away", "seconds", "violations"])
+
+
+class StateSpace:
+    """A world's states reduced to keys, with their successors and invariant checks."""
+
+    def __init__(self, engine, loose_items=None):
+        self.engine = engine
+        world = self.world = engine.world
+        solver = Solver(engine)
+        self.keys = solver.keys
+        self.capacity = world.bag_capacity
+        self.consumable = frozenset(rule.item for rule in world.rules.rules if rule.consume)
+        relevant = solver.items  # The items that can change the way out, as the solver tracks them
+
+        # Tracked items in world order: the ones that matter, then interchangeable loose ones
+        placed = {}
+        for index, items in enumerate(world.initial_room_items):
+            for item_id in items:
+                placed[item_id] = index
+        keys = [item_id for item_id in world.items if item_id in relevant and item_id in placed]
+        loose = [item_id for item_id in world.items if item_id not in relevant and item_id in placed]
+        if loose_items is None:
+            loose_items = max(0, self.capacity + 1 - len(keys))
+        self.tracked = tuple(keys + loose[:loose_items])
+        self.relevant = frozenset(keys)
+        self.slot = {item_id: i for i, item_id in enumerate(self.tracked)}
+
+        # Every room's starting items without the tracked ones; tracked items are added back by place
+        base = world.initial_room_vector
+        for item_id in self.tracked:
+            index = placed[item_id]
+            base = base.set(index, tuple(other for other in base[index] if other != item_id))
+        self.base = base
+        self.initial_state = engine.initial_state()
+
+        self.canon, self.exits = self._regions()
+        self.door_ids = tuple(world.doors)
+        self.door_bit = {door: 1 << i for i, door in enumerate(self.door_ids)}
+        self.door_room_bit = {world.room_index[door]: bit for door, bit in self.door_bit.items()}
+        self._doors = {}  # Door bits -> PSet of unlocked doors
+        self._escapes = set()  # Keys known to reach an escaped state
+        self._trapped = set()  # Keys known never to reach one
+
+    def _regions(self):
+        # Rooms where something can happen stay themselves; every other room stands for its corridor region
+        world = self.world
+        room_index = world.room_index
+        room_ids = world.room_ids
+        marked = bytearray(len(room_ids))
+        for room_id in (world.start_room, world.odette_room, world.exit_room, *world.doors):
+            marked[room_index[room_id]] = 1
+        for rule in world.rules.rules:
+            if rule.room is not None:
+                marked[room_index[rule.room]] = 1
+        offsets, targets = exit_rows(world)
+        connections = connections_of(world)
+        canon = array("I", range(len(room_ids)))
+        exits = {}  # Region's room number -> (room id, direction) of every way out of the region
+        seen = bytearray(marked)
+        for start in range(len(room_ids)):
+            if seen[start]:
+                continue
+            seen[start] = 1
+            region = [start]
+            edge = []
+            for number in region:
+                canon[number] = start
+                for target in targets[offsets[number]:offsets[number + 1]]:
+                    if marked[target]:
+                        edge.append(number)
+                    elif not seen[target]:
+                        seen[target] = 1
+                        region.append(target)
+            exits[start] = tuple((room_ids[number], direction)
+                                 for number in sorted(set(edge))
+                                 for direction, to_room in connections(room_ids[number]).items()
+                                 if marked[room_index[to_room]])
+        return canon, exits
+
+    def key(self, state):
+        """Return (key, problems) for a state, where problems are (invariant, message) pairs."""
+        problems = []
+        bag = state.bag
+        if len(bag) > self.capacity:
+            problems.append(("bag_capacity", f"the bag holds {len(bag)} items, over its capacity of {self.capacity}"))
+        places = [GONE] * len(self.tracked)
+        slot = self.slot
+        for item_id in bag:
+            number = slot.get(item_id)
+            if number is None:
+                problems.append(("one_place", f"{item_id} is in the bag without being picked up"))
+            elif places[number] != GONE:
+                problems.append(("one_place", f"{item_id} is in the bag twice"))
+            else:
+                places[number] = BAG
+        base = self.base
+        room_items = state.room_items
+        for index in room_items.changes(base):
+            expected = list(base[index])
+            for item_id in room_items[index]:
+                number = slot.get(item_id)
+                if number is None:
+                    if item_id in expected:
+                        expected.remove(item_id)
+                    else:
+                        problems.append(("one_place", f"{item_id} turned up in {self.world.room_ids[index]}"))
+                elif places[number] != GONE:
+                    problems.append(("one_place", f"{item_id} is in two places"))
+                else:
+                    places[number] = self.canon[index]
+            for item_id in expected:
+                problems.append(("one_place", f"{item_id} vanished from {self.world.room_ids[index]}"))
+        for item_id, place in zip(self.tracked, places):
+            if place == GONE and item_id not in self.consumable:
+                problems.append(("one_place", f"{item_id} is nowhere"))
+
+        loose = len(self.relevant)
+        places[loose:] = sorted(places[loose:])
+        return (self.canon[self.world.room_index[state.room]], self._flags(state), self._door_bits(state.doors), *places), problems
+
+    def _flags(self, state):
+        return (SPOKEN_TO_ODETTE if state.spoken_to_odette else 0) | (ESCAPED if state.escaped else 0)
+
+    def _door_bits(self, doors):
+        door_bit = self.door_bit
+        bits = 0
+        for door in doors:
+            bits |= door_bit[door]
+        return bits
+
+    def state(self, key):
+        """Rebuild a GameState from a key."""
+        room, flags, door_bits = key[:3]
+        places = key[3:]
+        bag = tuple(item_id for item_id, place in zip(self.tracked, places) if place == BAG)
+        floor = {}
+        for item_id, place in zip(self.tracked, places):
+            if place >= 0:
+                floor.setdefault(place, []).append(item_id)
+        room_items = self.base
+        for index, items in floor.items():
+            room_items = room_items.set(index, room_items[index] + tuple(items))
+        doors = self._doors.get(door_bits)
+        if doors is None:
+            doors = self._doors[door_bits] = PSet(door for door in self.door_ids if door_bits & self.door_bit[door])
+        return GameState(
+            room=self.world.room_ids[room],
+            bag=bag,
+            room_items=room_items,
+            visited=self.initial_state.visited,
+            doors=doors,
+            spoken_to_odette=bool(flags & SPOKEN_TO_ODETTE),
+            escaped=bool(flags & ESCAPED),
+            quit=False,
+        )
+
+    def successors(self, key):
+        """Yield (step, key, problems) for each state one action away; escaped states have none.
+
+        A step is the room the action was taken in and the action. From a
+        corridor region the moves are the ways out of it, from whichever of
+        its rooms they leave.
+        """
+        state = self.state(key)
+        if state.escaped:
+            return
+        engine = self.engine
+        exits = self.exits.get(key[0])
+        if exits is None:
+            steps = [(state, Action(MOVE, direction)) for direction in self.world.rooms[state.room].connections]
+        else:
+            steps = [(state._replace(room=room_id), Action(MOVE, direction)) for room_id, direction in exits]
+        steps.extend((state, Action(PICKUP, item_id)) for item_id in engine.items_in_room(state, state.room)
+                     if item_id in self.slot)
+        steps.extend((state, Action(DROP, item_id)) for item_id in state.bag)
+        steps.extend((state, Action(USE, item_id)) for item_id in state.bag if item_id in self.relevant)
+        room_index = self.world.room_index
+        canon = self.canon
+        for origin, action in steps:
+            following, events = engine.step(origin, action)
+            if following is origin:
+                continue
+            if following.room_items is origin.room_items and following.bag is origin.bag:
+                # Moves and door toggles leave every item where it was, so only the head of the key changes
+                door_bits = key[2] if following.doors is origin.doors else self._door_bits(following.doors)
+                child = (canon[room_index[following.room]], self._flags(following), door_bits) + key[3:]
+                yield (origin.room, action), child, ()
+            else:
+                child, problems = self.key(following)
+                yield (origin.room, action), child, problems
+
+    def can_escape(self, key):
+        """Check whether an escaped state can be reached from a key.
+
+        The search runs over the reduced states themselves and stops at the
+        first state already known to escape. A failed search marks all it
+        reached as trapped, so later checks in that region are lookups.
+        """
+        escapes = self._escapes
+        trapped = self._trapped
+        if key[1] & ESCAPED or key in escapes:
+            return True
+        if key in trapped:
+            return False
+        parents = {key: None}
+        frontier = deque([key])
+        while frontier:
+            current = frontier.popleft()
+            for _, child, _ in self.successors(current):
+                if child in parents or child in trapped:
+                    continue
+                parents[child] = current
+                if child[1] & ESCAPED or child in escapes:
+                    while child is not None:
+                        escapes.add(child)
+                        child = parents[child]
+                    return True
+                frontier.append(child)
+        trapped.update(parents)
+        return False
+
+    def key_locked_away(self, key):
+        """Check whether a key item lies in a room behind a door that is locked."""
+        door_room_bit = self.door_room_bit
+        for item_id, place in zip(self.tracked, key[3:]):
+            if item_id in self.keys and place in door_room_bit and not key[2] & door_room_bit[place]:
+                return True
+        return False
+
+
+class Shard:
+    """The states one worker owns: its part of the visited set and of the frontier."""
+
+    def __init__(self, space, index=0, workers=1):
+        self.space = space
+        self.index = index
+        self.workers = workers
+        self.seen = set()
+        self.frontier = []
+        self.transitions = 0
+        self.locked_away = 0
+
+    def expand(self):
+        """Expand the frontier; return (successor keys per owning worker, violations)."""
+        workers = self.workers
+        buckets = [set() for _ in range(workers)]
+        violations = []
+        for key in self.frontier:
+            for step, child, problems in self.space.successors(key):
+                self.transitions += 1
+                for invariant, message in problems:
+                    violations.append(Violation(invariant, key, step, message))
+                buckets[hash(child) % workers].add(child)
+        self.frontier = []
+        return buckets, violations
+
+    def receive(self, keys):
+        """Take in keys this worker owns; new ones join the frontier. Returns violations."""
+        space = self.space
+        seen = self.seen
+        violations = []
+        for key in keys:
+            if key in seen:
+                continue
+            seen.add(key)
+            self.frontier.append(key)
+            locked_away = space.key_locked_away(key)
+            self.locked_away += locked_away
+            if not space.can_escape(key):
+                if locked_away:
+                    violations.append(Violation("key_dead_end", key, None, "no way out once a key is locked away"))
+                else:
+                    violations.append(Violation("escape_reachable", key, None, "the escape can no longer be reached"))
+        return violations
+
+    def report(self, violations):
+        return len(self.frontier), len(self.seen), self.transitions, self.locked_away, violations
+
+
+def load_engine(world_file=None):
+    """Return the engine for a world file, or the stock engine."""
+    return HauntedMansionGame(world_file=world_file).engine if world_file else stock_engine()
+
+
+def check(world_file=None, workers=1, loose_items=None, max_violations=10, progress=None):
+    """Check every invariant over a world's reachable states and return a CheckResult."""
+    started = time.perf_counter()
+    if workers <= 1:
+        space = StateSpace(load_engine(world_file), loose_items)
+        shard = Shard(space)
+        initial, problems = space.key(space.initial_state)
+        violations = [Violation(invariant, initial, None, message) for invariant, message in problems]
+        violations += shard.receive([initial])
+        depth = 0
+        while shard.frontier and len(violations) < max_violations:
+            buckets, found = shard.expand()
+            violations += found + shard.receive(buckets[0])
+            depth += 1
+            if progress:
+                progress(depth, len(shard.seen), len(shard.frontier))
+        return CheckResult(len(shard.seen), shard.transitions, shard.locked_away,
+                           time.perf_counter() - started, violations[:max_violations])
+
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    pipes = [multiprocessing.Pipe() for _ in range(workers)]
+    processes = [multiprocessing.Process(target=_work, args=(index, workers, world_file, loose_items, inboxes,
+                                                             pipes[index][1]))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        depth = 0
+        while True:
+            reports = [connection.recv() for connection, _ in pipes]
+            frontier = sum(report[0] for report in reports)
+            states = sum(report[1] for report in reports)
+            violations = [violation for report in reports for violation in report[4]]
+            if progress and depth:
+                progress(depth, states, frontier)
+            if not frontier or violations:
+                break
+            for connection, _ in pipes:
+                connection.send("expand")
+            depth += 1
+        for connection, _ in pipes:
+            connection.send("stop")
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    return CheckResult(states, sum(report[2] for report in reports), sum(report[3] for report in reports),
+                       time.perf_counter() - started, violations[:max_violations])
+
+
+def _work(index, workers, world_file, loose_items, inboxes, connection):
+    # One worker process: expand its frontier, route successors to their owners, take in its own
+    space = StateSpace(load_engine(world_file), loose_items)
+    shard = Shard(space, index, workers)
+    initial, problems = space.key(space.initial_state)
+    violations = []
+    if hash(initial) % workers == index:
+        violations = [Violation(invariant, initial, None, message) for invariant, message in problems]
+        violations += shard.receive([initial])
+    connection.send(shard.report(violations))
+    while connection.recv() == "expand":
+        buckets, violations = shard.expand()
+        for other, bucket in enumerate(buckets):
+            if other != index:
+                inboxes[other].put(list(bucket))
+        violations += shard.receive(buckets[index])
+        for _ in range(workers - 1):
+            violations += shard.receive(inboxes[index].get())
+        connection.send(shard.report(violations))
+
+
+def trace(space, target):
+    """Return the steps of a shortest path from the start to a key, or None."""
+    start, _ = space.key(space.initial_state)
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        key = queue.popleft()
+        if key == target:
+            path = []
+            while parents[key] is not None:
+                step, key = parents[key]
+                path.append(step)
+            return path[::-1]
+        for step, child, _ in space.successors(key):
+            if child not in parents:
+                parents[child] = (step, key)
+                queue.append(child)
+    return None
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Check game invariants over every reachable state.")
+    parser.add_argument("--world", metavar="FILE", help="check the world in FILE (.json, .toml or compiled .hmw)")
+    parser.add_argument("--generate", type=int, metavar="ROOMS", help="check a generated mansion with this many rooms")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --generate")
+    parser.add_argument("--doors", type=int, help="locked doors for --generate")
+    parser.add_argument("--trinkets", type=int, help="trinkets for --generate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--loose-items", type=int,
+                        help="items no door or rule refers to that may be picked up (default: enough to overfill the bag)")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress per level")
+    args = parser.parse_args()
+
+    world_file = args.world
+    directory = None
+    if args.generate:
+        from mansiongen import generate
+        directory = tempfile.TemporaryDirectory()
+        world_file = os.path.join(directory.name, "mansion.hmw")
+        generate(args.generate, args.seed, doors=args.doors, trinkets=args.trinkets).write(world_file)
+
+    def progress(depth, states, frontier):
+        print(f"  depth {depth:>4}: {states:>12,} states, {frontier:>10,} new", flush=True)
+
+    try:
+        result = check(world_file, args.workers, args.loose_items, progress=None if args.quiet else progress)
+        print(f"Checked {result.states:,} states and {result.transitions:,} transitions in {result.seconds:.1f} s "
+              f"with {args.workers} worker(s) ({result.states / result.seconds:,.0f} states/s)")
+        failed = {violation.invariant for violation in result.violations}
+        for invariant, description in INVARIANTS.items():
+            note = f"  ({result.locked_away:,} states with a key locked away)" if invariant == "key_dead_end" else ""
+            print(f"  {description:<36} {'FAILED' if invariant in failed else 'ok'}{note}")
+        if result.violations:
+            space = StateSpace(load_engine(world_file), args.loose_items)
+            violation = result.violations[0]
+            print(f"\n{INVARIANTS[violation.invariant]}: {violation.message}")
+            path = trace(space, violation.key)
+            if path is not None:
+                if violation.step is not None:
+                    path.append(violation.step)
+                print("Reached by:")
+                for room_id, action in path:
+                    print(f"  in {room_id}: {action.kind} {action.arg}")
+            sys.exit(1)
+    finally:
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
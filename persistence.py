@@ -0,0 +1,217 @@
+"""
+Save and load for the Haunted Mansion Escape Game.
+
+Each saved game is a compact binary snapshot of the engine state plus an
+append-only journal of the actions played since that snapshot. Saving a
+turn appends a three-byte record to the journal (five bytes in worlds
+with 65,535 or more items or directions); every so many turns the journal
+is folded into a fresh snapshot. Loading reads the snapshot and
+replays the short journal tail through the engine.
+
+Files per saved game, in the store's directory:
+    <slot>.snap     header, player name and StateCodec bytes
+    <slot>.journal  header followed by fixed-size action records
+
+Snapshots and journals carry a generation number. A snapshot is written
+to a temporary file and renamed into place before a new journal is
+started, so a crash in between leaves a journal whose generation no
+longer matches, and that journal is ignored instead of being replayed
+twice.
+"""
+
+import hashlib
+import os
+import re
+import struct
+
+from engine import Action, MOVE, PICKUP, DROP, USE, LOOK, BAG, QUIT
+from statecodec import StateCodec, world_fingerprint
+
+
+SNAPSHOT_HEADER = struct.Struct("<4sIIHI")     # magic, world fingerprint, generation, name and state sizes
+V1_SNAPSHOT_HEADER = struct.Struct("<4sIIHH")  # The same with a 16-bit state size, still read
+JOURNAL_HEADER = struct.Struct("<4sI")         # magic, generation
+RECORD = struct.Struct("<BH")                  # action kind, argument index
+WIDE_RECORD = struct.Struct("<BI")             # The same for worlds whose indices don't fit in 16 bits
+SNAPSHOT_MAGIC = b"HMS2"
+V1_SNAPSHOT_MAGIC = b"HMS1"
+JOURNAL_MAGIC = b"HMJ1"
+
+ACTION_KINDS = (MOVE, PICKUP, DROP, USE, LOOK, BAG, QUIT)
+ITEM_ACTIONS = (PICKUP, DROP, USE)
+
+
+class SaveError(Exception):
+    """Raised when a saved game cannot be read."""
+
+
+class SaveStore:
+    """A directory of saved games for one world."""
+
+    def __init__(self, directory, engine, checkpoint_every=32, fsync=False):
+        self.directory = directory
+        self.engine = engine
+        self.codec = StateCodec(engine.world)
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        world = engine.world
+        self.directions = world.directions
+        self.item_ids = tuple(world.items)
+        self._direction_index = {direction: i for i, direction in enumerate(self.directions)}
+        self._item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self._kind_code = {kind: i for i, kind in enumerate(ACTION_KINDS)}
+        self.fingerprint = world_fingerprint(world)
+        # The all-ones argument means "no argument", so it is never an index
+        self.record = RECORD if max(len(self.item_ids), len(self.directions)) < 0xFFFF else WIDE_RECORD
+        self.no_arg = (1 << 8 * (self.record.size - 1)) - 1
+
+    def slot(self, player_name):
+        """Return the save slot for a player."""
+        return SaveSlot(self, player_name)
+
+    def encode_action(self, action):
+        """Pack an Action into a fixed-size journal record."""
+        if action.arg is None:
+            arg = self.no_arg
+        elif action.kind in ITEM_ACTIONS:
+            arg = self._item_index[action.arg]
+        else:
+            arg = self._direction_index[action.arg]
+        return self.record.pack(self._kind_code[action.kind], arg)
+
+    def decode_action(self, record):
+        """Unpack a journal record back into an Action."""
+        code, arg = self.record.unpack(record)
+        try:
+            kind = ACTION_KINDS[code]
+            if arg == self.no_arg:
+                return Action(kind)
+            return Action(kind, self.item_ids[arg] if kind in ITEM_ACTIONS else self.directions[arg])
+        except IndexError:
+            raise SaveError(f"Journal record {record.hex()} is not an action in this mansion") from None
+
+
+class SaveSlot:
+    """The snapshot and journal of one player's saved game."""
+
+    def __init__(self, store, player_name):
+        self.store = store
+        self.player_name = player_name
+        safe = re.sub(r"[^A-Za-z0-9_-]", "_", player_name)[:40] or "player"
+        if safe != player_name:
+            safe += "-" + hashlib.sha1(player_name.encode()).hexdigest()[:8]
+        base = os.path.join(store.directory, safe)
+        self.snapshot_path = base + ".snap"
+        self.journal_path = base + ".journal"
+        self.generation = 0
+        self.pending = 0  # Journal records since the last snapshot
+        self._journal = None
+
+    def exists(self):
+        """Check whether this player has a saved game."""
+        return os.path.exists(self.snapshot_path)
+
+    def start(self, state):
+        """Begin saving a new game from the given state."""
+        self.generation = 0
+        self.checkpoint(state)
+
+    def load(self):
+        """Read the snapshot, replay the journal and return the saved GameState."""
+        store = self.store
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        header = {SNAPSHOT_MAGIC: SNAPSHOT_HEADER, V1_SNAPSHOT_MAGIC: V1_SNAPSHOT_HEADER}.get(data[:4])
+        if header is None:
+            raise SaveError(f"{self.snapshot_path} is not a saved game")
+        try:
+            magic, fingerprint, generation, name_size, state_size = header.unpack_from(data)
+        except struct.error:
+            raise SaveError(f"{self.snapshot_path} is truncated") from None
+        if fingerprint != store.fingerprint:
+            raise SaveError(f"{self.snapshot_path} was saved for a different mansion")
+        offset = header.size + name_size
+        if state_size != store.codec.byte_length:
+            raise SaveError(f"{self.snapshot_path} holds a state of {state_size} bytes, "
+                            f"not the {store.codec.byte_length} this mansion's states take")
+        if len(data) < offset + state_size:
+            raise SaveError(f"{self.snapshot_path} is truncated")
+        try:
+            state = store.codec.from_bytes(data[offset:offset + state_size])
+        except (IndexError, KeyError):
+            raise SaveError(f"{self.snapshot_path} holds a state that is not possible in this mansion") from None
+
+        self.generation = generation
+        self.pending = 0
+        try:
+            with open(self.journal_path, "rb") as f:
+                journal = f.read()
+        except FileNotFoundError:
+            journal = b""
+        if journal[:JOURNAL_HEADER.size] == JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation):
+            size = store.record.size
+            end = len(journal) - (len(journal) - JOURNAL_HEADER.size) % size  # Drop a torn last record
+            for offset in range(JOURNAL_HEADER.size, end, size):
+                state, events = store.engine.step(state, store.decode_action(journal[offset:offset + size]))
+                self.pending += 1
+            self._open_journal(truncate_to=end)
+        else:
+            self._new_journal()
+        return state
+
+    def record(self, action, state):
+        """Append an action to the journal; fold it into a snapshot when it grows long."""
+        if self._journal is None:
+            raise SaveError("Save slot has not been started or loaded")
+        self._write(self._journal, self.store.encode_action(action))
+        self.pending += 1
+        if self.pending >= self.store.checkpoint_every:
+            self.checkpoint(state)
+
+    def checkpoint(self, state):
+        """Write a new snapshot of state and start an empty journal."""
+        store = self.store
+        name = self.player_name.encode()
+        state_bytes = store.codec.to_bytes(state)
+        self.generation += 1
+        temporary = self.snapshot_path + ".tmp"
+        with open(temporary, "wb") as f:
+            self._write(f, SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, store.fingerprint, self.generation,
+                                                len(name), len(state_bytes)) + name + state_bytes)
+        os.replace(temporary, self.snapshot_path)
+        self._new_journal()
+
+    def close(self):
+        """Close the journal file."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def delete(self):
+        """Remove the saved game."""
+        self.close()
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _new_journal(self):
+        self.close()
+        self.pending = 0
+        self._journal = open(self.journal_path, "wb", buffering=0)
+        self._write(self._journal, JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.generation))
+
+    def _open_journal(self, truncate_to):
+        self.close()
+        self._journal = open(self.journal_path, "r+b", buffering=0)
+        self._journal.truncate(truncate_to)
+        self._journal.seek(truncate_to)
+
+    def _write(self, f, data):
+        f.write(data)
+        if self.store.fsync:
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,92 @@
+"""
+Buffered frame renderer for terminal output.
+
+Game output is collected into a buffer and sent as one write when the
+game next waits for the player (a prompt, a pause or a delay), instead of
+one print call per line. Screens are cleared with ANSI escape sequences
+rather than by spawning a `clear` subprocess.
+
+In diff mode the renderer remembers what the previous frame left on the
+screen. When a new frame starts, lines that are unchanged and still in
+the same place are skipped, changed lines are rewritten in place, and
+everything from the first point where the layouts drift apart is redrawn.
+Redisplaying the same room after "Check bag" or "Look around" then costs
+a few cursor movements instead of a full screen.
+"""
+
+import shutil
+
+CLEAR_SCREEN = "\x1b[2J\x1b[H"
+CLEAR_TO_END_OF_LINE = "\x1b[K"
+CLEAR_TO_END_OF_SCREEN = "\x1b[J"
+
+
+def move_cursor(row, column=1):
+    """Return the escape sequence that moves the cursor (1-based)."""
+    return f"\x1b[{row};{column}H"
+
+
+class FrameRenderer:
+    """Collects output for one screen and turns it into a single string to send."""
+
+    def __init__(self, diff=False, terminal_size=None):
+        self.diff = diff
+        self.terminal_size = terminal_size or shutil.get_terminal_size
+        self._pending = []
+        self._cleared = False
+        self._screen = ""  # Everything shown since the last clear, with prompts and typed input
+
+    def write(self, text=""):
+        """Add a line of output to the current frame."""
+        self._pending.append(text + "\n")
+
+    def clear(self):
+        """Start a new frame."""
+        self._pending.append(CLEAR_SCREEN)
+        self._cleared = True
+
+    def render(self):
+        """Return the text to send for everything written since the last render."""
+        text = "".join(self._pending)
+        self._pending = []
+        if not self._cleared:
+            self._screen += text
+            return text
+
+        self._cleared = False
+        earlier, marker, frame = text.rpartition(CLEAR_SCREEN)
+        previous, self._screen = self._screen, frame
+        if self.diff and previous and not earlier:
+            update = self._diff(previous, frame)
+            if update is not None:
+                return update
+        return earlier + marker + frame
+
+    def record_input(self, prompt, line):
+        """Note the prompt and the line the player typed, as echoed by their terminal."""
+        self._screen += prompt + line + "\n"
+
+    def _diff(self, old, new):
+        columns, rows = self.terminal_size()
+        old_lines = old.split("\n")
+        new_lines = new.split("\n")
+        old_rows = [max(1, -(-len(line) // columns)) for line in old_lines]
+        new_rows = [max(1, -(-len(line) // columns)) for line in new_lines]
+        if sum(old_rows) > rows or sum(new_rows) > rows:
+            return None  # The terminal scrolled, so row positions are unknown
+
+        out = []
+        row = 1
+        last = len(new_lines) - 1
+        for i, line in enumerate(new_lines):
+            if i == last:
+                # Wipe whatever the old frame had from here down; the cursor ends after the line
+                out.append(move_cursor(row) + CLEAR_TO_END_OF_SCREEN + line)
+            elif i >= len(old_lines) or old_rows[i] != new_rows[i]:
+                # The layout drifts apart here, so redraw the rest of the frame
+                out.append(move_cursor(row) + CLEAR_TO_END_OF_SCREEN + "\n".join(new_lines[i:]))
+                break
+            elif line != old_lines[i]:
+                out.append(move_cursor(row) + line + CLEAR_TO_END_OF_LINE)
+            row += new_rows[i]
+        return "".join(out)
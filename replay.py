@@ -0,0 +1,236 @@
+"""
+Deterministic record and replay of game sessions.
+
+While recording, every line a player types is kept, along with a digest
+of everything the game showed and the packed final state. A transcript
+is one JSON line, so a corpus of sessions is a plain .jsonl file. A
+session played in another world than the stock mansion, or with another
+bag size, records the world file and bag size, and is replayed with them.
+
+Replay feeds the recorded lines back into a fresh game in fast-forward:
+delays, screen clears and "Press Enter" pauses are skipped, and because
+the replay I/O never waits, each game runs to completion in a single
+pass without an event loop. The replayed output digest and final state
+are then compared with the recording.
+
+    python main.py --record sessions.jsonl      # record while playing
+    python replay.py sessions.jsonl             # check a corpus against this version
+"""
+
+import argparse
+import hashlib
+import json
+import time
+
+from engine import stock_engine
+from main import HauntedMansionGame, WorldTemplate
+from menus import MenuCache
+from metrics import Metrics
+from statecodec import StateCodec
+from worlddata import DEFAULT_WORLD_FILE, WorldError
+
+
+TRANSCRIPT_VERSION = 1
+CLEAR_MARKER = "\f"
+
+
+class OutputDigest:
+    """Hashes game output: written lines, prompts and screen clears."""
+
+    def __init__(self):
+        self._hash = hashlib.blake2b(digest_size=16)
+
+    def text(self, text):
+        self._hash.update(text.encode())
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class RecordingIO:
+    """Wraps another io object and records the session passing through it."""
+
+    def __init__(self, io):
+        self.io = io
+        self.inputs = []
+        self.digest = OutputDigest()
+
+    def write(self, text=""):
+        self.digest.text(text + "\n")
+        self.io.write(text)
+
+    def flush(self):
+        self.io.flush()
+
+    async def read(self, prompt):
+        self.digest.text(prompt)
+        line = await self.io.read(prompt)
+        self.inputs.append(line)
+        return line
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        self.digest.text(prompt)
+        await self.io.pause(prompt)
+
+    async def delay(self, seconds):
+        await self.io.delay(seconds)
+
+    def clear(self):
+        self.digest.text(CLEAR_MARKER)
+        self.io.clear()
+
+    def transcript(self, game):
+        """Return the recorded session as a JSON-serializable dict."""
+        transcript = {
+            "version": TRANSCRIPT_VERSION,
+            "inputs": self.inputs,
+            "output": self.digest.hexdigest(),
+            "state": StateCodec(game.world).pack(game.state),
+        }
+        world = game.world
+        if world.index.source_path not in (None, DEFAULT_WORLD_FILE):
+            transcript["world"] = world.index.source_path
+        if world.bag_capacity != world.index.bag_capacity:
+            transcript["bag_capacity"] = world.bag_capacity
+        return transcript
+
+
+class ReplayIO:
+    """Feeds recorded input to a game and skips everything that waits."""
+
+    def __init__(self, inputs):
+        self.inputs = iter(inputs)
+        self.digest = OutputDigest()
+
+    def write(self, text=""):
+        self.digest.text(text + "\n")
+
+    def flush(self):
+        pass
+
+    async def read(self, prompt):
+        self.digest.text(prompt)
+        try:
+            return next(self.inputs)
+        except StopIteration:
+            raise EOFError("Transcript ended") from None
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        self.digest.text(prompt)
+
+    async def delay(self, seconds):
+        pass
+
+    def clear(self):
+        self.digest.text(CLEAR_MARKER)
+
+
+def run_to_completion(coroutine):
+    """Run a coroutine that never suspends, without an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("Replay tried to wait on real I/O")
+
+
+class ReplayResult:
+    """Outcome of replaying one transcript."""
+
+    __slots__ = ("ok", "output_matches", "state_matches", "state")
+
+    def __init__(self, output_matches, state_matches, state):
+        self.ok = output_matches and state_matches
+        self.output_matches = output_matches
+        self.state_matches = state_matches
+        self.state = state
+
+
+class Replayer:
+    """Replays transcripts against the current version of the game."""
+
+    def __init__(self, engine=None, metrics=None):
+        self.engine = engine or stock_engine()  # Plays transcripts recorded in the stock mansion
+        self.metrics = metrics
+        self.menus = MenuCache(self.engine.world)
+        self.codec = StateCodec(self.engine.world)
+        self._codecs = {}  # Engine of another world -> its StateCodec
+
+    def replay(self, transcript):
+        """Replay one transcript and compare its output and final state.
+
+        Raises OSError or WorldError if the world file it was recorded in
+        cannot be opened.
+        """
+        engine, menus, codec = self.engine, self.menus, self.codec
+        if "world" in transcript or "bag_capacity" in transcript:
+            template = WorldTemplate.opened(transcript.get("world"), transcript.get("bag_capacity"))
+            engine, menus = template.engine, template.menus
+            codec = self._codecs.get(engine)
+            if codec is None:
+                codec = self._codecs[engine] = StateCodec(engine.world)
+        io = ReplayIO(transcript["inputs"])
+        game = HauntedMansionGame(io=io, engine=engine, menus=menus)
+        if self.metrics is not None:
+            self.metrics.instrument(game)
+        try:
+            run_to_completion(game.start_game())
+        except EOFError:
+            pass  # The player disconnected here when the session was recorded
+        state = codec.pack(game.state)
+        return ReplayResult(io.digest.hexdigest() == transcript["output"],
+                            state == transcript["state"], state)
+
+
+def read_corpus(path):
+    """Yield the transcripts stored in a .jsonl file."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def append_transcript(path, transcript):
+    """Add one transcript to a .jsonl corpus."""
+    with open(path, "a") as f:
+        f.write(json.dumps(transcript, separators=(",", ":")) + "\n")
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and check they still match.")
+    parser.add_argument("corpus", nargs="+", help=".jsonl files of recorded sessions")
+    parser.add_argument("--metrics", metavar="FILE", help="time game handlers during replay and write the figures to FILE")
+    args = parser.parse_args()
+
+    metrics = Metrics() if args.metrics else None
+    replayer = Replayer(metrics=metrics)
+    sessions = mismatches = 0
+    start = time.perf_counter()
+    for path in args.corpus:
+        for number, transcript in enumerate(read_corpus(path), 1):
+            sessions += 1
+            try:
+                result = replayer.replay(transcript)
+            except (OSError, WorldError) as error:
+                mismatches += 1
+                print(f"{path}:{number}: world {transcript.get('world')} could not be opened: {error}")
+                continue
+            if not result.ok:
+                mismatches += 1
+                what = ", ".join(name for name, matches in (("output", result.output_matches),
+                                                            ("final state", result.state_matches))
+                                 if not matches)
+                print(f"{path}:{number}: {what} differs")
+    elapsed = time.perf_counter() - start
+
+    rate = sessions / elapsed if elapsed else 0.0
+    print(f"{sessions} sessions replayed, {mismatches} mismatches, {rate:,.0f} sessions/s")
+    if metrics is not None:
+        metrics.dump(args.metrics)
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
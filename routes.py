@@ -0,0 +1,249 @@
+"""
+Cached shortest routes between rooms.
+
+RouteCache answers "which way to room X?" for one player. Rooms behind a
+locked door cannot be entered, so a route depends on which doors are
+unlocked, but usually on only a few of them. For each starting room the
+cache keeps a breadth-first search table (each reached room's
+predecessor) that is only searched as far as a lookup needs, and later
+lookups resume the same search. Every table remembers the doors it has
+run into. When a door is toggled, only the tables that touched that door
+are dropped; routes elsewhere in the mansion stay cached.
+
+A search for a room that cannot be reached would flood everything the
+player can reach, so lookups first ask a much smaller graph. Rooms are
+grouped into zones that no door splits, and the zones are linked
+through the doors. That map is built once per world, shared by every
+cache on it, and answers "is there any way there?" by visiting about
+as many nodes as there are doors.
+
+Rooms are handled by number, and on worlds compiled to an index the
+search reads exits straight from the index, so lookups on very large
+generated mansions never build Room objects for the rooms they pass.
+
+    routes = RouteCache(engine.world)
+    routes.route(state, "kitchen")     # ["north", "east"], [] if there, None if unreachable
+    routes.distance(state, "kitchen")  # 2
+"""
+
+import weakref
+from array import array
+from collections import deque
+
+
+_zone_maps = weakref.WeakKeyDictionary()  # World -> _ZoneMap, shared by every cache on that world
+
+
+def exit_rows(world):
+    """Return (offsets, targets): the room numbers each room's exits lead to, row by row."""
+    if world.index is not None:
+        return world.index.exit_rows()
+    room_index = world.room_index
+    offsets = array("I", [0])
+    targets = array("I")
+    for room_id in world.room_ids:
+        targets.extend(room_index[to_room] for to_room in world.rooms[room_id].connections.values())
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+def connections_of(world):
+    """Return a function from a room id to its exits, without building Room objects for compiled worlds."""
+    if world.index is not None:
+        return world.index.connections
+    return lambda room_id: world.rooms[room_id].connections
+
+
+class _ZoneMap:
+    """Rooms grouped into zones that no door splits, and the doors between them."""
+
+    def __init__(self, room_count, offsets, targets, door_numbers):
+        # Union-find over every exit between two rooms that are not doors; each door is a zone of its own
+        parents = array("I", range(room_count))
+
+        def find(number):
+            while parents[number] != number:
+                parents[number] = parents[parents[number]]
+                number = parents[number]
+            return number
+
+        door_exits = []
+        for here in range(room_count):
+            here_is_door = here in door_numbers
+            for there in targets[offsets[here]:offsets[here + 1]]:
+                if here_is_door or there in door_numbers:
+                    door_exits.append((here, there))
+                else:
+                    a, b = find(here), find(there)
+                    if a != b:
+                        parents[a] = b
+        self.find = find
+        # Links ignore which way an exit runs, so the map may say yes where there is no way, never the reverse
+        self.links = {}  # Zone -> neighbouring zones
+        for here, there in door_exits:
+            a, b = find(here), find(there)
+            self.links.setdefault(a, set()).add(b)
+            self.links.setdefault(b, set()).add(a)
+
+    def reachable(self, start, door_numbers, is_open):
+        """Return the zones reachable from a zone through open doors."""
+        seen = {start}
+        stack = [start]
+        links = self.links
+        while stack:
+            for zone in links.get(stack.pop(), ()):
+                if zone not in seen and (zone not in door_numbers or zone in is_open):
+                    seen.add(zone)
+                    stack.append(zone)
+        return seen
+
+
+class _RouteTable:
+    """A breadth-first search from one room, extended on demand."""
+
+    __slots__ = ("parents", "queue", "doors", "routes")
+
+    def __init__(self, start):
+        self.parents = {start: start}  # Reached room number -> room number it is reached from
+        self.queue = deque([start])  # Reached rooms whose exits are not expanded yet
+        self.doors = set()  # Door room numbers met so far, open or locked
+        self.routes = {}  # Target room number -> directions, once asked for
+
+
+class RouteCache:
+    """Shortest routes for one player, invalidated door by door."""
+
+    def __init__(self, world, maxsize=64):
+        self.world = world
+        self.maxsize = maxsize
+        self.doors = world.initial_doors  # Unlocked doors the cached tables were built with
+        self._offsets, self._targets = exit_rows(world)
+        self._connections = connections_of(world)
+        room_index = world.room_index
+        self._door_numbers = {room_index[door] for door in world.doors}
+        self._open = {room_index[door] for door in self.doors if door in world.doors}
+        self._tables = {}  # Start room number -> _RouteTable, least recently used first
+        self._reachable = {}  # Start zone -> zones reachable with the doors as they are
+        self._by_door = {}  # Door room number -> start room numbers whose tables touched it
+
+    def toggle_door(self, door):
+        """Forget the routes that depended on a door whose lock just flipped."""
+        number = self.world.room_index[door]
+        self.doors = self.doors ^ {door}
+        self._open ^= {number}
+        self._reachable.clear()
+        for start in self._by_door.pop(number, ()):
+            self._drop(start)
+
+    def sync(self, doors):
+        """Bring the cache in line with a set of unlocked doors."""
+        if doors is self.doors:
+            return
+        for door in self.doors ^ doors:
+            if door in self.world.doors:
+                self.toggle_door(door)
+        self.doors = doors
+
+    def clear(self):
+        """Forget every cached route."""
+        self._tables.clear()
+        self._reachable.clear()
+        self._by_door.clear()
+
+    def route(self, state, to_room):
+        """Return the directions of a shortest route from the player's room, or None."""
+        self.sync(state.doors)
+        room_index = self.world.room_index
+        start = room_index[state.room]
+        target = room_index[to_room]
+        table = self._table(start)
+        directions = table.routes.get(target)
+        if directions is None:
+            path = self._path(start, table, target)
+            if path is None:
+                return None
+            room_ids = self.world.room_ids
+            directions = []
+            for here, there in zip(path, path[1:]):
+                there = room_ids[there]
+                for direction, destination in self._connections(room_ids[here]).items():
+                    if destination == there:
+                        directions.append(direction)
+                        break
+            directions = table.routes[target] = tuple(directions)
+        return list(directions)
+
+    def distance(self, state, to_room):
+        """Return the number of moves from the player's room to to_room, or None."""
+        self.sync(state.doors)
+        room_index = self.world.room_index
+        start = room_index[state.room]
+        path = self._path(start, self._table(start), room_index[to_room])
+        return None if path is None else len(path) - 1
+
+    def _zones(self):
+        zones = _zone_maps.get(self.world)
+        if zones is None:
+            zones = _zone_maps[self.world] = _ZoneMap(len(self.world.room_ids), self._offsets, self._targets,
+                                                      self._door_numbers)
+        return zones
+
+    def _path(self, start, table, target):
+        if target not in table.parents:
+            zones = self._zones()
+            start_zone = zones.find(start)
+            reachable = self._reachable.get(start_zone)
+            if reachable is None:
+                reachable = self._reachable[start_zone] = zones.reachable(start_zone, self._door_numbers,
+                                                                          self._open)
+            if zones.find(target) not in reachable:
+                return None
+            self._search(start, table, target)
+            if target not in table.parents:
+                return None
+        parents = table.parents
+        path = [target]
+        while target != start:
+            target = parents[target]
+            path.append(target)
+        path.reverse()
+        return path
+
+    def _table(self, start):
+        table = self._tables.pop(start, None)
+        if table is None:
+            if len(self._tables) >= self.maxsize:
+                self._drop(next(iter(self._tables)))
+            table = _RouteTable(start)
+        self._tables[start] = table  # Most recently used last
+        return table
+
+    def _drop(self, start):
+        table = self._tables.pop(start, None)
+        if table is not None:
+            for door in table.doors:
+                starts = self._by_door.get(door)
+                if starts is not None:
+                    starts.discard(start)
+
+    def _search(self, start, table, target):
+        parents = table.parents
+        queue = table.queue
+        touched = table.doors
+        offsets = self._offsets
+        targets = self._targets
+        door_numbers = self._door_numbers
+        is_open = self._open
+        while queue and target not in parents:
+            here = queue.popleft()
+            for there in targets[offsets[here]:offsets[here + 1]]:
+                if there in parents:
+                    continue
+                if there in door_numbers:
+                    if there not in touched:
+                        touched.add(there)
+                        self._by_door.setdefault(there, set()).add(start)
+                    if there not in is_open:
+                        continue
+                parents[there] = here
+                queue.append(there)
@@ -0,0 +1,95 @@
+"""
+Item interaction rules.
+
+What happens when an item is used is declared as data rather than code.
+A rule names an item, optionally the room it must be used in, and
+optionally conditions on the game state, and says what happens: lines of
+text, a door to toggle, and whether the item is used up.
+
+    {"item": "portrait", "room": "bedroom",
+     "when": {"spoken_to_odette": true},
+     "text": ["Odette: 'Mon portrait! You found it!'"]}
+
+Conditions test the state's room, bag, unlocked doors and the Odette
+encounter: spoken_to_odette (true/false), has_item, door_unlocked and
+door_locked (an item or door id).
+
+Rules from the world's "rules" list are compiled together with the rules
+its doors and items imply (a key toggles its door from any room next to
+it, an item with an "effect" shows it anywhere) into one table keyed by
+(item, room). Using an item looks up the rules for that room, then the
+rules for anywhere, and fires the first whose conditions hold, so the cost
+of a use does not grow with the number of rules.
+"""
+
+CONDITIONS = {
+    "spoken_to_odette": lambda expected: lambda state: state.spoken_to_odette == expected,
+    "has_item": lambda item_id: lambda state: item_id in state.bag,
+    "door_unlocked": lambda door: lambda state: door in state.doors,
+    "door_locked": lambda door: lambda state: door not in state.doors,
+}
+
+
+class Rule:
+    """One interaction: item, where and when it applies, and what it does."""
+
+    __slots__ = ("number", "item", "room", "when", "text", "toggle_door", "consume", "predicates")
+
+    def __init__(self, number, item, room=None, when=None, text=(), toggle_door=None, consume=False):
+        self.number = number  # Position in RuleTable.rules, carried by the events the rule causes
+        self.item = item
+        self.room = room  # None means any room
+        self.when = dict(when or {})
+        self.text = tuple(text)
+        self.toggle_door = toggle_door
+        self.consume = consume
+        self.predicates = tuple(CONDITIONS[name](value) for name, value in self.when.items())
+
+    def applies(self, state):
+        """Check the rule's conditions against a state."""
+        for predicate in self.predicates:
+            if not predicate(state):
+                return False
+        return True
+
+
+class RuleTable:
+    """Rules compiled into a dispatch table keyed by (item id, room id)."""
+
+    def __init__(self, specs=(), key_doors=None, effects=None):
+        self.rules = []
+        self._table = {}  # (item id, room id or None) -> rules in order of precedence
+        for spec in specs:
+            self.add(spec["item"], spec.get("room"), spec.get("when"), spec.get("text", ()),
+                     spec.get("toggle_door"), spec.get("consume", False))
+        for (room_id, key), door in (key_doors or {}).items():
+            self.add(key, room_id, toggle_door=door)
+        for item_id, text in (effects or {}).items():
+            self.add(item_id, text=text)
+
+    def add(self, item, room=None, when=None, text=(), toggle_door=None, consume=False):
+        """Add a rule after the existing ones and return it."""
+        rule = Rule(len(self.rules), item, room, when, text, toggle_door, consume)
+        self.rules.append(rule)
+        self._table.setdefault((item, room), []).append(rule)
+        return rule
+
+    def match(self, state, item_id):
+        """Return the rule fired by using an item in the state's room, or None."""
+        for key in ((item_id, state.room), (item_id, None)):
+            for rule in self._table.get(key, ()):
+                if rule.applies(state):
+                    return rule
+        return None
+
+    def candidates(self, item_id, room_id):
+        """Return the rules using an item in a room could fire, in order of precedence."""
+        return self._table.get((item_id, room_id), []) + self._table.get((item_id, None), [])
+
+    def doors(self, item_id, room_id):
+        """Return the doors that using an item in a room could toggle."""
+        return {rule.toggle_door for key in ((item_id, room_id), (item_id, None))
+                for rule in self._table.get(key, ()) if rule.toggle_door is not None}
+
+    def __len__(self):
+        return len(self.rules)
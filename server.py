@@ -0,0 +1,226 @@
+"""
+Multi-session TCP server for the Haunted Mansion Escape Game.
+
+Each connection gets its own HauntedMansionGame over one shared engine,
+so a single process can host thousands of players. By default every
+player has a mansion of their own; with --shared they all play in one
+(see sharedworld.py), taking items from and unlocking doors for each
+other. All sessions run on one asyncio thread, so shared actions call
+SharedWorld.step() directly instead of going through a Dispatcher.
+Prompts, "Press Enter" pauses and the movement delay are awaited on the
+connection instead of blocking the process. Any line-based client works:
+
+    python server.py --port 4000
+    telnet localhost 4000
+
+With --hibernate N only the N most recently active games stay in memory;
+the others wait on local disk until their player types again (see
+hibernate.py).
+"""
+
+import argparse
+import asyncio
+
+from analytics import EventLog
+from engine import stock_engine
+from eventbus import GAME_EVENTS, EventBus, open_sink
+from hibernate import SessionManager
+from main import HauntedMansionGame
+from menus import MenuCache
+from metrics import Metrics, MetricsDumper
+from persistence import SaveStore
+from renderer import FrameRenderer
+from replay import RecordingIO, append_transcript
+from sharedworld import SharedWorld
+
+
+class StreamIO:
+    """Game input and output over an asyncio stream connection."""
+
+    def __init__(self, reader, writer, delay_scale=1.0):
+        self.reader = reader
+        self.writer = writer
+        self.delay_scale = delay_scale
+        # The client's screen size is unknown, so frames are buffered but not diffed
+        self.renderer = FrameRenderer()
+
+    def write(self, text=""):
+        """Queue a line of text for the player."""
+        self.renderer.write(text)
+
+    def flush(self, prompt=""):
+        """Send buffered output, followed by an optional prompt, in one write."""
+        output = self.renderer.render() + prompt
+        if output:
+            self.writer.write(output.replace("\n", "\r\n").encode())
+
+    async def read(self, prompt):
+        """Send a prompt and wait for the player's next line."""
+        self.flush(prompt)
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise EOFError("Player disconnected")
+        line = line.decode(errors="replace").rstrip("\r\n")
+        self.renderer.record_input(prompt, line)
+        return line
+
+    async def pause(self, prompt="\nPress Enter to continue..."):
+        """Wait for the player to press Enter."""
+        await self.read(prompt)
+
+    async def delay(self, seconds):
+        """Pause for dramatic effect without holding up other sessions."""
+        self.flush()
+        if self.delay_scale:
+            await asyncio.sleep(seconds * self.delay_scale)
+
+    def clear(self):
+        """Clear the player's terminal with an ANSI escape sequence."""
+        self.renderer.clear()
+
+
+class MansionServer:
+    """Accepts connections and runs one game session per connection."""
+
+    def __init__(self, engine=None, delay_scale=1.0, save_dir=None, record=None, metrics=None, shared=False,
+                 event_log=None, bus=None, hibernate=None, hibernate_file=None):
+        self.engine = engine or stock_engine()
+        self.shared = SharedWorld(self.engine) if shared else None
+        self.menus = MenuCache(self.engine.world)
+        self.saves = SaveStore(save_dir, self.engine) if save_dir else None
+        self.delay_scale = delay_scale
+        self.record = record  # Corpus file that finished sessions are appended to
+        self.metrics = metrics
+        self.event_log = event_log  # EventLog every session writes its actions to, if any
+        self.bus = bus  # EventBus every session publishes its events on, if any
+        # Keeps the games between prompts when hibernating; otherwise each connection keeps its own
+        self.sessions = None
+        if hibernate is not None:
+            self.sessions = SessionManager(self.engine, hibernate, hibernate_file, self.menus, event_log, bus, metrics)
+        self.active_sessions = 0
+        self.total_sessions = 0
+
+    async def handle_connection(self, reader, writer):
+        """Play one game on a new connection."""
+        self.active_sessions += 1
+        self.total_sessions += 1
+        io = StreamIO(reader, writer, self.delay_scale)
+        if self.record:
+            io = RecordingIO(io)
+        game = None
+        if self.sessions is None:
+            game = HauntedMansionGame(io=io, engine=self.engine, menus=self.menus, saves=self.saves,
+                                      shared=self.shared, event_log=self.event_log, bus=self.bus)
+            if self.metrics is not None:
+                self.metrics.instrument(game)
+        try:
+            if game is None:
+                await self.sessions.play(io)
+            else:
+                await game.start_game()
+            await writer.drain()
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            self.active_sessions -= 1
+            if game is not None:
+                game.close()
+            writer.close()
+            if self.record:
+                append_transcript(self.record, io.transcript(game))
+
+    async def serve(self, host="0.0.0.0", port=4000, backlog=4096):
+        """Listen for players until cancelled."""
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=backlog)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Host haunted mansion games over TCP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--delay-scale", type=float, default=1.0,
+                        help="multiplier for in-game pauses such as the delay after moving (0 disables them)")
+    parser.add_argument("--save-dir", help="save every player's progress after each turn in this directory")
+    parser.add_argument("--world", metavar="FILE", help="host the world described in FILE (.json, .toml or compiled .hmw)")
+    parser.add_argument("--shared", action="store_true",
+                        help="put every player in one mansion, sharing its items and doors")
+    parser.add_argument("--record", metavar="FILE", help="append a replayable transcript of every session to FILE")
+    parser.add_argument("--events", metavar="FILE", help="append a line to FILE for every action, for analytics.py")
+    parser.add_argument("--telemetry", metavar="TARGET",
+                        help="stream room, item, door, Odette and escape events to a file or a host:port collector")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time game handlers and write the figures to FILE (Prometheus text if it ends in .prom, else JSON)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="seconds between metrics dumps")
+    parser.add_argument("--hibernate", type=int, metavar="N",
+                        help="keep only the N most recently active games in memory and the rest on disk")
+    parser.add_argument("--hibernate-file", metavar="FILE",
+                        help="file to keep hibernated games in, replaced if it exists (default: a temporary one)")
+    parser.add_argument("--stats-interval", type=float, default=60.0,
+                        help="seconds between session and memory figures when hibernating")
+    args = parser.parse_args()
+    if args.save_dir and args.record:
+        parser.error("--record cannot be combined with --save-dir, since resumed games cannot be replayed")
+    if args.shared and (args.save_dir or args.record):
+        parser.error("--shared cannot be combined with --save-dir or --record, since other players change the game")
+    if args.hibernate is not None and (args.shared or args.save_dir or args.record):
+        parser.error("--hibernate cannot be combined with --shared, --save-dir or --record")
+    if args.hibernate is not None and args.hibernate < 0:
+        parser.error("--hibernate needs a number of games, 0 or more")
+
+    metrics = Metrics() if args.metrics else None
+    engine = HauntedMansionGame(world_file=args.world).engine if args.world else None
+    sink = bus = None
+    if args.telemetry:
+        sink = open_sink(args.telemetry)
+        bus = EventBus()
+        bus.subscribe(GAME_EVENTS, sink)
+    server = MansionServer(engine=engine, delay_scale=args.delay_scale, save_dir=args.save_dir,
+                           record=args.record, metrics=metrics, shared=args.shared,
+                           event_log=EventLog(args.events).start() if args.events else None, bus=bus,
+                           hibernate=args.hibernate, hibernate_file=args.hibernate_file)
+
+    async def report_sessions():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(server.sessions.report(), flush=True)
+
+    async def run():
+        flusher = asyncio.ensure_future(sink.run()) if sink is not None else None
+        reporter = asyncio.ensure_future(report_sessions()) if server.sessions is not None else None
+        dumper = None
+        if metrics is not None:
+            dumper = MetricsDumper(metrics, args.metrics, args.metrics_interval)
+            dumper.start()
+        try:
+            await server.serve(args.host, args.port)
+        finally:
+            if dumper is not None:
+                await dumper.stop()
+            if flusher is not None:
+                flusher.cancel()
+                # A batch still being written must finish before sink.close() writes the rest
+                await asyncio.gather(flusher, return_exceptions=True)
+            if reporter is not None:
+                reporter.cancel()
+
+    print(f"Haunted mansion server listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server.event_log is not None:
+            server.event_log.close()
+        if sink is not None:
+            sink.close()
+        if server.sessions is not None:
+            print(server.sessions.report())
+            server.sessions.close()
+
+
+if __name__ == "__main__":
+    main()
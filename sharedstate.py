@@ -0,0 +1,370 @@
+"""
+Persistent containers for game states.
+
+A GameState is immutable, so keeping one as a snapshot is free, but a
+change used to copy whole fields: picking up an item rebuilt the tuple of
+every room's items, and entering a new room copied the visited set. On a
+mansion with a million rooms that is megabytes per turn.
+
+The containers here share structure instead. An update copies only the
+path from the root to what changed and keeps references to everything
+else, so every older state stays valid and each new state costs memory
+in proportion to its change:
+
+    PVector  fixed-length sequence (room items per room), a 32-way trie;
+             reads and updates touch log32(n) nodes
+    PSet     set (visited rooms, unlocked doors), a hash array mapped trie
+
+Both compare and hash like their plain counterparts (tuple and
+frozenset), and changes() lists what differs between two versions while
+skipping the subtrees they share.
+"""
+
+from collections.abc import Sequence, Set
+from itertools import chain
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_MASK = (1 << 64) - 1
+MAX_SHIFT = 60  # Deeper than this the hash bits run out and keys share a bucket
+
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Before Python 3.10
+    def _popcount(bits):
+        return bin(bits).count("1")
+
+
+class PVector(Sequence):
+    """Immutable fixed-length sequence whose set() shares all untouched nodes."""
+
+    __slots__ = ("_root", "_length", "_shift", "_hash")
+
+    def __init__(self, items=()):
+        items = tuple(items)
+        nodes = [items[i:i + WIDTH] for i in range(0, len(items), WIDTH)] or [()]
+        shift = 0
+        while len(nodes) > 1:
+            nodes = [tuple(nodes[i:i + WIDTH]) for i in range(0, len(nodes), WIDTH)]
+            shift += BITS
+        self._root = nodes[0]
+        self._length = len(items)
+        self._shift = shift
+        self._hash = None
+
+    @classmethod
+    def _make(cls, root, length, shift):
+        vector = cls.__new__(cls)
+        vector._root = root
+        vector._length = length
+        vector._shift = shift
+        vector._hash = None
+        return vector
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("PVector index out of range")
+        node = self._root
+        shift = self._shift
+        while shift:
+            node = node[(index >> shift) & MASK]
+            shift -= BITS
+        return node[index & MASK]
+
+    def set(self, index, value):
+        """Return a vector with one element replaced."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("PVector index out of range")
+        root = _set(self._root, self._shift, index, value)
+        return self if root is self._root else PVector._make(root, self._length, self._shift)
+
+    def __iter__(self):
+        return chain.from_iterable(_leaves(self._root, self._shift))
+
+    def changes(self, other):
+        """Yield the indexes where two vectors of the same length differ."""
+        if self._length != len(other):
+            raise ValueError("Only vectors of the same length can be compared")
+        if isinstance(other, PVector):
+            return _vector_diff(self._root, other._root, self._shift, 0)
+        return (i for i, (a, b) in enumerate(zip(self, other)) if a != b)
+
+    def __eq__(self, other):
+        if isinstance(other, PVector):
+            return self._length == other._length and _same(self._root, other._root, self._shift)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(tuple(self))
+        return self._hash
+
+    def __repr__(self):
+        return f"PVector({list(self)!r})"
+
+
+def _set(node, shift, index, value):
+    slot = (index >> shift) & MASK
+    if shift:
+        child = _set(node[slot], shift - BITS, index, value)
+        if child is node[slot]:
+            return node
+        return node[:slot] + (child,) + node[slot + 1:]
+    if node[slot] is value:
+        return node
+    return node[:slot] + (value,) + node[slot + 1:]
+
+
+def _leaves(node, shift):
+    if not shift:
+        yield node
+        return
+    for child in node:
+        yield from _leaves(child, shift - BITS)
+
+
+def _same(a, b, shift):
+    if a is b:
+        return True
+    if not shift:
+        return a == b
+    return all(_same(x, y, shift - BITS) for x, y in zip(a, b))
+
+
+def _vector_diff(a, b, shift, base):
+    if a is b:
+        return
+    if not shift:
+        for i, (x, y) in enumerate(zip(a, b)):
+            if x is not y and x != y:
+                yield base + i
+        return
+    for i, (x, y) in enumerate(zip(a, b)):
+        yield from _vector_diff(x, y, shift - BITS, base + (i << shift))
+
+
+class _Node:
+    """Trie node: a bitmap of occupied slots and their entries (keys or child nodes)."""
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Bucket:
+    """Keys whose hashes agree in every bit the trie uses."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self, keys):
+        self.keys = keys
+
+
+_EMPTY = _Node(0, ())
+
+
+def _hash(key):
+    return hash(key) & HASH_MASK
+
+
+def _contains(node, h, key, shift):
+    while True:
+        if node.__class__ is _Bucket:
+            return key in node.keys
+        bit = 1 << ((h >> shift) & MASK)
+        bitmap = node.bitmap
+        if not bitmap & bit:
+            return False
+        entry = node.entries[_popcount(bitmap & (bit - 1))]
+        if entry.__class__ is not _Node and entry.__class__ is not _Bucket:
+            return entry == key
+        node = entry
+        shift += BITS
+
+
+def _insert(node, h, key, shift):
+    if isinstance(node, _Bucket):
+        return node if key in node.keys else _Bucket(node.keys + (key,))
+    bit = 1 << ((h >> shift) & MASK)
+    position = _popcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit, entries[:position] + (key,) + entries[position:])
+    entry = entries[position]
+    if isinstance(entry, (_Node, _Bucket)):
+        child = _insert(entry, h, key, shift + BITS)
+        if child is entry:
+            return node
+    elif entry == key:
+        return node
+    else:
+        child = _pair(entry, _hash(entry), key, h, shift + BITS)
+    return _Node(node.bitmap, entries[:position] + (child,) + entries[position + 1:])
+
+
+def _pair(a, a_hash, b, b_hash, shift):
+    if shift > MAX_SHIFT or a_hash == b_hash:
+        return _Bucket((a, b))
+    a_slot = (a_hash >> shift) & MASK
+    b_slot = (b_hash >> shift) & MASK
+    if a_slot == b_slot:
+        return _Node(1 << a_slot, (_pair(a, a_hash, b, b_hash, shift + BITS),))
+    return _Node((1 << a_slot) | (1 << b_slot), (a, b) if a_slot < b_slot else (b, a))
+
+
+def _remove(node, h, key, shift):
+    """Return the node without key: the same node if absent, None if it ends up empty."""
+    if isinstance(node, _Bucket):
+        if key not in node.keys:
+            return node
+        keys = tuple(k for k in node.keys if k != key)
+        return keys[0] if len(keys) == 1 else _Bucket(keys)
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        return node
+    position = _popcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    entry = entries[position]
+    if isinstance(entry, (_Node, _Bucket)):
+        child = _remove(entry, h, key, shift + BITS)
+        if child is entry:
+            return node
+        if isinstance(child, _Node) and len(child.entries) == 1 and not isinstance(child.entries[0],
+                                                                                     (_Node, _Bucket)):
+            child = child.entries[0]  # A lone key moves up to where its hash first differs
+    elif entry == key:
+        child = None
+    else:
+        return node
+    if child is None:
+        if node.bitmap == bit:
+            return None
+        return _Node(node.bitmap & ~bit, entries[:position] + entries[position + 1:])
+    return _Node(node.bitmap, entries[:position] + (child,) + entries[position + 1:])
+
+
+def _keys(entry):
+    if isinstance(entry, _Node):
+        for child in entry.entries:
+            yield from _keys(child)
+    elif isinstance(entry, _Bucket):
+        yield from entry.keys
+    else:
+        yield entry
+
+
+def _only_in(a, b, shift):
+    """Yield the keys under entry a that are missing under entry b, both at the same depth."""
+    if a is b:
+        return
+    if isinstance(a, _Node) and isinstance(b, _Node):
+        position = 0
+        for slot in range(WIDTH):
+            bit = 1 << slot
+            if not a.bitmap & bit:
+                continue
+            entry = a.entries[position]
+            position += 1
+            if b.bitmap & bit:
+                yield from _only_in(entry, b.entries[_popcount(b.bitmap & (bit - 1))], shift + BITS)
+            else:
+                yield from _keys(entry)
+        return
+    if isinstance(b, (_Node, _Bucket)):
+        for key in _keys(a):
+            if not _contains(b, _hash(key), key, shift):
+                yield key
+    else:
+        for key in _keys(a):
+            if key != b:
+                yield key
+
+
+class PSet(Set):
+    """Immutable set whose add() and discard() share all untouched nodes."""
+
+    __slots__ = ("_root", "_size", "_hash")
+
+    def __init__(self, items=()):
+        root = _EMPTY
+        size = 0
+        for item in items:
+            updated = _insert(root, _hash(item), item, 0)
+            if updated is not root:
+                root = updated
+                size += 1
+        self._root = root
+        self._size = size
+        self._hash = None
+
+    @classmethod
+    def _make(cls, root, size):
+        result = cls.__new__(cls)
+        result._root = root
+        result._size = size
+        result._hash = None
+        return result
+
+    @classmethod
+    def _from_iterable(cls, items):
+        return cls(items)
+
+    def add(self, key):
+        """Return a set that also holds key."""
+        h = hash(key) & HASH_MASK
+        if _contains(self._root, h, key, 0):
+            return self
+        return PSet._make(_insert(self._root, h, key, 0), self._size + 1)
+
+    def discard(self, key):
+        """Return a set without key."""
+        root = _remove(self._root, _hash(key), key, 0)
+        if root is self._root:
+            return self
+        return PSet._make(_EMPTY if root is None else root, self._size - 1)
+
+    def toggle(self, key):
+        """Return a set with key added if it was missing and removed if it was there."""
+        return self.discard(key) if key in self else self.add(key)
+
+    def changes(self, other):
+        """Yield the keys in exactly one of two sets."""
+        if not isinstance(other, PSet):
+            return iter(frozenset(self) ^ frozenset(other))
+        return chain(_only_in(self._root, other._root, 0), _only_in(other._root, self._root, 0))
+
+    def __contains__(self, key):
+        return _contains(self._root, hash(key) & HASH_MASK, key, 0)
+
+    def __iter__(self):
+        return _keys(self._root)
+
+    def __len__(self):
+        return self._size
+
+    def __eq__(self, other):
+        if isinstance(other, PSet) and other._root is self._root:
+            return True
+        return Set.__eq__(self, other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self))
+        return self._hash
+
+    def __repr__(self):
+        return f"PSet({sorted(self, key=repr)!r})"
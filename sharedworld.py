@@ -0,0 +1,204 @@
+"""
+One mansion shared by many players at once.
+
+Each player keeps their own room, bag, visited rooms and Odette
+encounter, but the items lying in rooms and the state of the doors
+belong to the mansion: an item one player picks up is gone for
+everyone, and a door one player unlocks is open for everyone.
+
+The engine's rules run unchanged. A player's GameState holds write-
+through views of the shared room items and doors in place of its own
+copies, and SharedWorld.step() takes the locks an action needs before
+the engine runs it:
+
+    pick up, drop   the lock of the player's room
+    use             the lock of every door that item's rules could
+                    toggle from that room, in a fixed order
+    move, look      none; they only read
+
+Room locks are striped (room number modulo the stripe count), so huge
+mansions do not need a lock per room, and doors have a lock each. No
+action holds a room lock and a door lock together, so there is no lock
+order to get wrong.
+
+Dispatcher runs actions on a thread pool. Each player's actions run in
+the order they were submitted and never two at once, while different
+players' actions run in parallel:
+
+    shared = SharedWorld(engine)
+    with Dispatcher(shared, workers=8) as dispatcher:
+        player = dispatcher.join()
+        events = dispatcher.submit(player, Action(MOVE, "north")).result()
+
+server.py --shared calls SharedWorld.step() directly rather than through
+a Dispatcher: its games all run on the one asyncio thread, so their
+actions never contend for the locks, and handing each one to a pool
+thread would only add a thread switch per action.
+"""
+
+import threading
+from collections import deque
+from collections.abc import Sequence, Set
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from engine import DROP, PICKUP, USE
+from sharedstate import PSet
+
+
+class SharedRoomItems(Sequence):
+    """The items in every room, updated in place under the room's lock."""
+
+    __slots__ = ("_rooms",)
+
+    def __init__(self, initial):
+        self._rooms = list(initial)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __getitem__(self, index):
+        return self._rooms[index]
+
+    def set(self, index, items):
+        """Replace a room's items for every player; returns this same view."""
+        self._rooms[index] = items
+        return self
+
+
+class SharedDoors(Set):
+    """The unlocked doors, toggled in place under the door's lock."""
+
+    __slots__ = ("_open", "_version", "_snapshot")
+
+    def __init__(self, unlocked):
+        self._open = set(unlocked)
+        self._version = 0
+        self._snapshot = (0, PSet(self._open))
+
+    def __contains__(self, door):
+        return door in self._open
+
+    def __iter__(self):
+        return iter(list(self._open))
+
+    def __len__(self):
+        return len(self._open)
+
+    def toggle(self, door):
+        """Flip a door's lock for every player; returns this same view."""
+        if door in self._open:
+            self._open.discard(door)
+        else:
+            self._open.add(door)
+        self._version += 1  # Bumped after the change, so a snapshot never outlives it
+        return self
+
+    def snapshot(self):
+        """Return the unlocked doors as a PSet, rebuilt only after a toggle."""
+        version = self._version
+        cached = self._snapshot
+        if cached[0] != version:
+            # set.copy() runs without releasing the GIL, so a toggle on another thread cannot resize it midway
+            cached = self._snapshot = (version, PSet(self._open.copy()))
+        return cached[1]
+
+
+class SharedWorld:
+    """A mansion whose items and doors all players see and change."""
+
+    def __init__(self, engine, stripes=1024):
+        world = engine.world
+        self.engine = engine
+        self.room_items = SharedRoomItems(world.initial_room_items)
+        self.doors = SharedDoors(world.unlocked_doors)
+        self._room_locks = [threading.Lock() for _ in range(max(1, min(stripes, len(world.room_ids))))]
+        self._door_locks = {door: threading.Lock() for door in world.doors}
+        self._use_locks = {}  # (item id, room id) -> door locks its rules may need, in door order
+
+    def join(self):
+        """Return the state of a new player at the start of the shared mansion."""
+        return self.engine.initial_state()._replace(room_items=self.room_items, doors=self.doors)
+
+    def locks_for(self, state, action):
+        """Return the locks an action needs, in the order to take them."""
+        if action.kind in (PICKUP, DROP):
+            room_locks = self._room_locks
+            return (room_locks[self.engine.world.room_index[state.room] % len(room_locks)],)
+        if action.kind == USE:
+            key = (action.arg, state.room)
+            locks = self._use_locks.get(key)
+            if locks is None:
+                doors = sorted(self.engine.world.rules.doors(action.arg, state.room))
+                locks = self._use_locks[key] = tuple(self._door_locks[door] for door in doors)
+            return locks
+        return ()
+
+    def step(self, state, action):
+        """Apply one player's action to the shared mansion and return (new_state, events)."""
+        locks = self.locks_for(state, action)
+        for lock in locks:
+            lock.acquire()
+        try:
+            return self.engine.step(state, action)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class SharedPlayer:
+    """A player's state and the actions waiting to be applied to it."""
+
+    __slots__ = ("state", "_pending", "_lock", "_scheduled")
+
+    def __init__(self, state):
+        self.state = state
+        self._pending = deque()  # (action, future) pairs in submission order
+        self._lock = threading.Lock()
+        self._scheduled = False  # Whether a pool task is working through _pending
+
+
+class Dispatcher:
+    """Runs players' actions on a thread pool, in order for each player."""
+
+    def __init__(self, shared, workers=None):
+        self.shared = shared
+        self.pool = ThreadPoolExecutor(workers)
+
+    def join(self):
+        """Add a player at the start of the mansion."""
+        return SharedPlayer(self.shared.join())
+
+    def submit(self, player, action):
+        """Queue an action for a player; the future gives the events it caused."""
+        future = Future()
+        with player._lock:
+            player._pending.append((action, future))
+            if player._scheduled:
+                return future
+            player._scheduled = True
+        self.pool.submit(self._run, player)
+        return future
+
+    def _run(self, player):
+        while True:
+            with player._lock:
+                if not player._pending:
+                    player._scheduled = False
+                    return
+                action, future = player._pending.popleft()
+            try:
+                player.state, events = self.shared.step(player.state, action)
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(events)
+
+    def close(self):
+        """Finish the queued actions and stop the worker threads."""
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,209 @@
+"""
+Batch simulator for automated playthroughs of the haunted mansion.
+
+Games are split into shards and played headlessly on a ProcessPoolExecutor.
+Each worker drives its games with a policy and sends back a partial
+SimulationStats, which the parent merges as shards finish.
+
+Run from the repository root:
+    python simulate.py --games 100000 --policy random --workers 8
+"""
+
+import argparse
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import stock_engine
+from solver import Solver
+
+
+class RandomPolicy:
+    """Picks uniformly among the legal actions."""
+
+    def __init__(self, engine, seed=None):
+        self.engine = engine
+        self.rng = random.Random(seed)
+
+    def choose(self, state):
+        """Return the next action to play."""
+        return self.rng.choice(self.engine.legal_actions(state))
+
+
+class SolverPolicy:
+    """Always follows a shortest escape route."""
+
+    _solvers = {}  # Shared per engine so every game reuses the same memo tables
+
+    def __init__(self, engine, seed=None):
+        self.engine = engine
+        solver = self._solvers.get(id(engine))
+        if solver is None:
+            solver = self._solvers[id(engine)] = Solver(engine)
+        self.solver = solver
+
+    def choose(self, state):
+        """Return the next action to play."""
+        return self.solver.hint(state)
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "solver": SolverPolicy,
+}
+
+
+def load_policy(name):
+    """Return a policy class from its registered name or a 'module:Class' path."""
+    if name in POLICIES:
+        return POLICIES[name]
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown policy {name!r}; use one of {sorted(POLICIES)} or 'module:Class'")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class SimulationStats:
+    """Aggregated results of a batch of games; partial results merge with merge()."""
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.turns = 0
+        self.turns_to_escape = 0
+        self.min_turns_to_escape = None
+        self.max_turns_to_escape = None
+        self.bag_full_events = 0
+        self.rooms_visited = 0
+
+    def record(self, state, turns, bag_full_events):
+        """Add the outcome of one game."""
+        self.games += 1
+        self.turns += turns
+        self.bag_full_events += bag_full_events
+        self.rooms_visited += len(state.visited)
+        if state.escaped:
+            self.wins += 1
+            self.turns_to_escape += turns
+            if self.min_turns_to_escape is None or turns < self.min_turns_to_escape:
+                self.min_turns_to_escape = turns
+            if self.max_turns_to_escape is None or turns > self.max_turns_to_escape:
+                self.max_turns_to_escape = turns
+
+    def merge(self, other):
+        """Fold another SimulationStats into this one."""
+        self.games += other.games
+        self.wins += other.wins
+        self.turns += other.turns
+        self.turns_to_escape += other.turns_to_escape
+        self.bag_full_events += other.bag_full_events
+        self.rooms_visited += other.rooms_visited
+        for attr, pick in (("min_turns_to_escape", min), ("max_turns_to_escape", max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if theirs is not None:
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+        return self
+
+    @property
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def mean_turns_to_escape(self):
+        return self.turns_to_escape / self.wins if self.wins else None
+
+    @property
+    def mean_rooms_visited(self):
+        return self.rooms_visited / self.games if self.games else 0.0
+
+    def as_dict(self):
+        """Return the headline numbers as a plain dict."""
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "win_rate": self.win_rate,
+            "mean_turns_to_escape": self.mean_turns_to_escape,
+            "min_turns_to_escape": self.min_turns_to_escape,
+            "max_turns_to_escape": self.max_turns_to_escape,
+            "bag_full_events": self.bag_full_events,
+            "mean_rooms_visited": self.mean_rooms_visited,
+        }
+
+
+def play_game(engine, policy, max_turns):
+    """Play one game to the end or max_turns; return (state, turns, bag_full_events)."""
+    state = engine.initial_state()
+    bag_full_events = 0
+    turns = 0
+    while turns < max_turns and not (state.escaped or state.quit):
+        action = policy.choose(state)
+        if action is None:
+            break
+        state, events = engine.step(state, action)
+        turns += 1
+        for event in events:
+            if event.kind == "bag_full":
+                bag_full_events += 1
+    return state, turns, bag_full_events
+
+
+def run_shard(policy_name, first_game, games, seed, max_turns):
+    """Play a contiguous block of games in a worker and return their SimulationStats."""
+    engine = stock_engine()
+    policy_class = load_policy(policy_name)
+    stats = SimulationStats()
+    for game in range(first_game, first_game + games):
+        policy = policy_class(engine, seed + game)
+        stats.record(*play_game(engine, policy, max_turns))
+    return stats
+
+
+def simulate_iter(games, policy="random", workers=None, shard_size=1000, seed=0, max_turns=500):
+    """Run games across a process pool, yielding the running totals as each shard finishes."""
+    totals = SimulationStats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_shard, policy, first, min(shard_size, games - first), seed, max_turns)
+            for first in range(0, games, shard_size)
+        ]
+        for future in as_completed(futures):
+            totals.merge(future.result())
+            yield totals
+
+
+def simulate(games, policy="random", workers=None, shard_size=1000, seed=0, max_turns=500):
+    """Run games across a process pool and return the merged SimulationStats."""
+    totals = SimulationStats()
+    for totals in simulate_iter(games, policy, workers, shard_size, seed, max_turns):
+        pass
+    return totals
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run automated playthroughs of the haunted mansion.")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", default="random", help="random, solver or module:Class")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=500)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = SimulationStats()
+    for stats in simulate_iter(args.games, args.policy, args.workers, args.shard_size,
+                               args.seed, args.max_turns):
+        print(f"\r{stats.games}/{args.games} games, win rate {stats.win_rate:.1%}", end="", flush=True)
+    elapsed = time.perf_counter() - start
+    print()
+
+    for key, value in stats.as_dict().items():
+        print(f"{key:>22}: {value}")
+    print(f"{'games_per_second':>22}: {stats.games / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Shortest-escape solver for the Haunted Mansion Escape Game.
+
+The solver searches a reduced form of the engine's state space: the
+player's room, the bag, where the items that matter lie, which doors are
+unlocked and whether Odette has been met. The items that matter are the
+ones a rule toggles a door with or uses up, and the ones a rule's
+has_item condition asks the player to carry. Rooms the player has
+visited and other items cannot change whether or how fast the player
+escapes, so they are left out, which keeps large generated mansions
+tractable.
+
+Breadth-first search over that graph returns a minimal sequence of engine
+actions. Transitions are memoized per search state, and every state on a
+solved path remembers its next action, so repeated hint requests from the
+same positions are answered without searching again.
+"""
+
+from collections import deque, namedtuple
+
+from engine import Action, MOVE, PICKUP, DROP, USE
+
+
+SearchState = namedtuple("SearchState", [
+    "room",
+    "bag",               # Frozenset of item ids in the bag
+    "items_on_floor",    # Frozenset of (item id, room id) pairs for the items in Solver.items
+    "doors",             # Frozenset of unlocked door ids
+    "spoken_to_odette",
+])
+
+
+class Solver:
+    """Finds minimal action sequences that escape the mansion."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.world = engine.world
+        rules = self.world.rules.rules
+        # Items that open or close a door somewhere
+        self.keys = frozenset(rule.item for rule in rules if rule.toggle_door is not None)
+        # Every item that can change the way out: keys, items used up and items a rule's condition asks for
+        self.items = self.keys | frozenset(rule.item for rule in rules if rule.consume) | frozenset(
+            rule.when["has_item"] for rule in rules if "has_item" in rule.when)
+        self._transitions = {}  # SearchState -> tuple of (Action, SearchState)
+        self._next_action = {}  # SearchState -> (Action, SearchState) on a shortest path
+
+    def search_state(self, state):
+        """Reduce an engine GameState to the state the solver searches over."""
+        items_on_floor = frozenset(
+            (item_id, room_id)
+            for room_id, items in zip(self.world.room_ids, state.room_items)
+            for item_id in items if item_id in self.items
+        )
+        return SearchState(state.room, frozenset(state.bag), items_on_floor,
+                           frozenset(state.doors), state.spoken_to_odette)
+
+    def transitions(self, node):
+        """Return the memoized (action, next node) pairs leaving a search state."""
+        moves = self._transitions.get(node)
+        if moves is None:
+            moves = self._transitions[node] = tuple(self._expand(node))
+        return moves
+
+    def _expand(self, node):
+        engine = self.engine
+        world = self.world
+        for direction, to_room in world.rooms[node.room].connections.items():
+            if engine.is_door_accessible(node, to_room):
+                spoken = node.spoken_to_odette or to_room == world.odette_room
+                yield Action(MOVE, direction), node._replace(room=to_room, spoken_to_odette=spoken)
+
+        bag_full = len(node.bag) >= world.bag_capacity
+        if not bag_full:
+            for item_id, room_id in node.items_on_floor:
+                if room_id == node.room:
+                    yield Action(PICKUP, item_id), node._replace(
+                        bag=node.bag | {item_id}, items_on_floor=node.items_on_floor - {(item_id, room_id)})
+
+        for item_id in node.bag:
+            rule = world.rules.match(node, item_id)
+            if rule is not None and (rule.toggle_door is not None or rule.consume):
+                doors = node.doors if rule.toggle_door is None else node.doors ^ {rule.toggle_door}
+                bag = node.bag - {item_id} if rule.consume else node.bag
+                yield Action(USE, item_id), node._replace(bag=bag, doors=doors)
+            # Dropping only ever helps to make room, so it is only tried with a full bag
+            if bag_full:
+                floor = node.items_on_floor
+                if item_id in self.items:
+                    floor = floor | {(item_id, node.room)}
+                yield Action(DROP, item_id), node._replace(bag=node.bag - {item_id}, items_on_floor=floor)
+
+    def is_goal(self, node):
+        """Check whether a search state satisfies the escape condition."""
+        return self.engine.is_won(node)
+
+    def solve(self, state=None):
+        """Return a minimal list of Actions escaping from state, or None if there is no way out."""
+        if state is None:
+            state = self.engine.initial_state()
+        if state.escaped:
+            return []
+        if state.quit:
+            return None
+
+        start = self.search_state(state)
+        if not (start in self._next_action or self.is_goal(start) or self._search(start)):
+            return None
+        return self._follow(start)
+
+    def hint(self, state):
+        """Return the next Action on a shortest escape route, or None."""
+        path = self.solve(state)
+        return path[0] if path else None
+
+    def is_winnable(self, state=None):
+        """Check whether the escape condition can still be reached."""
+        return self.solve(state) is not None
+
+    def _follow(self, node):
+        path = []
+        while not self.is_goal(node):
+            action, node = self._next_action[node]
+            path.append(action)
+        return path
+
+    def _search(self, start):
+        parents = {start: None}
+        frontier = deque([start])
+        while frontier:
+            node = frontier.popleft()
+            for action, child in self.transitions(node):
+                if child in parents:
+                    continue
+                parents[child] = (action, node)
+                if self.is_goal(child):
+                    self._remember_path(child, parents)
+                    return True
+                frontier.append(child)
+        return False
+
+    def _remember_path(self, node, parents):
+        # Every suffix of a shortest path is itself a shortest path
+        while parents[node] is not None:
+            action, parent = parents[node]
+            self._next_action[parent] = (action, node)
+            node = parent
@@ -0,0 +1,181 @@
+"""
+Compact, hashable encoding of game states.
+
+A ``GameState`` from the engine is packed into a single int laid out as
+(lowest bits first):
+
+    flags | room index | door bits | visited bits | item locations
+
+Each item location is a room index, a bag slot (which keeps the bag in
+pickup order) or "nowhere". Items lying in a room come back in world
+order, so two states that differ only in how a room's items were stacked
+pack to the same code. Packed codes are plain ints, so millions of them
+can be kept in a set or written out as a few bytes each.
+"""
+
+import zlib
+
+from engine import GameState
+from sharedstate import PSet, PVector
+
+
+FLAG_BITS = 3
+SPOKEN_TO_ODETTE = 1
+ESCAPED = 2
+QUIT = 4
+
+
+def world_fingerprint(world):
+    """Return a checksum of everything packed states depend on, to reject states from another world."""
+    return zlib.crc32(repr((world.room_ids, tuple(world.items), world.directions,
+                            sorted(world.doors.items()), world.bag_capacity)).encode())
+
+
+class StateCodec:
+    """Packs and unpacks the states of one world."""
+
+    def __init__(self, world):
+        self.world = world
+        self.room_ids = world.room_ids
+        self.room_index = world.room_index
+        self.item_ids = tuple(world.items)
+        self.door_ids = tuple(world.doors)
+        self.door_bit = {door: 1 << i for i, door in enumerate(self.door_ids)}
+
+        room_count = len(self.room_ids)
+        self.bag_base = room_count  # Location values from here on are bag slots
+        self.nowhere = room_count + world.bag_capacity
+
+        self.room_bits = max(1, (room_count - 1).bit_length())
+        self.door_bits = len(self.door_ids)
+        self.visited_bits = room_count
+        self.location_bits = self.nowhere.bit_length()
+
+        self.room_shift = FLAG_BITS
+        self.door_shift = self.room_shift + self.room_bits
+        self.visited_shift = self.door_shift + self.door_bits
+        self.items_shift = self.visited_shift + self.visited_bits
+        self.total_bits = self.items_shift + self.location_bits * len(self.item_ids)
+        self.byte_length = (self.total_bits + 7) // 8
+
+    def pack(self, state):
+        """Encode a GameState as an int."""
+        room_index = self.room_index
+        location = {}
+        for index, items in enumerate(state.room_items):
+            for item_id in items:
+                location[item_id] = index
+        for slot, item_id in enumerate(state.bag):
+            location[item_id] = self.bag_base + slot
+
+        code = 0
+        for item_id in reversed(self.item_ids):
+            code = (code << self.location_bits) | location.get(item_id, self.nowhere)
+
+        visited = 0
+        for room_id in state.visited:
+            visited |= 1 << room_index[room_id]
+        doors = 0
+        for door in state.doors:
+            doors |= self.door_bit[door]
+        flags = ((SPOKEN_TO_ODETTE if state.spoken_to_odette else 0) |
+                 (ESCAPED if state.escaped else 0) |
+                 (QUIT if state.quit else 0))
+
+        return ((code << self.items_shift) |
+                (visited << self.visited_shift) |
+                (doors << self.door_shift) |
+                (room_index[state.room] << self.room_shift) |
+                flags)
+
+    def unpack(self, code):
+        """Decode an int produced by pack() back into a GameState."""
+        room_ids = self.room_ids
+        room_mask = (1 << self.room_bits) - 1
+        location_mask = (1 << self.location_bits) - 1
+
+        rooms = [[] for _ in room_ids]
+        bag = {}
+        items = code >> self.items_shift
+        for item_id in self.item_ids:
+            location = items & location_mask
+            items >>= self.location_bits
+            if location < self.bag_base:
+                rooms[location].append(item_id)
+            elif location < self.nowhere:
+                bag[location - self.bag_base] = item_id
+
+        visited = code >> self.visited_shift
+        doors = code >> self.door_shift
+        return GameState(
+            room=room_ids[(code >> self.room_shift) & room_mask],
+            bag=tuple(bag[slot] for slot in sorted(bag)),
+            room_items=PVector(tuple(items) for items in rooms),
+            visited=PSet(room_id for i, room_id in enumerate(room_ids) if visited >> i & 1),
+            doors=PSet(door for door in self.door_ids if doors & self.door_bit[door]),
+            spoken_to_odette=bool(code & SPOKEN_TO_ODETTE),
+            escaped=bool(code & ESCAPED),
+            quit=bool(code & QUIT),
+        )
+
+    def unpack_onto(self, code, base, base_code):
+        """Decode code like unpack(), sharing everything it has in common with base, which base_code packs.
+
+        Only the rooms, visited bits and doors that differ are touched, so
+        decoding a chain of neighbouring states, such as an undo history,
+        costs what changed between them rather than the size of the world.
+        """
+        room_ids = self.room_ids
+        location_bits = self.location_bits
+        location_mask = (1 << location_bits) - 1
+        bag_base = self.bag_base
+
+        changed_rooms = set()
+        bag = {}
+        items = code >> self.items_shift
+        base_items = base_code >> self.items_shift
+        for item_id in self.item_ids:
+            location = items & location_mask
+            base_location = base_items & location_mask
+            items >>= location_bits
+            base_items >>= location_bits
+            if location != base_location:
+                changed_rooms.update(place for place in (location, base_location) if place < bag_base)
+            if bag_base <= location < self.nowhere:
+                bag[location - bag_base] = item_id
+        room_items = base.room_items
+        for index in changed_rooms:
+            room_items = room_items.set(index, tuple(
+                item_id for shift, item_id in enumerate(self.item_ids)
+                if code >> (self.items_shift + shift * location_bits) & location_mask == index))
+
+        difference = code ^ base_code
+        visited = base.visited
+        changed = difference >> self.visited_shift & ((1 << self.visited_bits) - 1)
+        while changed:
+            low = changed & -changed
+            visited = visited.toggle(room_ids[low.bit_length() - 1])
+            changed ^= low
+        doors = base.doors
+        for door in self.door_ids:
+            if difference >> self.door_shift & self.door_bit[door]:
+                doors = doors.toggle(door)
+
+        return GameState(
+            room=room_ids[(code >> self.room_shift) & ((1 << self.room_bits) - 1)],
+            bag=tuple(bag[slot] for slot in sorted(bag)),
+            room_items=room_items,
+            visited=visited,
+            doors=doors,
+            spoken_to_odette=bool(code & SPOKEN_TO_ODETTE),
+            escaped=bool(code & ESCAPED),
+            quit=bool(code & QUIT),
+        )
+
+    def to_bytes(self, state):
+        """Encode a GameState as a fixed-size little-endian bytes object."""
+        return self.pack(state).to_bytes(self.byte_length, "little")
+
+    def from_bytes(self, data):
+        """Decode bytes produced by to_bytes() back into a GameState."""
+        return self.unpack(int.from_bytes(data, "little"))
@@ -0,0 +1,444 @@
+"""
+Data-driven worlds for the Haunted Mansion Escape Game.
+
+A world is described in a JSON or TOML file: its rooms with their exits
+and starting items, its items, its locked doors with their keys and
+messages, item interaction rules (see rules.py), and which rooms play
+special parts (start, Odette's room, the exit).
+worlds/haunted_mansion.json holds the stock mansion.
+
+The first time a world file is opened it is compiled into a binary index
+next to it (<name>.hmw). The index is memory-mapped: room ids, exits as
+compressed sparse rows, item placements and key-door pairs are read
+straight from it, while each room's name, description and look text is
+decoded from its own record the first time the room is needed. A world
+with 100k rooms therefore opens in milliseconds and only holds the rooms
+players have reached. The index is rebuilt whenever the source file
+changes.
+
+    python worlddata.py worlds/haunted_mansion.json   # compile ahead of time
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Mapping
+
+from rules import CONDITIONS
+
+
+DEFAULT_WORLD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worlds", "haunted_mansion.json")
+INDEX_SUFFIX = ".hmw"
+
+INDEX_MAGIC = b"HMX1"
+INDEX_VERSION = 1
+# magic, version, byte order, source mtime and size, room count, then (offset, length) per section
+INDEX_HEADER = struct.Struct("<4sHBxQQI")
+SECTION = struct.Struct("<QQ")
+SECTIONS = (
+    "meta",             # JSON: special rooms, bag capacity, items, doors, rules, directions
+    "room_ids",         # Room ids joined by newlines
+    "exit_offsets",     # uint32 per room + 1: where each room's exits start
+    "exit_directions",  # uint8 per exit: index into the directions list
+    "exit_targets",     # uint32 per exit: destination room number
+    "record_offsets",   # uint64 per room + 1: where each room's record starts
+    "records",          # JSON per room: name, description and optional extras
+    "placed_rooms",     # uint32 per starting item placement: room number
+    "placed_items",     # uint32 per starting item placement: item number
+    "key_doors",        # uint32 triples: room number, key item number, door room number
+)
+NATIVE_ORDER = 0 if sys.byteorder == "little" else 1
+
+# Room fields kept in the room's record; exits and items are compiled into arrays
+RECORD_FIELDS = ("name", "description", "unlocked_description", "door_status", "look")
+
+
+class WorldError(Exception):
+    """Raised when a world file is invalid or cannot be read."""
+
+
+def load_world_data(path):
+    """Read a world description from a .json or .toml file."""
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise WorldError("TOML worlds need Python 3.11+ or the tomli package") from None
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _check(data):
+    rooms = data.get("rooms") or {}
+    items = data.get("items") or {}
+    doors = data.get("doors") or {}
+    if not rooms:
+        raise WorldError("World has no rooms")
+    for field in ("start_room", "odette_room", "exit_room"):
+        if data.get(field) not in rooms:
+            raise WorldError(f"{field} {data.get(field)!r} is not a room")
+    names = set()
+    for item_id, item in items.items():
+        name = item.get("name", "").lower()
+        if not name or name in names:
+            raise WorldError(f"Item {item_id!r} needs a unique name")
+        names.add(name)
+    placed = set()
+    for room_id, room in rooms.items():
+        if "\n" in room_id:
+            raise WorldError(f"Room id {room_id!r} contains a newline")
+        for direction, to_room in room.get("exits", {}).items():
+            if to_room not in rooms:
+                raise WorldError(f"Exit {direction} of {room_id!r} leads to unknown room {to_room!r}")
+        for item_id in room.get("items", ()):
+            if item_id not in items:
+                raise WorldError(f"Room {room_id!r} holds unknown item {item_id!r}")
+            if item_id in placed:
+                raise WorldError(f"Item {item_id!r} is placed in more than one room")
+            placed.add(item_id)
+    for door, spec in doors.items():
+        if door not in rooms:
+            raise WorldError(f"Door {door!r} is not a room")
+        if spec.get("key") not in items:
+            raise WorldError(f"Door {door!r} needs a key that is an item")
+        for field in ("locked_text", "hint", "unlock_text", "lock_text"):
+            if field not in spec:
+                raise WorldError(f"Door {door!r} is missing its {field}")
+    for number, rule in enumerate(data.get("rules", ())):
+        if rule.get("item") not in items:
+            raise WorldError(f"Rule {number} needs an item")
+        if "room" in rule and rule["room"] not in rooms:
+            raise WorldError(f"Rule {number} names unknown room {rule['room']!r}")
+        if "toggle_door" in rule and rule["toggle_door"] not in doors:
+            raise WorldError(f"Rule {number} toggles unknown door {rule['toggle_door']!r}")
+        for condition, value in rule.get("when", {}).items():
+            if condition not in CONDITIONS:
+                raise WorldError(f"Rule {number} has unknown condition {condition!r}")
+            if condition == "has_item" and value not in items:
+                raise WorldError(f"Rule {number} tests unknown item {value!r}")
+            if condition.startswith("door_") and value not in doors:
+                raise WorldError(f"Rule {number} tests unknown door {value!r}")
+
+
+def _section(parts, data):
+    """Append a section, padded so every section starts 8-byte aligned."""
+    parts.append(data)
+    padding = -len(data) % 8
+    if padding:
+        parts.append(b"\0" * padding)
+    return len(data), padding
+
+
+def compile_world(data, source_stamp=(0, 0)):
+    """Compile a world description into index bytes."""
+    _check(data)
+    rooms = data["rooms"]
+    items = data.get("items", {})
+    doors = data.get("doors", {})
+    room_ids = list(rooms)
+    room_number = {room_id: i for i, room_id in enumerate(room_ids)}
+    item_number = {item_id: i for i, item_id in enumerate(items)}
+    directions = sorted({direction for room in rooms.values() for direction in room.get("exits", {})})
+    if len(directions) > 255:
+        raise WorldError("A world may use at most 255 exit directions")
+    direction_number = {direction: i for i, direction in enumerate(directions)}
+
+    exit_offsets = array("I", [0])
+    exit_directions = array("B")
+    exit_targets = array("I")
+    record_offsets = array("Q", [0])
+    records = []
+    placed_rooms = array("I")
+    placed_items = array("I")
+    key_doors = array("I")
+    size = 0
+    for number, (room_id, room) in enumerate(rooms.items()):
+        for direction, to_room in room.get("exits", {}).items():
+            exit_directions.append(direction_number[direction])
+            exit_targets.append(room_number[to_room])
+            if to_room in doors:
+                key_doors.extend((number, item_number[doors[to_room]["key"]], room_number[to_room]))
+        exit_offsets.append(len(exit_targets))
+        for item_id in room.get("items", ()):
+            placed_rooms.append(number)
+            placed_items.append(item_number[item_id])
+        record = json.dumps({field: room[field] for field in RECORD_FIELDS if field in room},
+                            ensure_ascii=False, separators=(",", ":")).encode()
+        records.append(record)
+        size += len(record)
+        record_offsets.append(size)
+
+    meta = {
+        "start_room": data["start_room"],
+        "odette_room": data["odette_room"],
+        "exit_room": data["exit_room"],
+        "bag_capacity": data.get("bag_capacity", 4),
+        "default_look": data.get("default_look", []),
+        "items": items,
+        "doors": doors,
+        "rules": data.get("rules", []),
+        "directions": directions,
+    }
+    return build_index(meta, room_ids, exit_offsets, exit_directions, exit_targets, record_offsets,
+                       b"".join(records), placed_rooms, placed_items, key_doors, source_stamp)
+
+
+def build_index(meta, room_ids, exit_offsets, exit_directions, exit_targets, record_offsets, records,
+                placed_rooms, placed_items, key_doors, source_stamp=(0, 0)):
+    """Lay out already compiled world arrays as index bytes.
+
+    The arrays are array.array objects in the layout SECTIONS describes;
+    generators that build them directly can skip the JSON description.
+    """
+    sections = [
+        json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode(),
+        "\n".join(room_ids).encode(),
+        exit_offsets.tobytes(),
+        exit_directions.tobytes(),
+        exit_targets.tobytes(),
+        record_offsets.tobytes(),
+        records,
+        placed_rooms.tobytes(),
+        placed_items.tobytes(),
+        key_doors.tobytes(),
+    ]
+
+    header_size = INDEX_HEADER.size + SECTION.size * len(SECTIONS)
+    header_size += -header_size % 8
+    parts = []
+    table = []
+    offset = header_size
+    for section in sections:
+        length, padding = _section(parts, section)
+        table.append(SECTION.pack(offset, length))
+        offset += length + padding
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, NATIVE_ORDER, source_stamp[0], source_stamp[1],
+                               len(room_ids)) + b"".join(table)
+    return header + b"\0" * (header_size - len(header)) + b"".join(parts)
+
+
+class WorldIndex:
+    """Read-only view of a compiled world, decoding rooms on demand."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        try:
+            magic, version, order, mtime, size, room_count = INDEX_HEADER.unpack_from(buffer)
+        except struct.error:
+            raise WorldError("World index is truncated") from None
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or order != NATIVE_ORDER:
+            raise WorldError("World index was built by a different version or machine")
+        self.source_stamp = (mtime, size)
+        self.source_path = None  # World file the index was opened for, set by open_world()
+        sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(buffer, INDEX_HEADER.size + i * SECTION.size)
+            sections[name] = view[offset:offset + length]
+
+        meta = json.loads(bytes(sections["meta"]))
+        self.start_room = meta["start_room"]
+        self.odette_room = meta["odette_room"]
+        self.exit_room = meta["exit_room"]
+        self.bag_capacity = meta["bag_capacity"]
+        self.default_look = meta["default_look"]
+        self.items = meta["items"]  # Item id -> item description
+        self.doors = meta["doors"]  # Door (room id behind it) -> key and messages
+        self.rules = meta.get("rules", [])  # Declared item interactions, see rules.py
+        self.directions = tuple(meta["directions"])
+        self.effects = {item_id: item["effect"] for item_id, item in self.items.items() if "effect" in item}
+        self.effect_items = tuple(self.effects)
+
+        self.room_ids = tuple(str(sections["room_ids"], "utf-8").split("\n")) if room_count else ()
+        self.room_index = dict(zip(self.room_ids, range(len(self.room_ids))))
+        self._exit_offsets = sections["exit_offsets"].cast("I")
+        self._exit_directions = sections["exit_directions"]
+        self._exit_targets = sections["exit_targets"].cast("I")
+        self._record_offsets = sections["record_offsets"].cast("Q")
+        self._records = sections["records"]
+        self._records_loaded = {}
+
+        item_ids = tuple(self.items)
+        room_items = [()] * room_count
+        for room, item in zip(sections["placed_rooms"].cast("I"), sections["placed_items"].cast("I")):
+            room_items[room] += (item_ids[item],)
+        self.initial_room_items = tuple(room_items)
+        triples = sections["key_doors"].cast("I")
+        self.key_doors = {
+            (self.room_ids[triples[i]], item_ids[triples[i + 1]]): self.room_ids[triples[i + 2]]
+            for i in range(0, len(triples), 3)
+        }
+
+    def connections(self, room_id):
+        """Return a room's exits as a direction -> room id dict."""
+        number = self.room_index[room_id]
+        start, end = self._exit_offsets[number], self._exit_offsets[number + 1]
+        room_ids = self.room_ids
+        directions = self.directions
+        return {directions[self._exit_directions[i]]: room_ids[self._exit_targets[i]] for i in range(start, end)}
+
+    def exit_rows(self):
+        """Return (offsets, targets): room i's exits lead to targets[offsets[i]:offsets[i + 1]]."""
+        return self._exit_offsets, self._exit_targets
+
+    def room_record(self, room_id):
+        """Return a room's name, description and extras, decoding it on first use."""
+        record = self._records_loaded.get(room_id)
+        if record is None:
+            number = self.room_index[room_id]
+            start, end = self._record_offsets[number], self._record_offsets[number + 1]
+            record = self._records_loaded[room_id] = json.loads(bytes(self._records[start:end]))
+        return record
+
+
+class LazyRooms(Mapping):
+    """Room id -> Room mapping that builds each Room the first time it is looked up."""
+
+    def __init__(self, index, build_room):
+        self.index = index
+        self.build_room = build_room
+        self.loaded = {}  # Rooms built so far
+
+    def __getitem__(self, room_id):
+        room = self.loaded.get(room_id)
+        if room is None:
+            if room_id not in self.index.room_index:
+                raise KeyError(room_id)
+            room = self.loaded[room_id] = self.build_room(room_id)
+        return room
+
+    def __contains__(self, room_id):
+        return room_id in self.index.room_index
+
+    def __iter__(self):
+        return iter(self.index.room_ids)
+
+    def __len__(self):
+        return len(self.index.room_ids)
+
+
+class SessionRooms(Mapping):
+    """One game's view of shared rooms: each room is the shared one until the game changes it.
+
+    The shared rooms are never changed. A game that needs to change a
+    room asks for its own copy with own(), which later lookups return.
+    """
+
+    def __init__(self, rooms):
+        self.rooms = rooms  # Shared room id -> Room
+        self.loaded = {}  # Rooms this game has its own copy of
+
+    def __getitem__(self, room_id):
+        room = self.loaded.get(room_id)
+        return room if room is not None else self.rooms[room_id]
+
+    def own(self, room_id):
+        """Return this game's own copy of a room, copying the shared one the first time."""
+        room = self.loaded.get(room_id)
+        if room is None:
+            room = self.loaded[room_id] = self.rooms[room_id].copy()
+        return room
+
+    def __contains__(self, room_id):
+        return room_id in self.rooms
+
+    def __iter__(self):
+        return iter(self.rooms)
+
+    def __len__(self):
+        return len(self.rooms)
+
+
+def index_path_for(path):
+    """Return where the compiled index of a world file is kept."""
+    return os.path.splitext(path)[0] + INDEX_SUFFIX
+
+
+def compile_file(path, index_path=None):
+    """Compile a world file into its index file and return the index path."""
+    index_path = index_path or index_path_for(path)
+    stat = os.stat(path)
+    data = compile_world(load_world_data(path), (stat.st_mtime_ns, stat.st_size))
+    temporary = index_path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, index_path)
+    return index_path
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+_opened = {}  # Path -> WorldIndex, shared by every game opening the same world
+
+
+def open_world(path=None):
+    """Open a world file, compiling it into an index first if needed.
+
+    Index files (.hmw) are opened directly. For a .json or .toml file the
+    index beside it is used while it matches the file, and rebuilt when
+    it does not; if it cannot be written, the world is compiled in memory.
+    Opened worlds are cached, so later games share the same index.
+    """
+    path = os.path.abspath(path or DEFAULT_WORLD_FILE)
+    if path.endswith(INDEX_SUFFIX):
+        index = _opened.get(path)
+        if index is None:
+            index = _opened[path] = WorldIndex(_map(path))
+            index.source_path = path
+        return index
+
+    stat = os.stat(path)
+    index = _opened.get(path)
+    if index is None or index.source_stamp != (stat.st_mtime_ns, stat.st_size):
+        index = _opened[path] = _open_source(path, stat)
+        index.source_path = path
+    return index
+
+
+def _open_source(path, stat):
+    index_path = index_path_for(path)
+    try:
+        index = WorldIndex(_map(index_path))
+        if index.source_stamp == (stat.st_mtime_ns, stat.st_size):
+            return index
+    except (OSError, ValueError, WorldError):
+        pass  # Missing, empty or stale
+    try:
+        return WorldIndex(_map(compile_file(path, index_path)))
+    except OSError:
+        return WorldIndex(compile_world(load_world_data(path), (stat.st_mtime_ns, stat.st_size)))
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Compile a world file into a binary index.")
+    parser.add_argument("world", help=".json or .toml world description")
+    parser.add_argument("-o", "--output", help="index file to write (default: beside the world file)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index_path = compile_file(args.world, args.output)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    index = WorldIndex(_map(index_path))
+    opened = time.perf_counter() - start
+    print(f"{index_path}: {len(index.room_ids):,} rooms, {len(index.items):,} items, {len(index.doors):,} doors, "
+          f"{os.path.getsize(index_path):,} bytes")
+    print(f"compiled in {compiled * 1000:.1f} ms, opens in {opened * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()